@@ -0,0 +1,112 @@
+# Description - Lazily created algod client and shared helpers for the Dex and stokvel libraries
+# Nothing here talks to the network, and the SDK is not imported, until the first call that needs a client.
+# Importing dex_core or stokvel_core is therefore instant and side-effect free. A service, benchmark or test can
+# call configure() first to point every helper at its own algod client, e.g. another node or an in-process ledger.
+# The client and the confirmation watcher are wrapped so every request and confirmation is recorded in metrics.
+# The signer that holds derived keys is shared too, and survives configure() since it does not depend on the client.
+
+import threading
+
+import metrics
+
+# Requests are spread across these nodes, with keep-alive connections and failover to the next node when one is slow or down
+algod_addresses = ["https://testnet-api.algonode.cloud", "https://testnet-api.4160.nodely.dev"]
+algod_token = ""
+
+# Name, unit name and decimals of each asset are kept on disk between runs in this file; None keeps them in memory only
+asset_metadata_path = "asset_metadata_cache.json"
+
+_algod_client = None  # the client passed to configure(), if any
+_instrumented_client = None
+_params_cache = None
+_confirmation_watcher = None
+_opt_in_index = None
+_asset_metadata = None
+_signer = None
+_lock = threading.RLock()
+
+
+def configure(algod_client=None, addresses=None, token=None, metadata_path=False):
+    """Replace the shared client and drop every helper built on the old one.
+
+    Pass algod_client to use an existing client, or addresses and token to have one created lazily for them.
+    metadata_path changes where asset metadata is kept on disk (None for memory only); False leaves it unchanged.
+    """
+    global algod_addresses, algod_token, asset_metadata_path
+    global _algod_client, _instrumented_client, _params_cache, _confirmation_watcher, _opt_in_index, _asset_metadata
+    with _lock:
+        if addresses is not None:
+            algod_addresses = list(addresses)
+        if token is not None:
+            algod_token = token
+        if metadata_path is not False:
+            asset_metadata_path = metadata_path
+        _algod_client = algod_client
+        _instrumented_client = None
+        _params_cache = None
+        _confirmation_watcher = None
+        _opt_in_index = None
+        _asset_metadata = None
+
+
+def get_algod_client():
+    """Return the shared algod client, creating the node pool on first use."""
+    global _algod_client, _instrumented_client
+    with _lock:
+        if _instrumented_client is None:
+            if _algod_client is None:
+                from algod_pool import AlgodClientPool
+                _algod_client = AlgodClientPool(algod_token, algod_addresses)
+            _instrumented_client = metrics.InstrumentedAlgod(_algod_client, metrics.registry)
+        return _instrumented_client
+
+
+def get_params_cache():
+    """Return the suggested parameters cache shared by every transaction builder."""
+    global _params_cache
+    with _lock:
+        if _params_cache is None:
+            from params_cache import SuggestedParamsCache
+            _params_cache = SuggestedParamsCache(get_algod_client())
+        return _params_cache
+
+
+def get_confirmation_watcher():
+    """Return the single block-following watcher that confirms every pending transaction."""
+    global _confirmation_watcher
+    with _lock:
+        if _confirmation_watcher is None:
+            from confirmation_watcher import ConfirmationWatcher
+            watcher = ConfirmationWatcher(get_algod_client(), on_round=get_params_cache().observe_round)
+            _confirmation_watcher = metrics.InstrumentedWatcher(watcher, metrics.registry)
+        return _confirmation_watcher
+
+
+def get_opt_in_index():
+    """Return the index of (address, asset id) pairs known to be opted in."""
+    global _opt_in_index
+    with _lock:
+        if _opt_in_index is None:
+            from asset_cache import OptInIndex
+            _opt_in_index = OptInIndex(get_algod_client())
+        return _opt_in_index
+
+
+def get_signer():
+    """Return the signer that derives each key once and signs every transaction."""
+    global _signer
+    with _lock:
+        if _signer is None:
+            from signer import Signer
+            _signer = Signer()
+        return _signer
+
+
+def get_asset_metadata():
+    """Return the cache of asset names, unit names and decimals."""
+    global _asset_metadata
+    with _lock:
+        if _asset_metadata is None:
+            from asset_cache import AssetMetadataCache
+            _asset_metadata = AssetMetadataCache(get_algod_client(), path=asset_metadata_path)
+        return _asset_metadata
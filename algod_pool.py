@@ -0,0 +1,261 @@
+# Description - Pooled, multi-endpoint algod client with keep-alive connections and failover
+# AlgodClientPool is a drop-in replacement for algod.AlgodClient. Every request goes to the configured node with the
+# lowest recent latency that still has spare capacity. Connections to each node are kept alive and reused, and a
+# request that fails because a node is down, overloaded or erroring is retried on another node. A kept-alive
+# connection that the node has meanwhile closed is replaced by a new one to the same node without counting as a
+# failure. A retried transaction submission that finds its transactions already in the ledger counts as sent, not as
+# rejected.
+
+import http.client
+import json
+import threading
+import time
+from collections import deque
+from urllib import parse
+
+import msgpack
+from algosdk import constants, encoding, error
+from algosdk.v2client import algod
+
+# Long-polling calls wait for the next block on purpose, so they are not counted towards a node's latency
+LONG_POLL_PATHS = ("/status/wait-for-block-after/",)
+
+# Responses that mean "try another node" rather than "the request itself is wrong"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Transactions are submitted by a POST to this path
+SUBMIT_PATH = "/transactions"
+
+# algod's rejection of a transaction it already has
+ALREADY_IN_LEDGER = "transaction already in ledger"
+
+
+class _Endpoint:
+    def __init__(self, address, max_concurrent):
+        url = parse.urlsplit(address)
+        self.address = address
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.max_concurrent = max_concurrent
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.idle = deque()  # keep-alive connections that are ready for reuse
+        self.latency = None  # exponentially weighted moving average, in seconds
+        self.in_flight = 0  # requests sent to or queued for this node
+        self.down_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def score(self):
+        # Prefer fast nodes, but spread load by penalising nodes that already have requests in flight
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + self.in_flight)
+
+    def connection(self, timeout):
+        # Returns (connection, reused): an idle keep-alive connection if there is one, otherwise a new one
+        try:
+            conn = self.idle.pop()
+        except IndexError:
+            return self.new_connection(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def new_connection(self, timeout):
+        conn_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return conn_class(self.host, self.port, timeout=timeout)
+
+
+class AlgodClientPool(algod.AlgodClient):
+    def __init__(self, algod_token, algod_addresses, headers=None, max_concurrent_per_endpoint=8, max_attempts=3, failure_cooldown=5.0, latency_smoothing=0.2):
+        """Create a client that spreads requests across algod_addresses.
+
+        At most max_concurrent_per_endpoint requests run against one node at a time. A request is tried on up to
+        max_attempts different nodes, and a node that fails is skipped for failure_cooldown seconds.
+        latency_smoothing is the weight of the newest sample in each node's moving-average latency.
+        """
+        if isinstance(algod_addresses, str):
+            algod_addresses = [algod_addresses]
+        if not algod_addresses:
+            raise ValueError("At least one algod address is required")
+        super().__init__(algod_token, algod_addresses[0], headers)
+        self.endpoints = [_Endpoint(address, max_concurrent_per_endpoint) for address in algod_addresses]
+        self.max_attempts = max_attempts
+        self.failure_cooldown = failure_cooldown
+        self.latency_smoothing = latency_smoothing
+        self._lock = threading.Lock()
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json", timeout=30):
+        """Execute a request against the best available node, failing over to other nodes on connection or server errors."""
+        header = {"User-Agent": "py-algorand-sdk"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth:
+            header.update({constants.algod_auth_header: self.algod_token})
+
+        long_poll = requrl.startswith(LONG_POLL_PATHS)
+        submission = method.upper() == "POST" and requrl == SUBMIT_PATH
+        if requrl not in constants.unversioned_paths:
+            requrl = algod.api_version_path_prefix + requrl
+        if params:
+            requrl = requrl + "?" + parse.urlencode(params)
+
+        tried = []
+        last_error = None
+        for _ in range(min(self.max_attempts, len(self.endpoints))):
+            endpoint = self._select(tried)
+            tried.append(endpoint)
+            try:
+                status, body = self._send(endpoint, method, requrl, data, header, timeout, long_poll)
+            except (OSError, http.client.HTTPException) as e:
+                self._mark_failed(endpoint)
+                last_error = error.AlgodHTTPError(f"Request to {endpoint.address} failed: {e}")
+                continue
+
+            if status in RETRYABLE_STATUS:
+                self._mark_failed(endpoint)
+                last_error = self._http_error(status, body)
+                continue
+            if status >= 400:
+                http_error = self._http_error(status, body)
+                if submission and len(tried) > 1:
+                    # A node that failed part way through a submission may still have passed the transactions on to
+                    # the network. If the retry finds them already there, the submission succeeded after all.
+                    txids = _submitted_txids(data)
+                    if ALREADY_IN_LEDGER in str(http_error) and any(txid in str(http_error) for txid in txids):
+                        return {"txId": txids[0]}
+                # The node understood the request and rejected it, so another node would do the same
+                raise http_error
+            return self._parse(body, response_format)
+
+        raise last_error
+
+    def endpoint_stats(self):
+        """Return the request count, failure count, moving-average latency and in-flight count of each node."""
+        with self._lock:
+            return [
+                {
+                    "address": endpoint.address,
+                    "requests": endpoint.requests,
+                    "failures": endpoint.failures,
+                    "latency": endpoint.latency,
+                    "in_flight": endpoint.in_flight,
+                    "healthy": endpoint.down_until <= time.monotonic(),
+                }
+                for endpoint in self.endpoints
+            ]
+
+    def close(self):
+        """Close every idle keep-alive connection."""
+        for endpoint in self.endpoints:
+            while endpoint.idle:
+                endpoint.idle.pop().close()
+
+    def _select(self, tried):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+            healthy = [endpoint for endpoint in candidates if endpoint.down_until <= now]
+            if not healthy:
+                # If every remaining node is cooling down, try the one that failed longest ago rather than giving up
+                endpoint = min(candidates, key=lambda endpoint: endpoint.down_until)
+            else:
+                # Prefer nodes with a free slot, and only queue behind a busy node when all of them are busy
+                free = [endpoint for endpoint in healthy if endpoint.in_flight < endpoint.max_concurrent]
+                endpoint = min(free or healthy, key=lambda endpoint: endpoint.score())
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _send(self, endpoint, method, requrl, data, header, timeout, long_poll):
+        # _select has already counted this request as in flight on the node
+        try:
+            with endpoint.slots:
+                with self._lock:
+                    conn, reused = endpoint.connection(timeout)
+                started = time.monotonic()
+                try:
+                    response = _exchange(conn, method, endpoint.base_path + requrl, data, header)
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+                    if not (reused and isinstance(e, ConnectionError)):
+                        raise
+                    # The node closed the idle connection before any reply came back, which says nothing about its
+                    # health: send the request once more on a new connection
+                    conn = endpoint.new_connection(timeout)
+                    started = time.monotonic()
+                    try:
+                        response = _exchange(conn, method, endpoint.base_path + requrl, data, header)
+                    except (OSError, http.client.HTTPException):
+                        conn.close()
+                        raise
+                try:
+                    body = response.read()
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    raise
+                elapsed = time.monotonic() - started
+        finally:
+            with self._lock:
+                endpoint.in_flight -= 1
+
+        with self._lock:
+            if response.will_close:
+                conn.close()
+            else:
+                endpoint.idle.append(conn)
+            if not long_poll:
+                if endpoint.latency is None:
+                    endpoint.latency = elapsed
+                else:
+                    endpoint.latency += self.latency_smoothing * (elapsed - endpoint.latency)
+        return response.status, body
+
+    def _mark_failed(self, endpoint):
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.down_until = time.monotonic() + self.failure_cooldown
+            # Connections to a failing node are not worth keeping
+            while endpoint.idle:
+                endpoint.idle.pop().close()
+
+    @staticmethod
+    def _http_error(status, body):
+        message = body.decode("utf-8", errors="replace")
+        data = None
+        try:
+            j = json.loads(message)
+            message = j["message"]
+            data = j.get("data")
+        except (ValueError, KeyError, TypeError):
+            pass
+        return error.AlgodHTTPError(message, status, data)
+
+    @staticmethod
+    def _parse(body, response_format):
+        if response_format != "json":
+            return body
+        if not body:
+            # Some algod responses return 200 OK with an empty body
+            return {}
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise error.AlgodResponseError("Failed to parse JSON response from algod") from e
+
+
+def _exchange(conn, method, url, data, header):
+    # Send one request and wait for the status line and headers of the reply
+    conn.request(method, url, body=data, headers=header)
+    return conn.getresponse()
+
+
+def _submitted_txids(data):
+    # IDs of the signed transactions in the raw body of a submission, in order
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(data)
+    return [encoding.msgpack_decode(signed_txn).get_txid() for signed_txn in unpacker]
@@ -0,0 +1,177 @@
+# Description - Constant-product (x * y = k) pricing engine for the UCTZAR/Algo pool of the Dex
+# PoolState tracks the Algo and UCTZAR reserves and the supply of DEX tokens (the pool's liquidity-provider shares).
+# Quotes are pure, in-memory calculations, so pricing a trade is a cheap local call and not a chain round trip.
+# A trade, stake or withdrawal is applied to the pool state when it is priced, so the next one is priced on the
+# reserves it will settle against, and reverted if its transactions do not settle.
+# Amounts are integers: MicroAlgos for Algo and base units for UCTZAR and DEX tokens.
+
+from dataclasses import dataclass
+from fractions import Fraction
+
+MICROALGOS_PER_ALGO = 1000000
+
+# Rate used to price the first deposit into an empty pool: 2 UCTZAR per Algo, as the Dex charged before the pool existed
+INITIAL_UCTZAR_PER_ALGO = 2
+
+
+class PoolError(ValueError):
+    """Raised when a trade cannot be priced, e.g. the pool lacks liquidity or the slippage limit is exceeded."""
+
+
+@dataclass(frozen=True)
+class Quote:
+    side: str  # "algo" when buying Algos with UCTZAR, "uctzar" when buying UCTZAR with Algos
+    amount_in: int  # paid into the pool by the buyer
+    amount_out: int  # paid out of the pool to the buyer
+    fee: int  # MicroAlgos charged on top and distributed to the stakers
+    price_impact: float  # how much worse than the spot price the trade executes before rounding, e.g. 0.01 for 1%
+    pool_version: int  # version of the pool state the quote was computed from
+
+
+@dataclass(frozen=True)
+class PoolChange:
+    # A change applied to the pool before its transactions are confirmed, kept so it can be reverted
+    algo: int = 0  # added to the Algo reserve
+    uctzar: int = 0  # added to the UCTZAR reserve
+    dex_tokens: int = 0  # added to the DEX token supply
+
+
+def _ceil_div(numerator, denominator):
+    return -(-numerator // denominator)
+
+
+def _price_impact(amount_out, reserve_out):
+    # The unrounded amount in over its value at the spot price is reserve_out / (reserve_out - amount_out), so the
+    # impact is measured without the rounding up to whole base units, which would dominate it in a shallow pool
+    return amount_out / (reserve_out - amount_out)
+
+
+class PoolState:
+    def __init__(self, algo_reserve=0, uctzar_reserve=0, dex_token_supply=0, fee_divisor=100):
+        """Create a pool with the given reserves. fee_divisor is the existing fee rule: the fee is the Algo amount // fee_divisor."""
+        self.algo_reserve = int(algo_reserve)
+        self.uctzar_reserve = int(uctzar_reserve)
+        self.dex_token_supply = int(dex_token_supply)
+        self.fee_divisor = fee_divisor
+        self.version = 0  # bumped on every reserve change, so cached quotes can be invalidated; local, never saved
+
+    def spot_price(self):
+        """Return the current price in UCTZAR per MicroAlgo, or None while the pool is empty."""
+        if self.algo_reserve == 0 or self.uctzar_reserve == 0:
+            return None
+        return self.uctzar_reserve / self.algo_reserve
+
+    def fee_for(self, algo_amount):
+        return int(algo_amount) // self.fee_divisor
+
+    def quote_buy_algo(self, algo_out, max_uctzar_in=None):
+        """Price buying algo_out MicroAlgos with UCTZAR. Raises PoolError if more than max_uctzar_in would be needed."""
+        algo_out = int(algo_out)
+        self._check_liquidity(algo_out, self.algo_reserve, "MicroAlgos")
+        # Keep x * y at least k: the buyer pays in enough UCTZAR, rounded up in favour of the pool
+        uctzar_in = _ceil_div(self.uctzar_reserve * algo_out, self.algo_reserve - algo_out)
+        if max_uctzar_in is not None and uctzar_in > max_uctzar_in:
+            raise PoolError(f"Slippage limit exceeded: {uctzar_in} UCTZAR needed but at most {max_uctzar_in} allowed.")
+        return Quote("algo", uctzar_in, algo_out, self.fee_for(algo_out), _price_impact(algo_out, self.algo_reserve), self.version)
+
+    def quote_buy_uctzar(self, uctzar_out, max_algo_in=None):
+        """Price buying uctzar_out UCTZAR with Algos. Raises PoolError if more than max_algo_in MicroAlgos would be needed."""
+        uctzar_out = int(uctzar_out)
+        self._check_liquidity(uctzar_out, self.uctzar_reserve, "UCTZAR")
+        algo_in = _ceil_div(self.algo_reserve * uctzar_out, self.uctzar_reserve - uctzar_out)
+        if max_algo_in is not None and algo_in > max_algo_in:
+            raise PoolError(f"Slippage limit exceeded: {algo_in} MicroAlgos needed but at most {max_algo_in} allowed.")
+        return Quote("uctzar", algo_in, uctzar_out, self.fee_for(algo_in), _price_impact(uctzar_out, self.uctzar_reserve), self.version)
+
+    def apply_quote(self, quote):
+        """Apply a trade to the reserves and return the PoolChange. Raises PoolError if the pool changed since the quote was made."""
+        if quote.pool_version != self.version:
+            raise PoolError("The pool has changed since this quote was made. Please request a new quote.")
+        if quote.side == "algo":
+            change = PoolChange(algo=-quote.amount_out, uctzar=quote.amount_in)
+        else:
+            change = PoolChange(algo=quote.amount_in, uctzar=-quote.amount_out)
+        self.algo_reserve += change.algo
+        self.uctzar_reserve += change.uctzar
+        self.version += 1
+        return change
+
+    def revert(self, change):
+        """Undo a PoolChange whose transactions did not settle. Changes applied since then are kept."""
+        self.algo_reserve -= change.algo
+        self.uctzar_reserve -= change.uctzar
+        self.dex_token_supply -= change.dex_tokens
+        self.version += 1
+
+    def clearing_price(self, algo_wanted, uctzar_wanted):
+        """Return the uniform price (UCTZAR per MicroAlgo, as a Fraction) that clears a batch of opposing orders on the curve.
+
+        algo_wanted is the total MicroAlgos asked for by buyAlgo orders and uctzar_wanted the total UCTZAR asked for by
+        buyUCTZAR orders. At price p the pool pays out x = algo_wanted - uctzar_wanted / p MicroAlgos net and receives
+        p * x UCTZAR net, and (Ra - x) * (Ru + p * x) = Ra * Ru gives p = Ru / (Ra - x) with
+        x = (algo_wanted * Ru - uctzar_wanted * Ra) / (Ru - uctzar_wanted).
+        """
+        if self.algo_reserve == 0 or self.uctzar_reserve == 0:
+            raise PoolError("The pool has no liquidity yet. Trades are possible once assets have been staked.")
+        if uctzar_wanted >= self.uctzar_reserve:
+            raise PoolError(f"The pool only holds {self.uctzar_reserve} UCTZAR, so {uctzar_wanted} cannot be bought.")
+        net_algo_out = Fraction(algo_wanted * self.uctzar_reserve - uctzar_wanted * self.algo_reserve, self.uctzar_reserve - uctzar_wanted)
+        if net_algo_out >= self.algo_reserve:
+            raise PoolError(f"The pool only holds {self.algo_reserve} MicroAlgos, so the batch cannot be cleared.")
+        return Fraction(self.uctzar_reserve) / (self.algo_reserve - net_algo_out)
+
+    def apply_flows(self, algo_in, algo_out, uctzar_in, uctzar_out):
+        """Apply the settled flows of several trades (e.g. a cleared batch) to the reserves at once."""
+        self.algo_reserve += int(algo_in) - int(algo_out)
+        self.uctzar_reserve += int(uctzar_in) - int(uctzar_out)
+        self.version += 1
+
+    def uctzar_for_deposit(self, algo_amount):
+        """Return the UCTZAR that must be staked alongside algo_amount MicroAlgos to keep the pool's ratio."""
+        algo_amount = int(algo_amount)
+        if self.algo_reserve == 0 or self.uctzar_reserve == 0:
+            return algo_amount * INITIAL_UCTZAR_PER_ALGO // MICROALGOS_PER_ALGO
+        return _ceil_div(algo_amount * self.uctzar_reserve, self.algo_reserve)
+
+    def dex_tokens_for_deposit(self, algo_amount, uctzar_amount):
+        """Return the DEX tokens minted for a deposit, in proportion to the share of the reserves it adds."""
+        algo_amount, uctzar_amount = int(algo_amount), int(uctzar_amount)
+        if self.dex_token_supply == 0:
+            # The first deposit sets the scale: one DEX token per UCTZAR staked, as before the pool existed
+            return uctzar_amount
+        return min(algo_amount * self.dex_token_supply // self.algo_reserve, uctzar_amount * self.dex_token_supply // self.uctzar_reserve)
+
+    def mint(self, algo_amount, uctzar_amount):
+        """Add a confirmed deposit to the reserves and return the DEX tokens minted for it."""
+        tokens = self.dex_tokens_for_deposit(algo_amount, uctzar_amount)
+        self.algo_reserve += int(algo_amount)
+        self.uctzar_reserve += int(uctzar_amount)
+        self.dex_token_supply += tokens
+        self.version += 1
+        return tokens
+
+    def amounts_for_dex_tokens(self, dex_tokens):
+        """Return the (MicroAlgos, UCTZAR) that burning dex_tokens DEX tokens pays out, in proportion to the reserves."""
+        dex_tokens = int(dex_tokens)
+        if dex_tokens > self.dex_token_supply:
+            raise PoolError(f"Cannot burn {dex_tokens} DEX tokens; only {self.dex_token_supply} are in circulation.")
+        if self.dex_token_supply == 0:
+            return 0, 0
+        return dex_tokens * self.algo_reserve // self.dex_token_supply, dex_tokens * self.uctzar_reserve // self.dex_token_supply
+
+    def burn(self, dex_tokens):
+        """Remove a confirmed withdrawal from the reserves and return the (MicroAlgos, UCTZAR) paid out."""
+        algo_out, uctzar_out = self.amounts_for_dex_tokens(dex_tokens)
+        self.algo_reserve -= algo_out
+        self.uctzar_reserve -= uctzar_out
+        self.dex_token_supply -= int(dex_tokens)
+        self.version += 1
+        return algo_out, uctzar_out
+
+    def _check_liquidity(self, amount_out, reserve, unit):
+        if amount_out <= 0:
+            raise PoolError("The amount to buy must be positive.")
+        if self.algo_reserve == 0 or self.uctzar_reserve == 0:
+            raise PoolError("The pool has no liquidity yet. Trades are possible once assets have been staked.")
+        if amount_out >= reserve:
+            raise PoolError(f"The pool only holds {reserve} {unit}, so {amount_out} cannot be bought.")
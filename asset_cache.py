@@ -0,0 +1,118 @@
+# Description - Process-wide caches of asset state used by the Dex transfer paths
+# OptInIndex remembers which accounts already hold which assets, so an opt-in transaction is only sent when one is needed.
+# AssetMetadataCache resolves the name, unit name and decimals of an asset once and reuses them for every transfer.
+
+import json
+import os
+import threading
+
+from algosdk.error import AlgodHTTPError
+
+
+class OptInIndex:
+    def __init__(self, algod_client):
+        self.algod_client = algod_client
+        self._holdings = {}  # (address, asset id) -> True if the account has opted in to the asset
+        self._lock = threading.Lock()
+
+    def is_opted_in(self, address, asset_id):
+        """Return True if address holds asset_id, asking algod only the first time the pair is seen."""
+        key = (address, int(asset_id))
+        with self._lock:
+            if key in self._holdings:
+                return self._holdings[key]
+
+        try:
+            self.algod_client.account_asset_info(address, int(asset_id))
+            held = True
+        except AlgodHTTPError as e:
+            # algod answers 404 when the account has not opted in to the asset
+            if e.code != 404:
+                raise
+            held = False
+
+        with self._lock:
+            # A confirmed opt-in recorded while we were asking wins over a stale negative answer
+            held = self._holdings.get(key, False) or held
+            self._holdings[key] = held
+        return held
+
+    def load_account(self, address):
+        """Fill the index with every asset held by address using a single account lookup."""
+        account_info = self.algod_client.account_info(address)
+        asset_ids = [holding["asset-id"] for holding in account_info.get("assets", [])]
+        with self._lock:
+            for asset_id in asset_ids:
+                self._holdings[(address, asset_id)] = True
+        return asset_ids
+
+    def mark_opted_in(self, address, asset_id):
+        """Record a confirmed opt-in of address to asset_id."""
+        with self._lock:
+            self._holdings[(address, int(asset_id))] = True
+
+    def forget(self, address, asset_id=None):
+        """Drop cached entries for address (or for one of its assets) so they are looked up again, e.g. after an opt-out."""
+        with self._lock:
+            if asset_id is not None:
+                self._holdings.pop((address, int(asset_id)), None)
+                return
+            for key in [key for key in self._holdings if key[0] == address]:
+                del self._holdings[key]
+
+
+class AssetMetadataCache:
+    def __init__(self, algod_client, path=None):
+        """Create a cache around algod_client. If path is given, metadata is also kept in that JSON file between runs."""
+        self.algod_client = algod_client
+        self.path = path
+        self._metadata = {}  # asset id -> {"name", "unit-name", "decimals"}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def get(self, asset_id):
+        """Return the name, unit name and decimals of asset_id, asking algod only if it is not cached yet."""
+        asset_id = int(asset_id)
+        with self._lock:
+            if asset_id in self._metadata:
+                return self._metadata[asset_id]
+
+        asset_params = self.algod_client.asset_info(asset_id)["params"]
+        metadata = {
+            "name": asset_params.get("name", ""),
+            "unit-name": asset_params.get("unit-name", ""),
+            "decimals": int(asset_params.get("decimals", 0)),
+        }
+
+        with self._lock:
+            self._metadata[asset_id] = metadata
+            if self.path is not None:
+                self._save()
+        return metadata
+
+    def invalidate(self, asset_id=None):
+        """Forget one asset, or every asset if asset_id is None, so it is resolved again on the next get()."""
+        with self._lock:
+            if asset_id is None:
+                self._metadata.clear()
+            else:
+                self._metadata.pop(int(asset_id), None)
+            if self.path is not None:
+                self._save()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            # A missing or corrupt cache file only means the metadata is fetched again
+            return
+        self._metadata = {int(asset_id): metadata for asset_id, metadata in stored.items()}
+
+    def _save(self):
+        # Write to a temporary file first so an interrupted write never leaves a half-written cache behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({str(asset_id): metadata for asset_id, metadata in self._metadata.items()}, f, indent=4)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,133 @@
+# Description - asyncio submission pipeline for the Dex and stokvel flows
+# The algod client and the signer are blocking, so every network call and signature runs on a worker thread while the
+# event loop keeps serving other swaps and stakes. A semaphore bounds how many transactions are in flight between submission and confirmation,
+# and confirmations are awaited through the shared ConfirmationWatcher so many waiters cost a single block follower.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from algosdk import transaction
+
+from params_cache import new_lease
+from signer import Signer
+
+
+class AsyncAlgodPipeline:
+    def __init__(self, algod_client, params_cache, confirmation_watcher, max_in_flight=16, opt_in_index=None, asset_metadata=None, signer=None):
+        """Create a pipeline on top of the blocking algod client and the shared params cache and confirmation watcher.
+
+        max_in_flight is the largest number of transactions that may be submitted but not yet confirmed at once.
+        opt_in_index and asset_metadata are the optional caches from asset_cache used by asset_transfer.
+        signer is the signer.Signer that holds the keys; a new one is created if it is not given.
+        """
+        self.algod_client = algod_client
+        self.params_cache = params_cache
+        self.confirmation_watcher = confirmation_watcher
+        self.max_in_flight = max_in_flight
+        self.opt_in_index = opt_in_index
+        self.asset_metadata = asset_metadata
+        self.signer = signer if signer is not None else Signer()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="algod-io")
+        self._window = None
+
+    async def _call(self, fn, *args):
+        # Run a blocking algod call or signature on a worker thread
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def submit(self, signed_txns, wait_rounds=4):
+        """Send a signed transaction (or a list forming one atomic group) and await its confirmation."""
+        if self._window is None:
+            # Created lazily so the semaphore belongs to the running event loop
+            self._window = asyncio.Semaphore(self.max_in_flight)
+
+        async with self._window:
+            if isinstance(signed_txns, list):
+                txid = await self._call(self.algod_client.send_transactions, signed_txns)
+                last_valid = signed_txns[0].transaction.last_valid_round
+            else:
+                txid = await self._call(self.algod_client.send_transaction, signed_txns)
+                last_valid = signed_txns.transaction.last_valid_round
+            print(f"Submitted transaction with txID: {txid}")
+
+            # The watcher resolves a concurrent future from its own thread; wrap it so it can be awaited
+            future = self.confirmation_watcher.watch(txid, wait_rounds, last_valid)
+            return await asyncio.wrap_future(future)
+
+    async def algo_payment(self, payer_address, payer_secret_phrase, receiver_address, amount, comment):
+        """Async version of algo_payment: pay amount MicroAlgos and await confirmation."""
+        params = await self._call(self.params_cache.get)
+        unsigned_txn = transaction.PaymentTxn(
+            sender=payer_address,
+            sp=params,
+            receiver=receiver_address,
+            amt=int(amount),
+            note=comment,
+            lease=new_lease(),
+        )
+        signed_txn = await self._call(self.signer.sign, payer_secret_phrase, unsigned_txn)
+        return await self.submit(signed_txn)
+
+    async def asset_transfer(self, sender_address, sender_secret_phrase, receiver_address, receiver_secret_phrase, amount, asset_code, note=None):
+        """Async version of asset_transfer: opt the receiver in if needed, then transfer amount of the asset with note."""
+        asset_in_int = int(asset_code)
+        if self.asset_metadata is not None:
+            asset_params = await self._call(self.asset_metadata.get, asset_in_int)
+            print(f"Asset Name: {asset_params['name']}")
+
+        needs_optin = True
+        if self.opt_in_index is not None:
+            needs_optin = not await self._call(self.opt_in_index.is_opted_in, receiver_address, asset_in_int)
+
+        if needs_optin:
+            sp = await self._call(self.params_cache.get)
+            optin_txn = transaction.AssetOptInTxn(sender=receiver_address, sp=sp, index=asset_in_int, lease=new_lease())
+            await self.submit(await self._call(self.signer.sign, receiver_secret_phrase, optin_txn))
+            if self.opt_in_index is not None:
+                self.opt_in_index.mark_opted_in(receiver_address, asset_in_int)
+
+        sp = await self._call(self.params_cache.get)
+        xfer_txn = transaction.AssetTransferTxn(
+            sender=sender_address,
+            sp=sp,
+            receiver=receiver_address,
+            amt=int(amount),
+            index=asset_in_int,
+            note=note,
+            lease=new_lease(),
+        )
+        return await self.submit(await self._call(self.signer.sign, sender_secret_phrase, xfer_txn))
+
+    async def contribution(self, member_address, member_secret_phrase, multisig_address, contribution_amount):
+        """Async version of one member's step of StokvelAccountManager.contribution."""
+        return await self.algo_payment(member_address, member_secret_phrase, multisig_address, contribution_amount, b"Stokvel contribution")
+
+    async def contribute_all(self, contributions, multisig_address):
+        """Run the contribution step for many (address, secret phrase, amount) tuples concurrently.
+
+        Returns one result per member in the same order; a failed member yields its exception instead of a result.
+        """
+        return await asyncio.gather(
+            *[self.contribution(address, secret_phrase, multisig_address, amount) for address, secret_phrase, amount in contributions],
+            return_exceptions=True,
+        )
+
+    async def payout(self, multisig_address, signatory_addresses, receiver_address, payout_amount, signatory_secret_phrases, threshold=4):
+        """Async version of the StokvelAccountManager.make_payout step: sign the multisig payout and await confirmation."""
+        params = await self._call(self.params_cache.get)
+        unsigned_txn = transaction.PaymentTxn(
+            sender=multisig_address,
+            sp=params,
+            receiver=receiver_address,
+            amt=int(payout_amount),
+            note=b"Stokvel payout",
+            lease=new_lease(),
+        )
+        msig = transaction.Multisig(version=1, threshold=threshold, addresses=signatory_addresses)
+        msig_txn = transaction.MultisigTransaction(unsigned_txn, msig)
+        await self._call(self.signer.sign_multisig, msig_txn, signatory_secret_phrases[:threshold])
+        return await self.submit(msig_txn)
+
+    def close(self):
+        """Stop the worker threads once all outstanding calls have finished."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,239 @@
+# Description - Batch-auction order matcher that settles many Dex swaps per block
+# Swap requests are collected during a block window instead of being settled one customer at a time. When the
+# window closes, opposing buyAlgo and buyUCTZAR flows are netted, every order is cleared at one uniform price on
+# the pool curve, and the trades are settled in as few atomic transaction groups of up to 16 transactions (eight
+# orders) as the limit allows. The groups are submitted together, so the whole batch settles in the same round. Each
+# group settles or fails as a whole and only the flows of settled groups are applied, so the reserves always match
+# the chain.
+
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from fractions import Fraction
+
+from algosdk import transaction
+from algosdk.constants import tx_group_limit
+
+from amm_pool import PoolError
+from params_cache import new_lease
+from signer import Signer
+
+
+@dataclass
+class SwapOrder:
+    buyer_address: str
+    buyer_secret_phrase: str
+    side: str  # "algo" to buy amount MicroAlgos with UCTZAR, "uctzar" to buy amount UCTZAR with Algos
+    amount: int
+    max_amount_in: int = None  # slippage limit on what the buyer pays in, or None for no limit
+    order_id: int = 0
+    # Filled in when the batch is cleared
+    amount_in: int = 0
+    fee: int = 0
+    status: str = "Queued"
+    error: str = ""
+    confirmed_round: int = 0
+
+    @property
+    def algo_amount(self):
+        # MicroAlgos moved by the order, which the 1% fee is charged on
+        return self.amount if self.side == "algo" else self.amount_in
+
+
+@dataclass
+class BatchResult:
+    price: Fraction = None  # uniform clearing price in UCTZAR per MicroAlgo
+    orders: list = field(default_factory=list)
+    groups: int = 0  # atomic groups submitted
+    transactions: int = 0
+    total_fee: int = 0  # fees of the settled orders, to be distributed to the stakers
+
+
+class BatchAuction:
+    def __init__(self, pool, algod_client, params_cache, confirmation_watcher, dex_address, uctzar_asset_id=728731233, opt_in_index=None, window_seconds=2.8, signer=None, lock=None, on_settled=None):
+        """Create an auction over pool (an amm_pool.PoolState) that settles through the shared algod helpers.
+
+        window_seconds is how long orders are collected before a batch is cleared, about one block by default.
+        signer is the signer.Signer that holds the keys; a new one is created if it is not given.
+        lock guards the pool, e.g. the AccountManager's lock, and is held while a batch is cleared and settled.
+        on_settled is called with each BatchResult while the lock is still held, e.g. to pay its fees to the stakers.
+        """
+        self.pool = pool
+        self.algod_client = algod_client
+        self.params_cache = params_cache
+        self.confirmation_watcher = confirmation_watcher
+        self.dex_address = dex_address
+        self.uctzar_asset_id = int(uctzar_asset_id)
+        self.opt_in_index = opt_in_index
+        self.window_seconds = window_seconds
+        self.signer = signer if signer is not None else Signer()
+        self.lock = lock if lock is not None else threading.RLock()
+        self.on_settled = on_settled
+        self._queue = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def submit(self, order):
+        """Queue an order for the next batch and return its order id."""
+        if order.side not in ("algo", "uctzar"):
+            raise ValueError(f"Unknown swap side '{order.side}'")
+        with self._lock:
+            order.order_id = self._next_id
+            self._next_id += 1
+            self._queue.append(order)
+        return order.order_id
+
+    def run_batch(self, dex_secret_phrase, wait_rounds=4):
+        """Wait for the block window to close, then clear and settle every queued order.
+
+        The pool lock is held from clearing until the settled flows are applied, so nothing else trades against the
+        reserves the batch was priced on.
+        """
+        time.sleep(self.window_seconds)
+        with self._lock:
+            orders, self._queue = self._queue, []
+
+        with self.lock:
+            result = self.clear(orders)
+            if result.price is not None:
+                self.settle(result, dex_secret_phrase, wait_rounds)
+                if self.on_settled is not None:
+                    self.on_settled(result)
+        return result
+
+    def _split(self, orders):
+        # Pack the orders into groups of at most tx_group_limit transactions, first fit, keeping each order's legs together
+        groups = []  # [orders, transactions]
+        for order in orders:
+            legs = self._leg_count(order)
+            for group in groups:
+                if group[1] + legs <= tx_group_limit:
+                    group[0].append(order)
+                    group[1] += legs
+                    break
+            else:
+                groups.append([[order], legs])
+        return [group_orders for group_orders, _ in groups]
+
+    def _leg_count(self, order):
+        # As _legs: two transactions per order, plus an opt-in for a buyer who does not hold UCTZAR yet
+        if order.side == "uctzar" and (self.opt_in_index is None or not self.opt_in_index.is_opted_in(order.buyer_address, self.uctzar_asset_id)):
+            return 3
+        return 2
+
+    def clear(self, orders):
+        """Net the orders and price them all at one uniform price on the curve. Orders over their slippage limit are dropped."""
+        result = BatchResult(orders=list(orders))
+        live = list(orders)
+        while live:
+            algo_wanted = sum(order.amount for order in live if order.side == "algo")
+            uctzar_wanted = sum(order.amount for order in live if order.side == "uctzar")
+            try:
+                price = self.pool.clearing_price(algo_wanted, uctzar_wanted)
+            except PoolError as e:
+                for order in live:
+                    order.status, order.error = "Rejected", str(e)
+                return result
+
+            # Round what each buyer pays up, in favour of the pool, so the reserves never end below the curve
+            over_limit = []
+            for order in live:
+                if order.side == "algo":
+                    order.amount_in = math.ceil(order.amount * price)
+                else:
+                    order.amount_in = math.ceil(order.amount / price)
+                order.fee = self.pool.fee_for(order.algo_amount)
+                if order.max_amount_in is not None and order.amount_in > order.max_amount_in:
+                    over_limit.append(order)
+
+            if not over_limit:
+                result.price = price
+                for order in live:
+                    order.status = "Cleared"
+                return result
+
+            # Removing orders changes the clearing price, so clear the rest again
+            for order in over_limit:
+                order.status, order.error = "Rejected", f"Slippage limit exceeded: {order.amount_in} needed but at most {order.max_amount_in} allowed."
+            live = [order for order in live if order not in over_limit]
+        return result
+
+    def settle(self, result, dex_secret_phrase, wait_rounds=4):
+        """Settle every cleared order in as few atomic groups as possible, all at the batch's clearing price, and wait for them.
+
+        Every group is submitted before any is waited for. A group settles or fails as a whole: the orders of a failed
+        group are marked "Failed", and only the flows of the settled groups are applied to the pool.
+        """
+        cleared = [order for order in result.orders if order.status == "Cleared"]
+        sp = self.params_cache.get()
+        keys = {self.dex_address: dex_secret_phrase}
+        for order in cleared:
+            keys.setdefault(order.buyer_address, order.buyer_secret_phrase)
+
+        submitted = []  # (orders, txid of the group's first transaction)
+        for group_orders in self._split(cleared):
+            txns = [txn for order in group_orders for txn in self._legs(order, sp)]
+            transaction.assign_group_id(txns)
+            try:
+                signed = self.signer.sign_many(txns, keys)
+                txid = self.algod_client.send_transactions(signed)
+            except Exception as e:
+                self._fail(group_orders, e)
+                continue
+            result.groups += 1
+            result.transactions += len(signed)
+            submitted.append((group_orders, txid))
+        if submitted:
+            print(f"Submitted {sum(len(group_orders) for group_orders, _ in submitted)} orders in {result.groups} atomic groups ({result.transactions} transactions)")
+
+        settled = []
+        for group_orders, txid in submitted:
+            try:
+                confirmed_round = self.confirmation_watcher.wait(txid, wait_rounds, sp.last)["confirmed-round"]
+            except Exception as e:
+                self._fail(group_orders, e)
+                continue
+            for order in group_orders:
+                order.status, order.confirmed_round = "Settled", confirmed_round
+            settled.extend(group_orders)
+        if not settled:
+            return result
+
+        # The flows of every settled group are applied to the pool together
+        algo_in = algo_out = uctzar_in = uctzar_out = 0
+        for order in settled:
+            result.total_fee += order.fee
+            if order.side == "algo":
+                algo_out += order.amount
+                uctzar_in += order.amount_in
+            else:
+                algo_in += order.amount_in
+                uctzar_out += order.amount
+                if self.opt_in_index is not None:
+                    self.opt_in_index.mark_opted_in(order.buyer_address, self.uctzar_asset_id)
+        self.pool.apply_flows(algo_in, algo_out, uctzar_in, uctzar_out)
+        return result
+
+    @staticmethod
+    def _fail(orders, error):
+        for order in orders:
+            order.status, order.error = "Failed", str(error)
+
+    def _legs(self, order, sp):
+        # Two transactions per order: what the buyer pays in (with the fee) and what the Dex pays out.
+        # The fee is netted into one leg, so the notes carry it for anyone replaying the pool from the chain.
+        asset_id = self.uctzar_asset_id
+        if order.side == "algo":
+            # The fee is netted from the Algos paid out instead of being a separate payment
+            return [
+                transaction.AssetTransferTxn(sender=order.buyer_address, sp=sp, receiver=self.dex_address, amt=order.amount_in, index=asset_id, note="Batch auction UCTZAR payment for Algos", lease=new_lease()),
+                transaction.PaymentTxn(sender=self.dex_address, sp=sp, receiver=order.buyer_address, amt=order.amount - order.fee, note=f"Batch auction Algos purchased, fee {order.fee}", lease=new_lease()),
+            ]
+        legs = [
+            transaction.PaymentTxn(sender=order.buyer_address, sp=sp, receiver=self.dex_address, amt=order.amount_in + order.fee, note=f"Batch auction Algo payment for UCTZAR, fee {order.fee}", lease=new_lease()),
+            transaction.AssetTransferTxn(sender=self.dex_address, sp=sp, receiver=order.buyer_address, amt=order.amount, index=asset_id, note="Batch auction UCTZAR purchased", lease=new_lease()),
+        ]
+        if self.opt_in_index is None or not self.opt_in_index.is_opted_in(order.buyer_address, asset_id):
+            legs.insert(0, transaction.AssetOptInTxn(sender=order.buyer_address, sp=sp, index=asset_id, lease=new_lease()))
+        return legs
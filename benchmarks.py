@@ -0,0 +1,243 @@
+# Description - End-to-end benchmark suite for the Dex and stokvel operations
+# Every operation runs against the in-process FakeAlgod ledger, so no testnet access is needed. For each operation the
+# suite records the wall-clock time, the number of algod round trips and the number of block rounds it took, and it
+# times distribute_transaction_fee for staker counts from 10 up to 10^6. Runs whose operation fails are counted
+# separately, with their errors, and left out of the timings. Results are written as JSON so runs of different
+# releases can be compared.
+# Usage - $ python benchmarks.py --repeat 20 --output bench_results.json
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import algod_context
+import dex_core
+import fee_batch
+import stokvel_core
+from fake_algod import FakeAlgod
+
+STAKER_COUNTS = [10, 100, 1000, 10000, 100000, 1000000]
+OPERATIONS = ["stake_algo", "withdraw_algo", "buy_algo", "buy_uctzar", "contribution", "make_payout"]
+ALGO_FUNDING = 10 ** 13  # MicroAlgos given to every benchmark account
+UCTZAR_FUNDING = 10 ** 12
+
+
+class OperationStats:
+    def __init__(self, name):
+        self.name = name
+        self.wall = []
+        self.calls = []
+        self.rounds = []
+        self.calls_by_method = {}
+        self.failed = 0
+        self.errors = Counter()
+
+    @contextlib.contextmanager
+    def measure(self, ledger):
+        # Time one run of the operation and count the algod calls and rounds it used. The body sets run.ok to
+        # whether the operation succeeded; a failed or raising run is only counted as a failure.
+        run = SimpleNamespace(ok=True)
+        calls_before = dict(ledger.calls)
+        round_before = ledger.round
+        started = time.perf_counter()
+        try:
+            with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+                yield run
+        except Exception as e:
+            run.ok = False
+            self.errors[f"{type(e).__name__}: {e}"] += 1
+        if not run.ok:
+            self.failed += 1
+            return
+        self.wall.append(time.perf_counter() - started)
+        self.rounds.append(ledger.round - round_before)
+        calls = 0
+        for method, count in ledger.calls.items():
+            made = count - calls_before.get(method, 0)
+            if made:
+                self.calls_by_method[method] = self.calls_by_method.get(method, 0) + made
+                calls += made
+        self.calls.append(calls)
+
+    def summary(self):
+        runs = len(self.wall)
+        if not runs:
+            return {"runs": 0, "failed": self.failed, "errors": dict(self.errors.most_common(10))}
+        return {
+            "runs": runs,
+            "failed": self.failed,
+            "errors": dict(self.errors.most_common(10)),
+            "wall_seconds": {
+                "mean": statistics.fmean(self.wall),
+                "median": statistics.median(self.wall),
+                "min": min(self.wall),
+                "max": max(self.wall),
+            },
+            "round_trips_per_op": sum(self.calls) / runs,
+            "round_trips_by_method": {method: count / runs for method, count in sorted(self.calls_by_method.items())},
+            "rounds_per_op": sum(self.rounds) / runs,
+        }
+
+
+def new_wallet(ledger, uctzar_asset_id=None):
+    # A funded account, optionally opted in to and holding UCTZAR
+    from algosdk import account, mnemonic
+
+    private_key, address = account.generate_account()
+    ledger.fund(address, ALGO_FUNDING)
+    if uctzar_asset_id is not None:
+        ledger.opt_in(address, uctzar_asset_id)
+        ledger.holdings[address][uctzar_asset_id] = UCTZAR_FUNDING
+    return address, mnemonic.from_private_key(private_key)
+
+
+def bench_dex(ledger, repeat, stats):
+    dex_address, dex_phrase = new_wallet(ledger)
+    ledger.create_asset(dex_address, 10 ** 15, "UCTZAR", "UCTZAR", asset_id=dex_core.UCTZAR_ASSET_ID)
+    ledger.create_asset(dex_address, 10 ** 15, "DEX token", "DEX", asset_id=dex_core.DEX_TOKEN_ASSET_ID)
+    manager = dex_core.AccountManager(dex_address=dex_address)
+
+    # Every run stakes from a new account, so the first stake also pays for the staker's DEX token opt-in
+    stakers = [new_wallet(ledger, dex_core.UCTZAR_ASSET_ID) for _ in range(repeat)]
+    algo_stake = 10 ** 12
+    for index, (address, phrase) in enumerate(stakers):
+        name = f"staker {index}"
+        manager.add_account(name, address, 0, 0, "2024-01-01")
+        uctzar_stake = manager.pool.uctzar_for_deposit(algo_stake)
+        with stats["stake_algo"].measure(ledger) as run:
+            run.ok = manager.stake_algo(name, algo_stake, uctzar_stake, phrase, dex_phrase)
+            if run.ok:
+                manager.update_contribution(name, algo_stake, uctzar_stake)
+
+    buyer_address, buyer_phrase = new_wallet(ledger, dex_core.UCTZAR_ASSET_ID)
+    for _ in range(repeat):
+        with stats["buy_algo"].measure(ledger) as run:
+            run.ok = manager.buy_algo(10 ** 9, buyer_address, buyer_phrase, dex_phrase) is not None
+        with stats["buy_uctzar"].measure(ledger) as run:
+            run.ok = manager.buy_uctzar(100, buyer_address, buyer_phrase, dex_phrase) is not None
+
+    for index, (address, phrase) in enumerate(stakers):
+        name = f"staker {index}"
+        with stats["withdraw_algo"].measure(ledger) as run:
+            run.ok = manager.withdraw_algo(name, phrase, dex_phrase)
+        if run.ok:
+            # Leaving the pool is local bookkeeping, as in withdraw_stake, and is not part of the timed operation
+            manager.set_opt_out(name)
+
+
+def bench_stokvel(ledger, repeat, stats):
+    members = [new_wallet(ledger) for _ in range(stokvel_core.STOKVEL_SIZE)]
+    registry = stokvel_core.AccountManager()
+    for index, (address, _) in enumerate(members):
+        registry.add_account(f"member {index}", address, 1000000, "1", "2")
+    stokvel = stokvel_core.StokvelAccountManager(registry.get_all_accounts())
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        stokvel.create_multisig_account()
+    member_phrases = dict(members)
+    signatory_phrases = [phrase for _, phrase in members]
+
+    # A month is a round of contributions followed by one payout
+    for _ in range(repeat):
+        with stats["contribution"].measure(ledger) as run:
+            run.ok = stokvel.contribution(member_phrases) is not None
+        with stats["make_payout"].measure(ledger) as run:
+            run.ok = stokvel.make_payout(signatory_phrases) is not None
+
+
+def bench_fee_distribution(staker_counts, fee_repeat):
+    results = []
+    for count in staker_counts:
+        manager = dex_core.AccountManager()
+        started = time.perf_counter()
+        for row in range(count):
+            manager.ledger.append(f"staker {row}", f"address {row}", 1000000 + row, 0, "2024-01-01")
+        setup = time.perf_counter() - started
+
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            # The lazy path: one index update per fee
+            started = time.perf_counter()
+            for fee in range(fee_repeat):
+                manager.distribute_transaction_fee(1000 + fee)
+            lazy = (time.perf_counter() - started) / fee_repeat
+
+            # Settling every staker after the fee
+            started = time.perf_counter()
+            manager.distribute_transaction_fee(1000, settle=True)
+            settled = time.perf_counter() - started
+
+            # The vectorised eager path, when NumPy is installed (imported beforehand so it is not timed)
+            batch = None
+            if fee_batch.np is not None:
+                started = time.perf_counter()
+                manager.distribute_transaction_fees_batch([1000] * fee_repeat)
+                batch = time.perf_counter() - started
+
+        results.append({
+            "stakers": count,
+            "setup_seconds": setup,
+            "fee_seconds": lazy,
+            "fee_with_settle_seconds": settled,
+            "batch_seconds": batch,
+            "batch_fee_count": fee_repeat,
+        })
+    return results
+
+
+def run(repeat=20, block_time=0.0, latency=0.0, verify_signatures=True, operations=OPERATIONS, staker_counts=STAKER_COUNTS, fee_repeat=100):
+    """Run the suite and return the results as a dict."""
+    ledger = FakeAlgod(block_time=block_time, latency=latency, verify_signatures=verify_signatures)
+    algod_context.configure(algod_client=ledger, metadata_path=None)
+    stats = {name: OperationStats(name) for name in OPERATIONS}
+
+    if {"stake_algo", "withdraw_algo", "buy_algo", "buy_uctzar"} & set(operations):
+        bench_dex(ledger, repeat, stats)
+    if {"contribution", "make_payout"} & set(operations):
+        bench_stokvel(ledger, repeat, stats)
+
+    from importlib.metadata import version
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "py-algorand-sdk": version("py-algorand-sdk"),
+            "repeat": repeat,
+            "block_time": block_time,
+            "latency": latency,
+            "verify_signatures": verify_signatures,
+        },
+        "operations": {name: stats[name].summary() for name in operations if stats[name].wall or stats[name].failed},
+        "fee_distribution": bench_fee_distribution(staker_counts, fee_repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Dex and stokvel operations against an in-process algod ledger.")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each operation")
+    parser.add_argument("--block-time", type=float, default=0.0, help="seconds per round; 0 closes a block as soon as one is awaited")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated network round trip per algod call, in seconds")
+    parser.add_argument("--no-verify", action="store_true", help="skip signature checks in the fake ledger")
+    parser.add_argument("--ops", nargs="*", default=OPERATIONS, choices=OPERATIONS, help="operations to run")
+    parser.add_argument("--stakers", nargs="*", type=int, default=STAKER_COUNTS, help="staker counts for the fee distribution benchmark")
+    parser.add_argument("--output", help="write the JSON results to this file instead of standard output")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.block_time, args.latency, not args.no_verify, args.ops, args.stakers)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
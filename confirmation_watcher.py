@@ -0,0 +1,156 @@
+# Description - One block-following confirmation service shared by every transaction the scripts send
+# Instead of polling algod once per pending transaction, a single background thread follows new rounds,
+# checks the transaction IDs of each new block against the registry of pending transactions and resolves
+# every waiter found in that block at once.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from algosdk.error import AlgodHTTPError, ConfirmationTimeoutError
+
+# Transaction IDs of this many of the last processed blocks are kept, so a transaction registered just after the
+# block that confirmed it was processed is still found
+RECENT_BLOCKS = 4
+
+
+class ConfirmationWatcher:
+    def __init__(self, algod_client, on_round=None, max_errors=5):
+        """Create a watcher around algod_client.
+
+        on_round is called with every new round number the watcher sees (e.g. to refresh a params cache).
+        After max_errors consecutive failed requests to algod, every pending waiter fails with the last error.
+        """
+        self.algod_client = algod_client
+        self.on_round = on_round
+        self.max_errors = max_errors
+        self._pending = {}  # txid -> (future, last round in which it may still be confirmed)
+        self._recent_blocks = deque(maxlen=RECENT_BLOCKS)  # (round, txids) of the last processed blocks
+        self._last_round = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def watch(self, txid, wait_rounds=4, last_valid_round=None, callback=None):
+        """Register txid and return a Future that resolves to its pending transaction information once confirmed.
+
+        The future fails with ConfirmationTimeoutError if the transaction is not confirmed within wait_rounds rounds,
+        or after last_valid_round if that comes first. callback, if given, is called with the future when it completes.
+        The future's registered_round attribute is the last round the watcher had seen when txid was registered.
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        current_round = None
+        while True:
+            with self._lock:
+                following = self._thread is not None and self._thread.is_alive()
+                if following or current_round is not None:
+                    if not following:
+                        # Nobody is following blocks, so the last processed round may be stale
+                        self._last_round = current_round
+                    future.registered_round = self._last_round
+                    deadline = self._last_round + (wait_rounds or 1000)
+                    if last_valid_round is not None:
+                        deadline = min(deadline, last_valid_round)
+                    self._pending[txid] = (future, deadline)
+                    # The block that confirmed txid may have been processed before it was registered
+                    confirmed_earlier = any(txid in block_txids for _, block_txids in self._recent_blocks)
+
+                    if not following:
+                        self._thread = threading.Thread(target=self._follow_rounds, name="confirmation-watcher", daemon=True)
+                        self._thread.start()
+                    break
+            # Ask algod for the current round without holding the lock, so other callers and the follower are not held up
+            current_round = self.algod_client.status()["last-round"]
+
+        if confirmed_earlier:
+            tx_info = self._lookup(txid)
+            if tx_info is not None and tx_info.get("confirmed-round"):
+                self._resolve(txid, tx_info)
+        return future
+
+    def wait(self, txid, wait_rounds=4, last_valid_round=None):
+        """Block until txid is confirmed, like transaction.wait_for_confirmation, and return its information."""
+        return self.watch(txid, wait_rounds, last_valid_round).result()
+
+    def pending_count(self):
+        """Return the number of transactions that are still waiting for confirmation."""
+        with self._lock:
+            return len(self._pending)
+
+    def _follow_rounds(self):
+        errors = 0
+        while True:
+            with self._lock:
+                if not self._pending:
+                    # Nothing left to watch. A later watch() starts a new thread.
+                    self._thread = None
+                    return
+                last_round = self._last_round
+
+            try:
+                # Block until algod has seen a round after the last one we processed
+                status = self.algod_client.status_after_block(last_round)
+                new_round = status["last-round"]
+                for round_num in range(last_round + 1, new_round + 1):
+                    self._process_round(round_num)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors >= self.max_errors:
+                    self._fail_all(e)
+                    errors = 0
+                time.sleep(1)
+
+    def _process_round(self, round_num):
+        block_txids = set(self.algod_client.get_block_txids(round_num).get("blockTxids") or [])
+
+        with self._lock:
+            # Recorded with the snapshot, so a txid registered after it is checked against this block by watch()
+            self._recent_blocks.append((round_num, block_txids))
+            confirmed = [txid for txid in self._pending if txid in block_txids]
+            expired = [txid for txid, (_, deadline) in self._pending.items() if deadline < round_num and txid not in block_txids]
+
+        # Only the transactions that made it into this block need their details fetched
+        for txid in confirmed:
+            self._resolve(txid, self.algod_client.pending_transaction_info(txid))
+
+        for txid in expired:
+            # Last chance for a transaction that was confirmed before it was registered
+            tx_info = self._lookup(txid)
+            if tx_info is not None and tx_info.get("confirmed-round"):
+                self._resolve(txid, tx_info)
+            else:
+                self._reject(txid, ConfirmationTimeoutError("Wait for transaction id {} timed out".format(txid)))
+
+        with self._lock:
+            self._last_round = round_num
+        if self.on_round is not None:
+            self.on_round(round_num)
+
+    def _lookup(self, txid):
+        try:
+            return self.algod_client.pending_transaction_info(txid)
+        except AlgodHTTPError:
+            return None
+
+    def _resolve(self, txid, tx_info):
+        with self._lock:
+            entry = self._pending.pop(txid, None)
+        if entry is not None:
+            entry[0].set_result(tx_info)
+
+    def _reject(self, txid, error):
+        with self._lock:
+            entry = self._pending.pop(txid, None)
+        if entry is not None:
+            entry[0].set_exception(error)
+
+    def _fail_all(self, error):
+        with self._lock:
+            entries = list(self._pending.values())
+            self._pending.clear()
+        for future, _ in entries:
+            future.set_exception(error)
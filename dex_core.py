@@ -0,0 +1,713 @@
+# Description - Headless core of the UCTZAR/Algo Dex: payments, asset transfers, swaps and the staking pool
+# Importing this module has no side effects: no prompts, no network calls and no SDK import. The algod client and
+# its helpers are created on first use by algod_context, and every secret phrase is passed in as an argument.
+# A signer.KeyHandle can be passed instead of a secret phrase; keys are derived once per session by the shared signer.
+# liquiditypool_defi.py is the interactive front end built on top of this module.
+
+import functools
+import json
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+import algod_context
+import metrics
+from stake_ledger import StakeLedger
+from amm_pool import PoolChange, PoolState, PoolError
+
+# Dex wallet that holds the UCTZAR/Algo pool, the UCTZAR asset and the DEX token (the pool's LP token)
+DEX_ADDRESS = 'UB5BHGLM5Z3W7UPFLTBWOC3HQHUHPCAJSA3ENG4FLLT6UDBKFVZMK7HSCM'
+UCTZAR_ASSET_ID = 728731233
+DEX_TOKEN_ASSET_ID = 728731344
+
+# Trades whose price is more than this much worse than the pool's spot price are refused
+MAX_PRICE_IMPACT = 0.05
+
+
+@metrics.traced("algo_payment")
+def algo_payment(payer_address, payer_secret_phrase, receiver_address, amount, comment):
+    """Pay amount MicroAlgos from the payer to the receiver and return the confirmed transaction information."""
+    from algosdk import transaction
+    from params_cache import new_lease
+
+    signer = algod_context.get_signer()
+    payer_key = signer.handle(payer_secret_phrase)
+
+    # Get suggested transaction parameters from the shared cache
+    params = algod_context.get_params_cache().get()
+
+    # Create the payment transaction
+    unsigned_txn = transaction.PaymentTxn(
+        sender=payer_address,
+        sp=params,
+        receiver=receiver_address,  # Use a suspense account as the liquidity pool of the Dex
+        amt=amount,
+        note=comment,
+        lease=new_lease(),
+    )
+
+    # Sign the transaction
+    signed_txn = signer.sign(payer_key, unsigned_txn)
+
+    # Submit the transaction and get back a transaction ID
+    txid = algod_context.get_algod_client().send_transaction(signed_txn)
+    print("Successfully submitted transaction with txID: {}".format(txid))
+
+    # Wait for confirmation
+    txn_result = algod_context.get_confirmation_watcher().wait(txid, 4)
+
+    # Print transaction information and decoded note
+    print(f"Transaction information: {json.dumps(txn_result, indent=4)}")
+    return txn_result
+
+
+@metrics.traced("asset_transfer")
+def asset_transfer(sender_address, sender_secret_phrase, receiver_address, receiver_secret_phrase, amount, asset_code, note=None):
+    """Transfer amount of an asset, opting the receiver in first if it does not hold the asset yet. note is attached to the transfer."""
+    from algosdk import transaction
+    from params_cache import new_lease
+
+    signer = algod_context.get_signer()
+    algod_client = algod_context.get_algod_client()
+    params_cache = algod_context.get_params_cache()
+    confirmation_watcher = algod_context.get_confirmation_watcher()
+    opt_in_index = algod_context.get_opt_in_index()
+
+    asset_in_int = int(asset_code) # Add hard coded asset ID for UCTZAR
+    asset_params = algod_context.get_asset_metadata().get(asset_in_int)
+    print(f"Asset Name: {asset_params['name']}")
+
+    send_amt_int = int(amount)
+
+    # Opt-in required from owner of receiving wallet, unless the wallet already holds the asset
+    if opt_in_index.is_opted_in(receiver_address, asset_in_int):
+        print("Receiver has already opted in to this asset. Skipping opt in")
+    else:
+        sp = params_cache.get()
+
+        # Create opt-in transaction
+        optin_txn = transaction.AssetOptInTxn(
+            sender=receiver_address, sp=sp, index = asset_in_int, lease=new_lease()
+        )
+
+        signed_optin_txn = signer.sign(receiver_secret_phrase, optin_txn)
+        txid = algod_client.send_transaction(signed_optin_txn)
+        print("Opt in successful")
+        print(f"Sent opt in transaction with txid: {txid}")
+
+        # Wait for the transaction to be confirmed
+        results = confirmation_watcher.wait(txid, 4)
+        print(f"Result confirmed in round: {results['confirmed-round']}")
+        opt_in_index.mark_opted_in(receiver_address, asset_in_int)
+
+    sp = params_cache.get()
+    # Create transfer transaction
+    xfer_txn = transaction.AssetTransferTxn(
+        sender=sender_address,
+        sp=sp,
+        receiver=receiver_address,
+        amt=send_amt_int,
+        index=asset_in_int,
+        note=note,
+        lease=new_lease(),
+    )
+    signed_xfer_txn = signer.sign(sender_secret_phrase, xfer_txn)
+    txid = algod_client.send_transaction(signed_xfer_txn)
+    print(f"Sent transfer transaction with txid: {txid}")
+
+    results = confirmation_watcher.wait(txid, 4)
+    print(f"Result confirmed in round: {results['confirmed-round']}")
+    return results
+
+
+@metrics.traced("atomic_swap")
+def atomic_swap(buyer_address, buyer_secret_phrase, dex_address, dex_secret_phrase, algo_amount, uctzar_amount, tx_fee, buy_side, asset_code=UCTZAR_ASSET_ID):
+    """Settle the UCTZAR leg, the Algo leg and the fee leg of a swap as one atomic transaction group.
+
+    buy_side is "algo" when the buyer pays UCTZAR for Algos (buyAlgo) and "uctzar" when the buyer pays Algos for UCTZAR (buyUCTZAR).
+    Either every leg is confirmed in the same round or none of them is.
+    """
+    from algosdk import transaction
+    from params_cache import new_lease
+
+    opt_in_index = algod_context.get_opt_in_index()
+    asset_in_int = int(asset_code)
+
+    # One set of suggested parameters is shared by every leg of the group
+    sp = algod_context.get_params_cache().get()
+
+    if buy_side == "algo":
+        # The Dex wallet receives UCTZAR, so it opts in as part of the group
+        uctzar_receiver, uctzar_sender = dex_address, buyer_address
+        algo_sender, algo_receiver = dex_address, buyer_address
+        algo_note = "Algos purchased on the Dex"
+        fee_note = "Algo purchase transaction fee"
+        uctzar_note = "UCTZAR payment for Algos purchased on Dex"
+    elif buy_side == "uctzar":
+        # The buyer receives UCTZAR, so the buyer opts in as part of the group
+        uctzar_receiver, uctzar_sender = buyer_address, dex_address
+        algo_sender, algo_receiver = buyer_address, dex_address
+        algo_note = "Algo payment for UCTZAR purchased on Dex"
+        fee_note = "UCTZAR purchase transaction fee"
+        uctzar_note = "UCTZAR purchased on the Dex"
+    else:
+        print(f"Error: Unknown swap side '{buy_side}'. Swap aborted.")
+        return None
+
+    # Build the legs. The opt-in leg is only needed when the UCTZAR receiver does not hold the asset yet.
+    needs_optin = not opt_in_index.is_opted_in(uctzar_receiver, asset_in_int)
+    uctzar_txn = transaction.AssetTransferTxn(sender=uctzar_sender, sp=sp, receiver=uctzar_receiver, amt=int(uctzar_amount), index=asset_in_int, note=uctzar_note, lease=new_lease())
+    algo_txn = transaction.PaymentTxn(sender=algo_sender, sp=sp, receiver=algo_receiver, amt=int(algo_amount), note=algo_note, lease=new_lease())
+    fee_txn = transaction.PaymentTxn(sender=buyer_address, sp=sp, receiver=dex_address, amt=int(tx_fee), note=fee_note, lease=new_lease())
+
+    group = [uctzar_txn, algo_txn, fee_txn]
+    if needs_optin:
+        group.insert(0, transaction.AssetOptInTxn(sender=uctzar_receiver, sp=sp, index=asset_in_int, lease=new_lease()))
+    transaction.assign_group_id(group)
+
+    # Sign every leg with its sender's key; the signer derives each key at most once per session
+    signed_group = algod_context.get_signer().sign_many(group, {buyer_address: buyer_secret_phrase, dex_address: dex_secret_phrase})
+
+    # Submit the whole group once and wait for a single confirmation
+    txid = algod_context.get_algod_client().send_transactions(signed_group)
+    print(f"Sent atomic swap group of {len(signed_group)} transactions with first txid: {txid}")
+
+    results = algod_context.get_confirmation_watcher().wait(txid, 4)
+    print(f"Swap group confirmed in round: {results['confirmed-round']}")
+    opt_in_index.mark_opted_in(uctzar_receiver, asset_in_int)
+    return results
+
+
+def _serialised(method):
+    # Changes to the pool or the ledger are made under the manager's lock, so concurrent callers (a service, the load
+    # generator) never price against half-applied state. Operations that move assets hold it only to reserve and to
+    # complete their change (see Reservations below), not while signing, submitting or waiting for confirmation.
+    # With a state store, the outermost operation logs what changed before releasing the lock and waits for the log
+    # write after releasing it, so the waits of concurrent callers share one group commit.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        logged = None
+        with self.lock:
+            self._depth += 1
+            try:
+                result = method(self, *args, **kwargs)
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self.store is not None:
+                    logged = self._log_changes()
+        if logged is not None:
+            self._finish_commit(*logged)
+        return result
+    return wrapper
+
+
+def build_pool_registry(manager):
+    """Return a registry of every pool the Dex runs, starting with the manager's UCTZAR/Algo pool, for multi-hop routing.
+
+    Routes through the UCTZAR/Algo pool settle under the manager's lock, and their 1% fee is paid in Algos to the
+    stakers through distribute_transaction_fee, which also logs the hop to the manager's state store.
+    """
+    from pool_router import PoolRegistry, ALGO_ASSET_ID
+
+    pool_registry = PoolRegistry()
+    pool_registry.register(ALGO_ASSET_ID, UCTZAR_ASSET_ID, address=manager.dex_address, lp_token_id=DEX_TOKEN_ASSET_ID, fee_bps=100, state=manager.pool,
+                           lock=manager.lock, fee_sink=manager.distribute_transaction_fee)
+    return pool_registry
+
+
+def build_batch_auction(manager, window_seconds=2.8):
+    """Return a batch auction over the manager's pool that clears under the manager's lock and pays its fees to the stakers."""
+    from batch_auction import BatchAuction
+
+    return BatchAuction(
+        manager.pool,
+        algod_context.get_algod_client(),
+        algod_context.get_params_cache(),
+        algod_context.get_confirmation_watcher(),
+        manager.dex_address,
+        UCTZAR_ASSET_ID,
+        algod_context.get_opt_in_index(),
+        window_seconds=window_seconds,
+        signer=algod_context.get_signer(),
+        lock=manager.lock,
+        on_settled=manager.record_batch,
+    )
+
+
+class Account:
+    def __init__(self, name, address, contributed_algo,contributed_uct_zar, date):
+        self.account_data = {
+            "Account name": name,
+            "Account address": address,
+            "Contributed Algo": int(contributed_algo),
+            "Contributed UCTZAR": int(contributed_uct_zar),
+            "Join date": date,
+            "Status": "Active",  # Default opt-in status to "Yes"
+        }
+
+    def get_account_data(self):
+        return self.account_data
+
+class AccountManager:
+    def __init__(self, dex_address=DEX_ADDRESS, store=None):
+        """Create the manager. With a state_store.StateStore, the saved stakers and pool are loaded and every change is logged to it."""
+        # Stakers are stored column by column in a compact ledger instead of one dict per account
+        self.ledger = StakeLedger()
+        self.accounts = self.ledger.view()
+        # Reserves and DEX token supply of the UCTZAR/Algo pool, used to price trades and stakes
+        self.pool = PoolState()
+        # Wallet that holds the pool's reserves
+        self.dex_address = dex_address
+        self.lock = threading.RLock()
+        self._depth = 0  # nesting of serialised operations on the thread holding the lock
+        self._reservations = {}  # id -> reservation of an operation whose transactions are in flight
+        self._busy = set()  # rows of stakers with an operation in flight
+        self.store = store
+        self._logged_totals = None  # ledger totals and pool reserves as last written to the store
+        if store is not None:
+            self._restore(*store.load())
+            self.ledger.dirty = set()
+            self._logged_totals = self._totals_image()
+
+    # Persistence
+
+    def _totals_image(self):
+        # pool.version is a local counter for invalidating quotes, so it is not part of the saved or replayed state.
+        # Changes still in flight are left out; they are logged once their transactions settle.
+        pool = self.pool
+        algo, uctzar, dex_tokens = pool.algo_reserve, pool.uctzar_reserve, pool.dex_token_supply
+        for reservation in self._reservations.values():
+            algo -= reservation.change.algo
+            uctzar -= reservation.change.uctzar
+            dex_tokens -= reservation.change.dex_tokens
+        return [self.ledger.total_algo, self.ledger.total_units], [algo, uctzar, dex_tokens]
+
+    def state_image(self):
+        """Return every staker, the fee index totals and the pool reserves as plain data, as saved in a snapshot."""
+        ledger_totals, pool = self._totals_image()
+        return {"stakers": [self.ledger.row_image(row) for row in range(len(self.ledger))], "ledger": ledger_totals, "pool": pool}
+
+    def load_state(self, image):
+        """Load a state_image(), e.g. from a snapshot or a replay checkpoint. Stakers it holds replace rows with the same name."""
+        # Snapshots and log records have the same shape: the stakers they hold replace the saved rows
+        for row_image in image["stakers"]:
+            self.ledger.load_row(row_image)
+        self.ledger.total_algo, self.ledger.total_units = image["ledger"]
+        # Images written by earlier releases also hold the pool version; quotes made before the load go stale either way
+        self.pool.algo_reserve, self.pool.uctzar_reserve, self.pool.dex_token_supply = image["pool"][:3]
+        self.pool.version += 1
+
+    def _restore(self, state, records):
+        if state is not None:
+            self.load_state(state)
+        for record in records:
+            self.load_state(record)
+        if state is not None or records:
+            print(f"Restored {len(self.ledger)} stakers and the pool reserves from the state store ({len(records)} log records replayed).")
+
+    def _log_changes(self):
+        # Called with the lock held: queue the changed stakers and the totals, and take a snapshot if one is due
+        rows = self.ledger.take_dirty()
+        totals = self._totals_image()
+        if not rows and totals == self._logged_totals:
+            return None
+        ledger_totals, pool = totals
+        seq = self.store.append({"stakers": [self.ledger.row_image(row) for row in rows], "ledger": ledger_totals, "pool": pool})
+        self._logged_totals = totals
+        snapshot = self.state_image() if self.store.snapshot_due() else None
+        return seq, snapshot
+
+    def _finish_commit(self, seq, snapshot):
+        self.store.wait(seq)
+        if snapshot is not None:
+            self.store.write_snapshot(snapshot, seq)
+
+    @_serialised
+    def save(self):
+        """Log changes made to the pool outside the manager's methods, e.g. by a batch auction or the pool router."""
+
+    @_serialised
+    def add_account(self, name, address, contributed_algo,contributed_uct_zar,date):
+        """Add a new account. Names and wallet addresses must be unique; returns None if either is already in use."""
+        try:
+            row = self.ledger.append(name, address, contributed_algo, contributed_uct_zar, date)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return None
+        return self.ledger.record(row)
+
+    def get_all_accounts(self):
+        return self.accounts
+
+    def get_account(self, name):
+        """Return the account with the given name, or None if there is none."""
+        row = self.ledger.row_by_name(name)
+        return None if row is None else self.ledger.record(row)
+
+    def get_account_by_address(self, address):
+        """Return the account linked to the given wallet address, or None if there is none."""
+        row = self.ledger.row_by_address(address)
+        return None if row is None else self.ledger.record(row)
+
+    def get_active_accounts(self):
+        """Return the accounts whose "Status" is "Active", read from the status bitmap."""
+        return [self.ledger.record(row) for row in self.ledger.active_rows()]
+
+    @_serialised
+    def update_contribution(self, name, additional_algo, additional_uctzar):
+        """Add an additional amount to the contribution of the account with the given name, if the account is active."""
+        account = self.get_account(name)
+        if account is None:
+            print(f"Account '{name}' not found.")
+            return
+        if account["Status"] != "Active":
+            print(f"Error: Account '{name}' is not active. Contribution update aborted.")
+            return
+        # Staking settles the fees accrued so far and buys pool units at the current fee index
+        self.ledger.deposit(account.row, additional_algo)
+        self.ledger.deposited_algo[account.row] += int(additional_algo)
+        account["Contributed UCTZAR"] += int(additional_uctzar)
+        print(f"Added {additional_algo} of MicroAlgos and {additional_uctzar} of UCTZAR to {name}'s stake. New staked total: \n MicroAlgos: {account['Contributed Algo']} \n UCTZAR: {account['Contributed UCTZAR']}")
+
+
+    @_serialised
+    def set_opt_out(self, name):
+        """Set the opt-in status to 'No' for the account with the given name."""
+        account = self.get_account(name)
+        if account is None:
+            print(f"Account '{name}' not found.")
+            return
+        account["Status"] = "Left"
+        print(f"Account '{name}' has left the staking pull successfully.")
+
+    @_serialised
+    def distribute_transaction_fee(self, transaction_fee, settle=False):
+        """Distribute a transaction fee across all active accounts in proportion to their contributed Algo amount.
+
+        The fee is added to the pool's fee index in O(1); each account collects its share the next time it stakes,
+        withdraws or is queried. With settle=True every active account is settled straight away, which gives exactly
+        the same balances.
+        """
+        # Only accounts with "Status" set to "Active" own pool units, so they are the only ones that share in the fee
+        if not self.ledger.accrue_fee(transaction_fee):
+            print("No active contributions available to distribute.")
+            return
+
+        if settle:
+            self.ledger.settle_all()
+
+        print(f"Transaction fee of {int(transaction_fee)} MicroAlgos distributed successfully among {self.ledger.active_count} active accounts.")
+
+    @_serialised
+    def record_batch(self, result):
+        """Distribute the fees of a settled batch_auction.BatchResult to the stakers; its pool flows are logged with them."""
+        if result.total_fee:
+            self.distribute_transaction_fee(result.total_fee)
+
+    @_serialised
+    def distribute_transaction_fees_batch(self, transaction_fees):
+        """Eagerly distribute one fee or a list of fees across all active accounts in a single vectorised pass (e.g. at epoch close).
+
+        Shares use largest-remainder rounding, so they add up to exactly the fees plus any rounding dust held by the pool.
+        """
+        import fee_batch
+
+        summary = fee_batch.distribute_fees(self.ledger, transaction_fees)
+        if summary["accounts"] == 0:
+            print("No active contributions available to distribute.")
+            return summary
+        print(f"Distributed {summary['distributed']} MicroAlgos ({summary['fee count']} fees totalling {summary['fees']} plus {summary['dust']} of rounding dust) among {summary['accounts']} active accounts. Shares ranged from {summary['smallest share']} to {summary['largest share']} MicroAlgos.")
+        return summary
+
+    # Reservations
+    #
+    # Stakes, withdrawals and trades are priced and applied to the pool under the lock, as a reservation, so the next
+    # operation is priced on the reserves this one will settle against. The lock is then released while the
+    # transactions are signed, submitted and confirmed, so operations of different stakers and traders overlap. Once the
+    # transactions are confirmed the reservation is completed under the lock; if they fail it is reverted. The store
+    # only logs completed operations: reservations still in flight are left out of the logged pool totals.
+
+    def _hold(self, change, row=None, **details):
+        # Called with the lock held: record a change to the pool whose transactions are still in flight
+        reservation = SimpleNamespace(change=change, row=row, **details)
+        self._reservations[id(reservation)] = reservation
+        if row is not None:
+            self._busy.add(row)
+        return reservation
+
+    def _release(self, reservation, settled):
+        # Called with the lock held: drop the reservation, reverting its change to the pool unless it settled
+        del self._reservations[id(reservation)]
+        self._busy.discard(reservation.row)
+        if not settled:
+            self.pool.revert(reservation.change)
+
+    def _check_idle(self, name, row):
+        if row in self._busy:
+            print(f"Error: Another operation on account '{name}' is still settling. Please try again once it has.")
+            return False
+        return True
+
+    @_serialised
+    def _reserve_stake(self, name, algo_stake_amount, uctzar_stake_amount):
+        # uctzar_stake_amount None stakes UCTZAR at the pool's current ratio
+        account = self.get_account(name)
+        if account is None:
+            print(f"Error: Account '{name}' not found.")
+            return None
+        if account["Status"] == "Left":
+            print("Error: You have left the staking pool. Staking process halted.")
+            return None
+        if not self._check_idle(name, account.row):
+            return None
+        algo_stake_amount = int(algo_stake_amount)
+        if uctzar_stake_amount is None:
+            uctzar_stake_amount = self.pool.uctzar_for_deposit(algo_stake_amount)
+        uctzar_stake_amount = int(uctzar_stake_amount)
+        # DEX tokens are minted in proportion to the share of the reserves this stake adds
+        dex_tokens = self.pool.mint(algo_stake_amount, uctzar_stake_amount)
+        return self._hold(PoolChange(algo_stake_amount, uctzar_stake_amount, dex_tokens), account.row, name=name,
+                          address=account["Account address"], algo=algo_stake_amount, uctzar=uctzar_stake_amount, dex_tokens=dex_tokens)
+
+    @_serialised
+    def _complete_stake(self, reservation, settled, record_contribution):
+        self._release(reservation, settled)
+        if not settled:
+            return
+        # Record the DEX tokens held by the staker
+        self.ledger.record(reservation.row)["DEX tokens"] += reservation.dex_tokens
+        if record_contribution:
+            self.update_contribution(reservation.name, additional_algo=reservation.algo, additional_uctzar=reservation.uctzar)
+
+    def _stake(self, name, algo_stake_amount, uctzar_stake_amount, staker_secret_phrase, dex_secret_phrase, record_contribution):
+        reservation = self._reserve_stake(name, algo_stake_amount, uctzar_stake_amount)
+        if reservation is None:
+            return False
+        stake_address = reservation.address
+        dex_address = self.dex_address
+        settled = False
+        try:
+            # Execute Algo payment
+            algo_payment(payer_address = stake_address, payer_secret_phrase = staker_secret_phrase, receiver_address = dex_address, amount = reservation.algo, comment = "Algo stake")
+
+            # Pay UCTZAR from the staker into the staking pool
+            asset_transfer(sender_address = stake_address, sender_secret_phrase = staker_secret_phrase, receiver_address = dex_address, receiver_secret_phrase = dex_secret_phrase, amount = reservation.uctzar, asset_code = UCTZAR_ASSET_ID, note = "UCTZAR stake")
+
+            # Pay some DEX tokens from the staking pool to the staker
+            asset_transfer(sender_address = dex_address , sender_secret_phrase = dex_secret_phrase, receiver_address = stake_address, receiver_secret_phrase = staker_secret_phrase , amount = reservation.dex_tokens, asset_code = DEX_TOKEN_ASSET_ID, note = "DEX tokens for stake")
+            settled = True
+        finally:
+            self._complete_stake(reservation, settled, record_contribution)
+
+        print(f"You have successfully made a contribution to the staking pool and received {reservation.dex_tokens} DEX tokens")
+        return True
+
+    @metrics.traced("stake_algo")
+    def stake_algo(self, name, algo_stake_amount, uctzar_stake_amount, staker_secret_phrase, dex_secret_phrase):
+        """Stake Algos and UCTZAR into the pool and pay out DEX tokens in proportion to the reserves. Returns True on success.
+
+        staker_secret_phrase authorises the staker's payments and dex_secret_phrase the Dex wallet's opt-in and DEX token payout.
+        """
+        return self._stake(name, algo_stake_amount, uctzar_stake_amount, staker_secret_phrase, dex_secret_phrase, record_contribution=False)
+
+    def withdrawal_amounts(self, name):
+        """Return (DEX tokens, MicroAlgos, UCTZAR) that withdrawing the named account's stake would move, or None if it cannot withdraw.
+
+        The DEX tokens pay out their share of the current reserves, plus the fees earned while staking.
+        """
+        account = self.get_account(name)
+        if account is None:
+            print(f"Error: Account '{name}' not found.")
+            return None
+        if account["Status"] != "Active":
+            print(f"Error: Account '{name}' is not active. Withdrawal aborted.")
+            return None
+
+        dex_tokens = int(account["DEX tokens"])
+        try:
+            algo_share, uctzar_share = self.pool.amounts_for_dex_tokens(dex_tokens)
+        except PoolError as e:
+            print(f"Error: {e} Withdrawal aborted.")
+            return None
+        return dex_tokens, algo_share + self.ledger.fee_income(account.row), uctzar_share
+
+    @_serialised
+    def _reserve_withdrawal(self, name):
+        amounts = self.withdrawal_amounts(name)
+        if amounts is None:
+            return None
+        row = self.ledger.row_by_name(name)
+        if not self._check_idle(name, row):
+            return None
+        dex_tokens, payout_algo, payout_uctzar = amounts
+        # Burn the DEX tokens against the reserves now, so nobody else is paid from the same share
+        algo_share, uctzar_share = self.pool.burn(dex_tokens)
+        return self._hold(PoolChange(-algo_share, -uctzar_share, -dex_tokens), row, address=self.ledger.addresses[row],
+                          dex_tokens=dex_tokens, algo=payout_algo, uctzar=payout_uctzar, fees=payout_algo - algo_share)
+
+    @_serialised
+    def _complete_withdrawal(self, reservation, settled):
+        self._release(reservation, settled)
+        if not settled:
+            return
+        # The stake and its fees have been paid out in full, so the staker leaves the pool and its position is
+        # cleared; a second withdrawal finds nothing to pay. Fees it earned while the payout was in flight were not
+        # paid to it, so they go to the remaining stakers.
+        late_fees = self.ledger.fee_income(reservation.row) - reservation.fees
+        self.ledger.close(reservation.row)
+        if late_fees > 0:
+            self.ledger.accrue_fee(late_fees)
+
+    @metrics.traced("withdraw_algo")
+    def withdraw_algo(self, name, staker_secret_phrase, dex_secret_phrase):
+        """Return the staker's DEX tokens to the pool and pay out their share of the reserves and fees. Returns True on success."""
+        reservation = self._reserve_withdrawal(name)
+        if reservation is None:
+            return False
+        print(f"Your {reservation.dex_tokens} DEX tokens will be exchanged for {reservation.algo} MicroAlgos (including fees earned) and {reservation.uctzar} UCTZAR.")
+
+        stake_address = reservation.address
+        dex_address = self.dex_address
+        settled = False
+        try:
+            # Pay the DEX tokens from the staker back into the staking pool
+            asset_transfer(sender_address = stake_address , sender_secret_phrase = staker_secret_phrase , receiver_address = dex_address , receiver_secret_phrase = dex_secret_phrase , amount = reservation.dex_tokens, asset_code = DEX_TOKEN_ASSET_ID, note = "DEX tokens returned")
+
+            # Pay Algos from Dex wallet to wallet of staker
+            algo_payment(payer_address = dex_address, payer_secret_phrase = dex_secret_phrase, receiver_address = stake_address, amount = reservation.algo, comment = "Algo stake withdrawal")
+
+            # Pay back the UCTZAR from the staking pool to the staker wallet
+            asset_transfer(sender_address = dex_address  , sender_secret_phrase = dex_secret_phrase , receiver_address = stake_address , receiver_secret_phrase = staker_secret_phrase  , amount = reservation.uctzar, asset_code = UCTZAR_ASSET_ID, note = "UCTZAR stake withdrawal")
+            settled = True
+        finally:
+            self._complete_withdrawal(reservation, settled)
+
+        print("You have successfully withdrawn your stake from the Dex pool.")
+        return True
+
+    @metrics.traced("onboard")
+    def onboard(self, name, address, algo_stake_amount, staker_secret_phrase, dex_secret_phrase, date=None):
+        """Add a new staker and make their first stake at the pool's current ratio, like the add account menu. Returns True on success."""
+        if date is None:
+            date = datetime.today().date().strftime("%Y-%m-%d")
+        if self.add_account(name, address, 0, 0, date) is None:
+            return False
+        return self.stake_additional(name, algo_stake_amount, staker_secret_phrase, dex_secret_phrase)
+
+    @metrics.traced("stake_additional")
+    def stake_additional(self, name, algo_stake_amount, staker_secret_phrase, dex_secret_phrase):
+        """Stake algo_stake_amount MicroAlgos plus UCTZAR at the pool's current ratio and record the contribution. Returns True on success."""
+        return self._stake(name, algo_stake_amount, None, staker_secret_phrase, dex_secret_phrase, record_contribution=True)
+
+    @metrics.traced("withdraw_stake")
+    def withdraw_stake(self, name, staker_secret_phrase, dex_secret_phrase):
+        """Withdraw the staker's whole stake and mark the account as having left the pool. Returns True on success."""
+        if not self.withdraw_algo(name, staker_secret_phrase, dex_secret_phrase):
+            return False
+        self.set_opt_out(name)
+        return True
+
+    def quote_buy_algo(self, purchase_algos):
+        """Price buying purchase_algos MicroAlgos with UCTZAR from the pool reserves. Returns None if the trade is refused."""
+        try:
+            quote = self.pool.quote_buy_algo(purchase_algos)
+        except PoolError as e:
+            print(f"Error: {e}")
+            return None
+        return self._check_price_impact(quote)
+
+    def quote_buy_uctzar(self, purchase_uctzar):
+        """Price buying purchase_uctzar UCTZAR with Algos from the pool reserves. Returns None if the trade is refused."""
+        try:
+            quote = self.pool.quote_buy_uctzar(purchase_uctzar)
+        except PoolError as e:
+            print(f"Error: {e}")
+            return None
+        return self._check_price_impact(quote)
+
+    def _check_price_impact(self, quote):
+        if quote.price_impact > MAX_PRICE_IMPACT:
+            print(f"Error: This trade would move the price by {quote.price_impact:.2%}, more than the {MAX_PRICE_IMPACT:.0%} allowed. Please try a smaller amount.")
+            return None
+        return quote
+
+    @_serialised
+    def _reserve_trade(self, quote, make_quote):
+        # Price the trade (or check a quote the buyer was shown) and apply it to the reserves
+        if quote is None:
+            quote = make_quote()
+            if quote is None:
+                return None
+        elif quote.pool_version != self.pool.version:
+            print("Error: The pool has changed since this quote was made. Please request a new quote.")
+            return None
+        return self._hold(self.pool.apply_quote(quote), quote=quote)
+
+    @_serialised
+    def _complete_trade(self, reservation, settled):
+        self._release(reservation, settled)
+        if settled:
+            # Add the transaction fee to the staking pool
+            self.distribute_transaction_fee(reservation.quote.fee)
+
+    @metrics.traced("buy_algo")
+    def buy_algo(self, purchase_algos, buyer_address, buyer_secret_phrase, dex_secret_phrase, atomic=True, quote=None):
+        """Buy purchase_algos MicroAlgos with UCTZAR and distribute the fee to the stakers. Returns the settled quote, or None.
+
+        quote is a quote from quote_buy_algo, e.g. one already shown to the buyer; a new one is made if it is not given.
+        With atomic=True all legs of the trade settle in a single transaction group.
+        """
+        reservation = self._reserve_trade(quote, lambda: self.quote_buy_algo(purchase_algos))
+        if reservation is None:
+            return None
+        quote = reservation.quote
+        dex_address = self.dex_address
+        settled = False
+        try:
+            if atomic:
+                # Settle the UCTZAR, Algo and fee legs together in one atomic group
+                settled = atomic_swap(buyer_address=buyer_address, buyer_secret_phrase=buyer_secret_phrase, dex_address=dex_address, dex_secret_phrase=dex_secret_phrase, algo_amount=quote.amount_out, uctzar_amount=quote.amount_in, tx_fee=quote.fee, buy_side="algo") is not None
+            else:
+                # Proceed with asset transfer and payments
+                asset_transfer(sender_address=buyer_address, sender_secret_phrase=buyer_secret_phrase, receiver_address=dex_address, receiver_secret_phrase=dex_secret_phrase, amount=quote.amount_in, asset_code=UCTZAR_ASSET_ID, note="UCTZAR payment for Algos purchased on Dex")
+
+                # Pay Algos from the Dex wallet to the buyer of UCTZAR
+                algo_payment(payer_address=dex_address, payer_secret_phrase=dex_secret_phrase, receiver_address=buyer_address, amount=quote.amount_out, comment="Algos purchased on the Dex")
+
+                # Pay transaction fee from buyer wallet to Dex wallet
+                algo_payment(payer_address=buyer_address, payer_secret_phrase=buyer_secret_phrase, receiver_address=dex_address, amount=quote.fee, comment="Algo purchase transaction fee")
+                settled = True
+        finally:
+            self._complete_trade(reservation, settled)
+        return quote if settled else None
+
+    @metrics.traced("buy_uctzar")
+    def buy_uctzar(self, purchase_uctzar, buyer_address, buyer_secret_phrase, dex_secret_phrase, atomic=True, quote=None):
+        """Buy purchase_uctzar UCTZAR with Algos and distribute the fee to the stakers. Returns the settled quote, or None.
+
+        quote is a quote from quote_buy_uctzar, e.g. one already shown to the buyer; a new one is made if it is not given.
+        With atomic=True all legs of the trade settle in a single transaction group.
+        """
+        reservation = self._reserve_trade(quote, lambda: self.quote_buy_uctzar(purchase_uctzar))
+        if reservation is None:
+            return None
+        quote = reservation.quote
+        dex_address = self.dex_address
+        settled = False
+        try:
+            if atomic:
+                # Settle the Algo, fee and UCTZAR legs together in one atomic group
+                settled = atomic_swap(buyer_address=buyer_address, buyer_secret_phrase=buyer_secret_phrase, dex_address=dex_address, dex_secret_phrase=dex_secret_phrase, algo_amount=quote.amount_in, uctzar_amount=quote.amount_out, tx_fee=quote.fee, buy_side="uctzar") is not None
+            else:
+                # Pay Algos from the buyer wallet to the Dex wallet
+                algo_payment(payer_address=buyer_address, payer_secret_phrase=buyer_secret_phrase, receiver_address=dex_address, amount=quote.amount_in, comment="Algo payment for UCTZAR purchased on Dex")
+
+                # Pay transaction fee from buyer wallet to Dex wallet
+                algo_payment(payer_address=buyer_address, payer_secret_phrase=buyer_secret_phrase, receiver_address=dex_address, amount=quote.fee, comment="UCTZAR purchase transaction fee")
+
+                # Transfer UCTZAR from the Dex address to the buyer address
+                asset_transfer(sender_address=dex_address, sender_secret_phrase=dex_secret_phrase, receiver_address=buyer_address, receiver_secret_phrase=buyer_secret_phrase, amount=quote.amount_out, asset_code=UCTZAR_ASSET_ID, note="UCTZAR purchased on the Dex")
+                settled = True
+        finally:
+            self._complete_trade(reservation, settled)
+        return quote if settled else None
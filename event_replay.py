@@ -0,0 +1,431 @@
+# Description - Rebuild the Dex staking pool and the stokvels from the notes of their on-chain transactions
+# Every transaction the Dex and the stokvels send carries a note ("Algo stake", "DEX tokens returned", "Algos
+# purchased on the Dex", "Stokvel payout", ...). The replay engine streams a JSON lines export of historical
+# transactions in the indexer's format, e.g. from an indexer dump or FakeAlgod.export_transactions(). It decodes
+# each note into a typed event and applies the events to a fresh AccountManager and one StokvelAccountManager per
+# multisig wallet, a chunk at a time. After every chunk it writes a checkpoint with the rebuilt state and the
+# position in the export. A later run resumes from the checkpoint, so recovery and audits only read the events
+# added since then.
+#
+# Staker and member names are not on chain. Accounts are named after their wallet address unless a names map is
+# given. Stokvel opt-outs are not on chain either, so every member is restored as opted in.
+# Usage - $ python event_replay.py transactions.jsonl --dex-address <address> --checkpoint replay_checkpoint.json
+
+import argparse
+import base64
+import json
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import dex_core
+import stokvel_core
+
+CHECKPOINT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class StakeDeposit:
+    round: int
+    txid: str
+    staker: str
+    algo: int = 0  # "Algo stake" payments
+    uctzar: int = 0  # "UCTZAR stake" transfers
+    time: int = None
+
+
+@dataclass(frozen=True)
+class DexTokensIssued:
+    round: int
+    txid: str
+    staker: str
+    tokens: int
+
+
+@dataclass(frozen=True)
+class DexTokensReturned:
+    round: int
+    txid: str
+    staker: str
+    tokens: int
+
+
+@dataclass(frozen=True)
+class StakeWithdrawal:
+    round: int
+    txid: str
+    staker: str
+    algo: int = 0  # the Algo share of the reserves plus the fees earned
+    uctzar: int = 0
+
+
+@dataclass(frozen=True)
+class SwapFlow:
+    # One leg of a swap, seen from the pool: what it received and paid out. Routed and batch trades included.
+    round: int
+    txid: str
+    algo_in: int = 0
+    algo_out: int = 0
+    uctzar_in: int = 0
+    uctzar_out: int = 0
+
+
+@dataclass(frozen=True)
+class SwapFee:
+    round: int
+    txid: str
+    fee: int
+
+
+@dataclass(frozen=True)
+class StokvelContribution:
+    round: int
+    txid: str
+    stokvel: str  # the multisig wallet address
+    member: str
+    amount: int
+    time: int = None
+
+
+@dataclass(frozen=True)
+class StokvelPayout:
+    round: int
+    txid: str
+    stokvel: str
+    receiver: str
+    amount: int
+    time: int = None
+
+
+# Batch auction and routed legs net the fee into one payment, so their notes carry it
+SWAP_FEE_NOTE = re.compile(r"^(?:Batch auction (?:Algos purchased|Algo payment for UCTZAR)|Routed swap on the Dex), fee (\d+)$")
+
+
+def decode_note(txn):
+    """Return the note of an indexer transaction as text, or None if it has no readable note."""
+    note = txn.get("note")
+    if not note:
+        return None
+    try:
+        return base64.b64decode(note).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def decode_events(txn, dex_address, stokvel_addresses=None):
+    """Decode one indexer transaction into a list of events, which is empty if it is not a Dex or stokvel transaction.
+
+    Dex events must be sent to or from dex_address. Stokvel events are kept for every multisig wallet, or only for
+    those in stokvel_addresses if it is given.
+    """
+    events = _decode(txn, dex_address, stokvel_addresses)
+    if events is None:
+        return []
+    return events if isinstance(events, list) else [events]
+
+
+def _decode(txn, dex_address, stokvel_addresses):
+    note = decode_note(txn)
+    if note is None:
+        return None
+    transfer = txn.get("payment-transaction") or txn.get("asset-transfer-transaction")
+    if transfer is None:
+        return None
+    sender, receiver, amount = txn["sender"], transfer["receiver"], int(transfer["amount"])
+    asset_id = txn.get("asset-transfer-transaction", {}).get("asset-id")
+    is_uctzar = asset_id == dex_core.UCTZAR_ASSET_ID
+    ref = {"round": txn["confirmed-round"], "txid": txn["id"]}
+
+    if note.startswith("Stokvel "):
+        stokvel = receiver if note == "Stokvel contribution" else sender
+        if stokvel_addresses is not None and stokvel not in stokvel_addresses:
+            return None
+        if note == "Stokvel contribution":
+            return StokvelContribution(stokvel=receiver, member=sender, amount=amount, time=txn.get("round-time"), **ref)
+        if note == "Stokvel payout":
+            return StokvelPayout(stokvel=sender, receiver=receiver, amount=amount, time=txn.get("round-time"), **ref)
+        return None
+
+    if dex_address not in (sender, receiver):
+        return None
+    incoming = receiver == dex_address
+    if note == "Algo stake" and incoming:
+        return StakeDeposit(staker=sender, algo=amount, time=txn.get("round-time"), **ref)
+    if note == "UCTZAR stake" and incoming and is_uctzar:
+        return StakeDeposit(staker=sender, uctzar=amount, time=txn.get("round-time"), **ref)
+    if note == "DEX tokens for stake" and not incoming:
+        return DexTokensIssued(staker=receiver, tokens=amount, **ref)
+    if note == "DEX tokens returned" and incoming:
+        return DexTokensReturned(staker=sender, tokens=amount, **ref)
+    if note == "Algo stake withdrawal" and not incoming:
+        return StakeWithdrawal(staker=receiver, algo=amount, **ref)
+    if note == "UCTZAR stake withdrawal" and not incoming and is_uctzar:
+        return StakeWithdrawal(staker=receiver, uctzar=amount, **ref)
+    if note in ("Algo purchase transaction fee", "UCTZAR purchase transaction fee") and incoming:
+        return SwapFee(fee=amount, **ref)
+
+    swap_fee = SWAP_FEE_NOTE.match(note)
+    if swap_fee is not None:
+        # Batch auction and routed legs net the fee into the amount: the pool moves by the amount less the fee
+        # coming in, or the amount plus the fee going out. The fee stays in the Dex wallet and goes to the stakers.
+        fee = int(swap_fee.group(1))
+        if incoming:
+            return [SwapFlow(algo_in=amount - fee, **ref), SwapFee(fee=fee, **ref)]
+        return [SwapFlow(algo_out=amount + fee, **ref), SwapFee(fee=fee, **ref)]
+
+    if note in ("Algos purchased on the Dex", "Algo payment for UCTZAR purchased on Dex", "UCTZAR purchased on the Dex",
+                "UCTZAR payment for Algos purchased on Dex", "Batch auction UCTZAR purchased", "Batch auction UCTZAR payment for Algos",
+                "Routed swap on the Dex"):
+        if asset_id is None:
+            return SwapFlow(algo_in=amount, **ref) if incoming else SwapFlow(algo_out=amount, **ref)
+        if is_uctzar:
+            return SwapFlow(uctzar_in=amount, **ref) if incoming else SwapFlow(uctzar_out=amount, **ref)
+    return None
+
+
+def read_export(path, offset=0, chunk_size=1000):
+    """Yield chunks of (line start, line length, transaction) from a JSON lines export, starting at byte offset."""
+    chunk = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        position = offset
+        for line in f:
+            if not line.endswith(b"\n"):
+                # The exporter is still writing this line; it is read on the next run
+                break
+            if line.strip():
+                chunk.append((position, len(line), json.loads(line)))
+            position += len(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _date_of(round_time):
+    if round_time is None:
+        return datetime.today().date()
+    return datetime.fromtimestamp(round_time, timezone.utc).date()
+
+
+class ReplayEngine:
+    def __init__(self, dex_address=dex_core.DEX_ADDRESS, stokvel_addresses=None, names=None, checkpoint_path=None, chunk_size=1000):
+        """Create an engine that rebuilds the pool of dex_address and the stokvels whose payments it reads.
+
+        names maps wallet addresses to account names. With checkpoint_path the engine resumes from that checkpoint,
+        if it exists, and writes a new one after every chunk of chunk_size transactions.
+        """
+        self.dex_address = dex_address
+        self.stokvel_addresses = None if stokvel_addresses is None else set(stokvel_addresses)
+        self.names = names or {}
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.manager = dex_core.AccountManager(dex_address=dex_address)
+        self.stokvels = {}  # multisig address -> StokvelAccountManager
+        self._open_contributions = {}  # multisig address -> members in the contribution round that is still open
+        self.source = None
+        self.offset = 0  # byte offset in the export just after the last applied transaction
+        self.last_line = None  # (start, length, txid) of the last applied transaction, to check the export on resume
+        self.last_round = None
+        self.counts = Counter()  # events applied per type
+
+    # Applying events
+
+    def apply(self, event):
+        """Apply one event to the rebuilt state."""
+        self.counts[type(event).__name__] += 1
+        ledger, pool = self.manager.ledger, self.manager.pool
+        if isinstance(event, StakeDeposit):
+            row = ledger.row_by_address(event.staker)
+            if row is None:
+                row = ledger.append(self.names.get(event.staker, event.staker), event.staker, 0, 0, _date_of(event.time))
+            if event.algo:
+                # As update_contribution: the stake buys pool units at the current fee index
+                ledger.deposit(row, event.algo)
+                ledger.deposited_algo[row] += event.algo
+            ledger.uctzar[row] += event.uctzar
+            pool.apply_flows(event.algo, 0, event.uctzar, 0)
+        elif isinstance(event, DexTokensIssued):
+            row = ledger.row_by_address(event.staker)
+            if row is not None:
+                ledger.dex_tokens[row] += event.tokens
+            pool.dex_token_supply += event.tokens
+        elif isinstance(event, DexTokensReturned):
+            row = ledger.row_by_address(event.staker)
+            if row is not None:
+                ledger.dex_tokens[row] -= event.tokens
+            pool.dex_token_supply -= event.tokens
+        elif isinstance(event, StakeWithdrawal):
+            row = ledger.row_by_address(event.staker)
+            algo_share = event.algo
+            if row is not None and event.algo:
+                # The payout is the reserve share plus the fees earned; only the share leaves the reserves.
+                # The staker's position is closed with the Algo leg, as in withdraw_algo.
+                algo_share -= ledger.fee_income(row)
+            pool.apply_flows(0, algo_share, 0, event.uctzar)
+            if row is not None and event.algo:
+                ledger.close(row)
+        elif isinstance(event, SwapFlow):
+            pool.apply_flows(event.algo_in, event.algo_out, event.uctzar_in, event.uctzar_out)
+        elif isinstance(event, SwapFee):
+            ledger.accrue_fee(event.fee)
+        elif isinstance(event, StokvelContribution):
+            self._apply_contribution(event)
+        elif isinstance(event, StokvelPayout):
+            self._apply_payout(event)
+
+    def _stokvel(self, address):
+        stokvel = self.stokvels.get(address)
+        if stokvel is None:
+            stokvel = self.stokvels[address] = stokvel_core.StokvelAccountManager([])
+            stokvel.multisig_address = address
+            self._open_contributions[address] = []
+        return stokvel
+
+    def _apply_contribution(self, event):
+        stokvel = self._stokvel(event.stokvel)
+        day = _date_of(event.time).day
+        account = next((account for account in stokvel.accounts_list if account["Account address"] == event.member), None)
+        if account is None:
+            account = stokvel_core.Account(self.names.get(event.member, event.member), event.member, event.amount, str(day), str(day + 1)).get_account_data()
+            stokvel.accounts_list.append(account)
+        account["Contribution amount"] = event.amount
+
+        # Contributions are grouped into monthly rounds like the history of a live stokvel: a round closes at a
+        # payout, or when a member who already paid into it pays again
+        members = self._open_contributions[event.stokvel]
+        if not members or event.member in members:
+            members.clear()
+            stokvel.history.append({"type": "contribution", "date": _date_of(event.time).isoformat(), "round": event.round, "txids": [], "amount": 0})
+        entry = stokvel.history[-1]
+        members.append(event.member)
+        entry["round"] = event.round
+        entry["txids"].append(event.txid)
+        entry["amount"] += event.amount
+
+    def _apply_payout(self, event):
+        stokvel = self._stokvel(event.stokvel)
+        self._open_contributions[event.stokvel].clear()
+        # As choose_payout_account: once every member has been paid, a new cycle starts
+        if stokvel.accounts_list and all(account["Account address"] in stokvel.payout_tracker for account in stokvel.accounts_list):
+            stokvel.payout_tracker.clear()
+        stokvel.payout_tracker.add(event.receiver)
+        stokvel.history.append({"type": "payout", "date": _date_of(event.time).isoformat(), "round": event.round, "txid": event.txid, "receiver": event.receiver, "amount": event.amount})
+
+    # Streaming
+
+    def replay(self, path):
+        """Apply every transaction in the export at path after the checkpoint and return a summary of the run."""
+        started = time.perf_counter()
+        if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+            self.load_checkpoint(path)
+        self.source = os.path.abspath(path)
+
+        applied = read = 0
+        for chunk in read_export(path, self.offset, self.chunk_size):
+            for start, length, txn in chunk:
+                for event in decode_events(txn, self.dex_address, self.stokvel_addresses):
+                    self.apply(event)
+                    applied += 1
+                self.last_line = (start, length, txn["id"])
+                self.last_round = txn["confirmed-round"]
+                self.offset = start + length
+            read += len(chunk)
+            if self.checkpoint_path is not None:
+                self.save_checkpoint()
+
+        return {
+            "transactions read": read,
+            "events applied": applied,
+            "last round": self.last_round,
+            "seconds": time.perf_counter() - started,
+            "stakers": len(self.manager.ledger),
+            "active stakers": self.manager.ledger.active_count,
+            "stokvels": len(self.stokvels),
+        }
+
+    # Checkpoints
+
+    def checkpoint(self):
+        """Return the rebuilt state and the position in the export as plain data."""
+        return {
+            "version": CHECKPOINT_VERSION,
+            "source": self.source,
+            "offset": self.offset,
+            "last_line": self.last_line,
+            "last_round": self.last_round,
+            "counts": dict(self.counts),
+            "dex_address": self.dex_address,
+            "dex": self.manager.state_image(),
+            "stokvels": {address: stokvel.state_image() for address, stokvel in self.stokvels.items()},
+            "open_contributions": self._open_contributions,
+        }
+
+    def save_checkpoint(self):
+        """Write the checkpoint to checkpoint_path. The file is replaced atomically."""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint(), f, separators=(",", ":"))
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self, path):
+        """Resume from checkpoint_path, unless it was written for another export or the export has changed since."""
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint["dex_address"] != self.dex_address or checkpoint["source"] != os.path.abspath(path):
+            print(f"Warning: the checkpoint {self.checkpoint_path} was written for another export. Replaying from the start.")
+            return False
+        if checkpoint["last_line"] is not None:
+            start, length, txid = checkpoint["last_line"]
+            with open(path, "rb") as f:
+                f.seek(start)
+                line = f.read(length)
+            try:
+                matches = json.loads(line)["id"] == txid
+            except ValueError:
+                matches = False
+            if not matches:
+                print(f"Warning: the export {path} no longer matches the checkpoint. Replaying from the start.")
+                return False
+
+        self.manager.load_state(checkpoint["dex"])
+        for address, image in checkpoint["stokvels"].items():
+            stokvel = stokvel_core.StokvelAccountManager([])
+            stokvel.load_state(image)
+            self.stokvels[address] = stokvel
+        self._open_contributions = {address: list(members) for address, members in checkpoint["open_contributions"].items()}
+        self.offset = checkpoint["offset"]
+        self.last_line = tuple(checkpoint["last_line"]) if checkpoint["last_line"] is not None else None
+        self.last_round = checkpoint["last_round"]
+        self.counts = Counter(checkpoint["counts"])
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the Dex staking pool and the stokvels from an export of their transactions.")
+    parser.add_argument("export", help="JSON lines file of transactions in the indexer's format")
+    parser.add_argument("--dex-address", default=dex_core.DEX_ADDRESS, help="wallet that holds the pool's reserves")
+    parser.add_argument("--stokvel", action="append", dest="stokvels", help="multisig wallet of a stokvel to rebuild (default: all)")
+    parser.add_argument("--names", help="JSON file mapping wallet addresses to account names")
+    parser.add_argument("--checkpoint", help="checkpoint file to resume from and update")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="transactions applied between checkpoints")
+    args = parser.parse_args()
+
+    names = None
+    if args.names:
+        with open(args.names) as f:
+            names = json.load(f)
+    engine = ReplayEngine(args.dex_address, args.stokvels, names, args.checkpoint, args.chunk_size)
+    summary = engine.replay(args.export)
+    summary["events by type"] = dict(engine.counts)
+    pool = engine.manager.pool
+    summary["pool"] = {"algo reserve": pool.algo_reserve, "uctzar reserve": pool.uctzar_reserve, "dex token supply": pool.dex_token_supply}
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+# Description - In-process stand-in for algod, for benchmarking and testing the Dex and stokvel offline
+# FakeAlgod implements the algod calls these scripts use (suggested params, sending single transactions and groups,
+# pending transaction info, status, block transaction IDs, account and asset lookups) on top of a real ledger of
+# balances and asset holdings. It checks signatures, multisig thresholds, opt-ins, minimum balances, fees, group IDs
+# and validity windows the way algod does, and simulates block times and per-call network latency.
+# Use it with algod_context.configure(algod_client=FakeAlgod(...)). export_transactions() stands in for the indexer.
+
+import base64
+import copy
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from algosdk import constants, encoding, transaction
+from algosdk.error import AlgodHTTPError
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+MIN_BALANCE = 100000  # MicroAlgos every account must keep, plus this much again for each asset it holds
+MIN_FEE = 1000
+
+
+class FakeAlgod:
+    def __init__(self, block_time=0.0, latency=0.0, jitter=0.0, max_block_txns=None, verify_signatures=True, start_round=1000, seed=None):
+        """Create an empty ledger.
+
+        block_time is the number of seconds per round. With 0, a block is closed as soon as somebody waits for one,
+        so every transaction submitted before the wait is confirmed in the next round without any delay.
+        latency is the simulated network round trip of every call in seconds, varied by up to +/- jitter (a fraction).
+        max_block_txns caps how many transactions fit in one block; the rest wait for the following blocks. An atomic
+        group is never split across blocks, so a block holds fewer transactions if the next group would not fit.
+        verify_signatures=False skips the signature checks, which dominate the cost of large benchmarks.
+        """
+        self.block_time = block_time
+        self.latency = latency
+        self.jitter = jitter
+        self.max_block_txns = max_block_txns
+        self.verify_signatures = verify_signatures
+        self.genesis_id = "fakenet-v1"
+        self.genesis_hash = base64.b64encode(b"fake algod genesis hash".ljust(32, b"\0")).decode()
+        self.calls = Counter()  # number of calls per algod method, i.e. network round trips
+
+        self.round = start_round
+        self.balances = {}  # address -> MicroAlgos
+        self.holdings = {}  # address -> {asset id: amount}, one entry per opted-in asset
+        self.auth = {}  # address -> address that signs for it, for rekeyed accounts
+        self.assets = {}  # asset id -> asset params
+        self.blocks = {}  # round -> txids confirmed in that round
+        self.block_times = {}  # round -> Unix time the block was closed
+        self._txns = {}  # txid -> pending transaction info
+        self._pool = []  # groups of txids submitted but not in a block yet, one list per submission
+        self._next_asset_id = 1000000
+        self._next_block_at = time.monotonic() + block_time
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+    # Ledger set-up
+
+    def fund(self, address, amount):
+        """Credit amount MicroAlgos to address, like the testnet dispenser."""
+        with self._lock:
+            self.balances[address] = self.balances.get(address, 0) + int(amount)
+
+    def create_asset(self, creator, total, name, unit_name, decimals=0, asset_id=None):
+        """Create an asset held in full by creator and return its id."""
+        with self._lock:
+            if asset_id is None:
+                asset_id = self._next_asset_id
+                self._next_asset_id += 1
+            asset_id = int(asset_id)
+            if asset_id in self.assets:
+                raise ValueError(f"Asset {asset_id} already exists")
+            self.assets[asset_id] = {
+                "creator": creator,
+                "total": int(total),
+                "decimals": int(decimals),
+                "name": name,
+                "unit-name": unit_name,
+                "default-frozen": False,
+            }
+            self.holdings.setdefault(creator, {})[asset_id] = int(total)
+            return asset_id
+
+    def opt_in(self, address, asset_id):
+        """Opt address in to asset_id directly, without a transaction."""
+        with self._lock:
+            self._require_asset(asset_id)
+            self.holdings.setdefault(address, {}).setdefault(int(asset_id), 0)
+
+    def balance(self, address, asset_id=None):
+        """Return the MicroAlgos of address, or its holding of asset_id (None if not opted in)."""
+        with self._lock:
+            if asset_id is None:
+                return self.balances.get(address, 0)
+            return self.holdings.get(address, {}).get(int(asset_id))
+
+    def min_balance(self, address):
+        return MIN_BALANCE * (1 + len(self.holdings.get(address, {})))
+
+    def export_transactions(self, path, addresses=None, min_round=None):
+        """Append the confirmed transactions from min_round on to path as JSON lines in the indexer's format, oldest first.
+
+        Only transactions sent or received by one of addresses are written, if addresses is given.
+        Returns the last round written, so the next export can continue from the round after it.
+        """
+        with self._lock:
+            self._advance()
+            addresses = None if addresses is None else set(addresses)
+            last_round = None
+            with open(path, "a") as f:
+                for block_round in sorted(self.blocks):
+                    if min_round is not None and block_round < min_round:
+                        continue
+                    for offset, txid in enumerate(self.blocks[block_round]):
+                        record = _indexer_record(txid, self._txns[txid]["txn"]["txn"], block_round, offset, self.block_times.get(block_round))
+                        receiver = (record.get("payment-transaction") or record.get("asset-transfer-transaction") or {}).get("receiver")
+                        if addresses is None or record["sender"] in addresses or receiver in addresses:
+                            f.write(json.dumps(record) + "\n")
+                    last_round = block_round
+            return last_round
+
+    # algod API
+
+    def suggested_params(self):
+        self._call("suggested_params")
+        with self._lock:
+            self._advance()
+            return transaction.SuggestedParams(
+                fee=0,
+                first=self.round,
+                last=self.round + 1000,
+                gh=self.genesis_hash,
+                gen=self.genesis_id,
+                flat_fee=False,
+                consensus_version="future",
+                min_fee=MIN_FEE,
+            )
+
+    def status(self):
+        self._call("status")
+        with self._lock:
+            self._advance()
+            return self._status()
+
+    def status_after_block(self, block_num):
+        """Return the status once a round after block_num exists, waiting for the next block if needed."""
+        self._call("status_after_block")
+        while True:
+            with self._lock:
+                self._advance()
+                if self.round > block_num:
+                    return self._status()
+                if self.block_time <= 0:
+                    # Blocks close on demand: commit the pool now
+                    self._close_block()
+                    return self._status()
+                wait = self._next_block_at - time.monotonic()
+            time.sleep(max(wait, 0.0005))
+
+    def send_transaction(self, txn):
+        """Submit one signed transaction and return its txid."""
+        self._call("send_transaction")
+        return self._submit([txn])
+
+    def send_transactions(self, txns):
+        """Submit a signed atomic group and return the txid of its first transaction."""
+        self._call("send_transactions")
+        return self._submit(list(txns))
+
+    def pending_transaction_info(self, txid):
+        self._call("pending_transaction_info")
+        with self._lock:
+            self._advance()
+            info = self._txns.get(txid)
+            if info is None:
+                raise AlgodHTTPError("txn does not exist", 404)
+            return dict(info)
+
+    def get_block_txids(self, block_num):
+        self._call("get_block_txids")
+        with self._lock:
+            self._advance()
+            if block_num > self.round:
+                raise AlgodHTTPError(f"failed to retrieve information from the ledger: round {block_num} is not available", 404)
+            return {"blockTxids": list(self.blocks.get(block_num, []))}
+
+    def asset_info(self, asset_id):
+        self._call("asset_info")
+        with self._lock:
+            params = self.assets.get(int(asset_id))
+            if params is None:
+                raise AlgodHTTPError("asset does not exist", 404)
+            return {"index": int(asset_id), "params": dict(params)}
+
+    def account_info(self, address):
+        self._call("account_info")
+        with self._lock:
+            self._advance()
+            assets = [{"asset-id": asset_id, "amount": amount, "is-frozen": False} for asset_id, amount in self.holdings.get(address, {}).items()]
+            return {
+                "address": address,
+                "amount": self.balances.get(address, 0),
+                "min-balance": self.min_balance(address),
+                "assets": assets,
+                "auth-addr": self.auth.get(address),
+                "round": self.round,
+            }
+
+    def account_asset_info(self, address, asset_id):
+        self._call("account_asset_info")
+        with self._lock:
+            amount = self.holdings.get(address, {}).get(int(asset_id))
+            if amount is None:
+                raise AlgodHTTPError("account asset info not found", 404)
+            return {"asset-holding": {"asset-id": int(asset_id), "amount": amount, "is-frozen": False}, "round": self.round}
+
+    # Internals
+
+    def _call(self, method):
+        # Count the round trip under the lock, and spend the simulated network latency outside it
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency > 0:
+            delay = self.latency
+            if self.jitter:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+            time.sleep(max(delay, 0))
+
+    def _status(self):
+        return {"last-round": self.round, "time-since-last-round": 0, "catchup-time": 0}
+
+    def _advance(self):
+        # Close every block whose time has come
+        if self.block_time <= 0:
+            return
+        now = time.monotonic()
+        while now >= self._next_block_at:
+            self._close_block()
+            self._next_block_at += self.block_time
+
+    def _close_block(self):
+        self.round += 1
+        # Take whole groups, in submission order, while they fit; a group larger than the cap still gets a block of its own
+        taken, size = 0, 0
+        for group in self._pool:
+            if self.max_block_txns is not None and taken and size + len(group) > self.max_block_txns:
+                break
+            taken += 1
+            size += len(group)
+        confirmed = [txid for group in self._pool[:taken] for txid in group]
+        self._pool = self._pool[taken:]
+        self.blocks[self.round] = confirmed
+        self.block_times[self.round] = int(time.time())
+        for txid in confirmed:
+            self._txns[txid]["confirmed-round"] = self.round
+
+    def _submit(self, signed_txns):
+        if not signed_txns:
+            raise AlgodHTTPError("empty transaction group", 400)
+        with self._lock:
+            self._advance()
+            txids = [stx.get_txid() for stx in signed_txns]
+            for txid in txids:
+                if txid in self._txns:
+                    raise AlgodHTTPError(f"transaction already in ledger: {txid}", 400)
+            self._check_group([stx.transaction for stx in signed_txns])
+            for stx in signed_txns:
+                self._check_signature(stx)
+
+            # Apply the group to the ledger as soon as it is accepted, like algod's speculative pool;
+            # if any transaction fails, every change made by the group is rolled back
+            undo = []
+            try:
+                for stx in signed_txns:
+                    self._apply(stx.transaction, undo)
+                for address in {entry[1] for entry in undo if entry[0] == "algo"}:
+                    balance = self.balances.get(address, 0)
+                    if 0 < balance < self.min_balance(address) or (balance == 0 and self.holdings.get(address)):
+                        raise AlgodHTTPError(f"account {address} balance {balance} below min {self.min_balance(address)}", 400)
+            except AlgodHTTPError:
+                self._rollback(undo)
+                raise
+
+            for txid, stx in zip(txids, signed_txns):
+                self._txns[txid] = {"pool-error": "", "txn": _jsonable(stx.dictify())}
+            self._pool.append(txids)
+            return txids[0]
+
+    def _check_group(self, txns):
+        if len(txns) > constants.tx_group_limit:
+            raise AlgodHTTPError(f"group size {len(txns)} exceeds maximum {constants.tx_group_limit}", 400)
+        fees = 0
+        for txn in txns:
+            if txn.genesis_hash != self.genesis_hash:
+                raise AlgodHTTPError("txn has the wrong genesis hash", 400)
+            if not txn.first_valid_round <= self.round + 1 <= txn.last_valid_round:
+                raise AlgodHTTPError(f"txn dead: round {self.round + 1} outside of {txn.first_valid_round}--{txn.last_valid_round}", 400)
+            fees += txn.fee
+        if fees < MIN_FEE * len(txns):
+            raise AlgodHTTPError(f"transaction group had fee {fees}, which is less than the minimum {MIN_FEE * len(txns)}", 400)
+        if len(txns) > 1:
+            unsigned = []
+            for txn in txns:
+                txn = copy.copy(txn)
+                txn.group = None
+                unsigned.append(txn)
+            group_id = transaction.calculate_group_id(unsigned)
+            if any(txn.group != group_id for txn in txns):
+                raise AlgodHTTPError("transactionGroup: incomplete group or wrong group id", 400)
+        elif txns[0].group:
+            raise AlgodHTTPError("transactionGroup: incomplete group", 400)
+
+    def _check_signature(self, stx):
+        txn = stx.transaction
+        signer = self.auth.get(txn.sender, txn.sender)
+        message = constants.txid_prefix + base64.b64decode(encoding.msgpack_encode(txn))
+        if isinstance(stx, transaction.MultisigTransaction):
+            msig = stx.multisig
+            if msig.address() != signer:
+                raise AlgodHTTPError(f"multisig address does not match the authorizer {signer}", 400)
+            signed = [subsig for subsig in msig.subsigs if subsig.signature]
+            if len(signed) < msig.threshold:
+                raise AlgodHTTPError(f"multisig has {len(signed)} signatures, but its threshold is {msig.threshold}", 400)
+            if self.verify_signatures:
+                for subsig in signed:
+                    self._verify(subsig.public_key, subsig.signature, message)
+            return
+        if not isinstance(stx, transaction.SignedTransaction) or not stx.signature:
+            raise AlgodHTTPError("transaction is not signed", 400)
+        if (stx.authorizing_address or txn.sender) != signer:
+            raise AlgodHTTPError(f"should have been authorized by {signer}", 400)
+        if self.verify_signatures:
+            self._verify(encoding.decode_address(signer), stx.signature, message)
+
+    @staticmethod
+    def _verify(public_key, signature, message):
+        if isinstance(signature, str):
+            signature = base64.b64decode(signature)
+        try:
+            VerifyKey(public_key).verify(message, signature)
+        except BadSignatureError:
+            raise AlgodHTTPError("signature validation failed", 400)
+
+    def _require_asset(self, asset_id):
+        if int(asset_id) not in self.assets:
+            raise AlgodHTTPError(f"asset {asset_id} does not exist or has been deleted", 400)
+
+    def _set_algo(self, address, amount, undo):
+        undo.append(("algo", address, self.balances.get(address)))
+        self.balances[address] = amount
+
+    def _set_holding(self, address, asset_id, amount, undo):
+        undo.append(("asset", address, asset_id, self.holdings.get(address, {}).get(asset_id)))
+        held = self.holdings.setdefault(address, {})
+        if amount is None:
+            held.pop(asset_id, None)
+        else:
+            held[asset_id] = amount
+
+    def _rollback(self, undo):
+        for entry in reversed(undo):
+            if entry[0] == "algo":
+                _, address, previous = entry
+                if previous is None:
+                    self.balances.pop(address, None)
+                else:
+                    self.balances[address] = previous
+            elif entry[0] == "asset":
+                _, address, asset_id, previous = entry
+                held = self.holdings.setdefault(address, {})
+                if previous is None:
+                    held.pop(asset_id, None)
+                else:
+                    held[asset_id] = previous
+            else:
+                _, address, previous = entry
+                if previous is None:
+                    self.auth.pop(address, None)
+                else:
+                    self.auth[address] = previous
+
+    def _debit(self, address, amount, undo):
+        balance = self.balances.get(address, 0)
+        if balance < amount:
+            raise AlgodHTTPError(f"overspend (account {address}, data {{_struct:{{}} Status:Offline MicroAlgos:{{Raw:{balance}}}}}, tried to spend {{{amount}}})", 400)
+        self._set_algo(address, balance - amount, undo)
+
+    def _apply(self, txn, undo):
+        sender = txn.sender
+        self._debit(sender, txn.fee, undo)
+
+        if txn.type == constants.payment_txn:
+            self._debit(sender, txn.amt, undo)
+            self._set_algo(txn.receiver, self.balances.get(txn.receiver, 0) + txn.amt, undo)
+            if txn.close_remainder_to:
+                if self.holdings.get(sender):
+                    raise AlgodHTTPError(f"cannot close account {sender} while it holds assets", 400)
+                remainder = self.balances.get(sender, 0)
+                self._set_algo(txn.close_remainder_to, self.balances.get(txn.close_remainder_to, 0) + remainder, undo)
+                self._set_algo(sender, 0, undo)
+
+        elif txn.type == constants.assettransfer_txn:
+            asset_id = int(txn.index)
+            self._require_asset(asset_id)
+            sender_holdings = self.holdings.get(sender, {})
+            if txn.receiver == sender and txn.amount == 0 and asset_id not in sender_holdings:
+                # An opt-in: a zero transfer to oneself
+                self._set_holding(sender, asset_id, 0, undo)
+                self._set_algo(sender, self.balances.get(sender, 0), undo)  # re-checked against the higher minimum balance
+            else:
+                if asset_id not in sender_holdings:
+                    raise AlgodHTTPError(f"asset {asset_id} missing from {sender}", 400)
+                if asset_id not in self.holdings.get(txn.receiver, {}):
+                    raise AlgodHTTPError(f"receiver error: must optin, asset {asset_id} missing from {txn.receiver}", 400)
+                if sender_holdings[asset_id] < txn.amount:
+                    raise AlgodHTTPError(f"underflow on subtracting {txn.amount} from sender amount {sender_holdings[asset_id]}", 400)
+                self._set_holding(sender, asset_id, sender_holdings[asset_id] - txn.amount, undo)
+                self._set_holding(txn.receiver, asset_id, self.holdings[txn.receiver][asset_id] + txn.amount, undo)
+                if txn.close_assets_to:
+                    if asset_id not in self.holdings.get(txn.close_assets_to, {}):
+                        raise AlgodHTTPError(f"receiver error: must optin, asset {asset_id} missing from {txn.close_assets_to}", 400)
+                    remainder = self.holdings[sender][asset_id]
+                    self._set_holding(txn.close_assets_to, asset_id, self.holdings[txn.close_assets_to][asset_id] + remainder, undo)
+                    self._set_holding(sender, asset_id, None, undo)
+                    self._set_algo(sender, self.balances.get(sender, 0), undo)
+
+        else:
+            raise AlgodHTTPError(f"transaction type {txn.type} is not supported by the fake ledger", 400)
+
+        if txn.rekey_to:
+            undo.append(("auth", sender, self.auth.get(sender)))
+            if txn.rekey_to == sender:
+                self.auth.pop(sender, None)
+            else:
+                self.auth[sender] = txn.rekey_to
+
+
+def _indexer_record(txid, txn, confirmed_round, offset, round_time):
+    # Convert a transaction in algod's JSON form (base64 addresses, short keys) to the indexer's transaction format
+    def address(key):
+        return encoding.encode_address(base64.b64decode(txn[key])) if key in txn else None
+
+    record = {
+        "id": txid,
+        "confirmed-round": confirmed_round,
+        "intra-round-offset": offset,
+        "round-time": round_time,
+        "tx-type": txn["type"],
+        "sender": address("snd"),
+        "fee": txn.get("fee", 0),
+        "note": txn.get("note"),
+        "group": txn.get("grp"),
+    }
+    if txn["type"] == "pay":
+        record["payment-transaction"] = {"receiver": address("rcv"), "amount": txn.get("amt", 0)}
+    elif txn["type"] == "axfer":
+        record["asset-transfer-transaction"] = {"receiver": address("arcv"), "amount": txn.get("aamt", 0), "asset-id": txn.get("xaid")}
+    return record
+
+
+def _jsonable(value):
+    # Render a transaction dict the way algod's JSON API does: bytes as base64 strings
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    return value
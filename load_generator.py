@@ -0,0 +1,303 @@
+# Description - Synthetic trader load generator for the Dex
+# Simulated stakers and traders arrive at a configurable rate (Poisson arrivals) and run a configurable mix of the
+# headless add account, stake additional, withdraw stake, buy Algo and buy UCTZAR operations concurrently against the
+# in-process FakeAlgod ledger. The AccountManager only holds its lock to reserve and complete each operation, so up to
+# --concurrency operations sign, submit and wait for confirmation at the same time. The report gives the sustained
+# operations per second, p50/p99/p999 latency per operation and where the time went: queueing for a worker and for the
+# pool, signing, submitting to algod, waiting for confirmation and the rest. Latency is measured from each operation's
+# scheduled arrival.
+# Usage - $ python load_generator.py --rate 50 --duration 30 --mix buy_algo=3 buy_uctzar=3 stake_additional=2 add_account=1 withdraw_stake=1
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import algod_context
+import dex_core
+from fake_algod import FakeAlgod
+
+OPERATIONS = ["add_account", "stake_additional", "withdraw_stake", "buy_algo", "buy_uctzar"]
+DEFAULT_MIX = {"add_account": 1, "stake_additional": 2, "withdraw_stake": 1, "buy_algo": 3, "buy_uctzar": 3}
+PHASES = ["queueing", "signing", "submission", "confirmation", "other"]
+ALGO_FUNDING = 10 ** 13
+UCTZAR_FUNDING = 10 ** 12
+
+
+class PhaseTimer:
+    """Time spent per phase by the operation running on the current thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.totals = Counter()
+        self._local.active = set()
+
+    def totals(self):
+        return dict(getattr(self._local, "totals", {}))
+
+    def wrap(self, phase, fn):
+        # Only the outermost call of a phase is timed, so nested calls are not counted twice
+        def timed(*args, **kwargs):
+            active = getattr(self._local, "active", None)
+            if active is None or phase in active:
+                return fn(*args, **kwargs)
+            active.add(phase)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.totals[phase] += time.perf_counter() - started
+                active.discard(phase)
+        return timed
+
+
+@contextlib.contextmanager
+def patched(target, name, wrapper):
+    # Replace target.name for the duration of the run
+    original = getattr(target, name)
+    setattr(target, name, wrapper(original))
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+class TimedLock:
+    """Stand-in for the manager's lock that records the time spent waiting for it as queueing."""
+
+    def __init__(self, lock, timer):
+        self.lock = lock
+        self._acquire = timer.wrap("queueing", lock.acquire)
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def new_wallet(ledger, holds_uctzar=True):
+    # A funded account, by default opted in to and holding UCTZAR
+    from algosdk import account, mnemonic
+
+    private_key, address = account.generate_account()
+    ledger.fund(address, ALGO_FUNDING)
+    if holds_uctzar:
+        ledger.opt_in(address, dex_core.UCTZAR_ASSET_ID)
+        ledger.holdings[address][dex_core.UCTZAR_ASSET_ID] = UCTZAR_FUNDING
+    return address, mnemonic.from_private_key(private_key)
+
+
+class LoadGenerator:
+    def __init__(self, ledger, stakers=200, traders=50, seed=None):
+        """Set up a Dex with a seeded pool, stakers waiting to join and funded traders on ledger (a FakeAlgod)."""
+        self.ledger = ledger
+        self.random = random.Random(seed)
+        self.dex_address, self.dex_phrase = new_wallet(ledger, holds_uctzar=False)
+        ledger.create_asset(self.dex_address, 10 ** 15, "UCTZAR", "UCTZAR", asset_id=dex_core.UCTZAR_ASSET_ID)
+        ledger.create_asset(self.dex_address, 10 ** 15, "DEX token", "DEX", asset_id=dex_core.DEX_TOKEN_ASSET_ID)
+        self.manager = dex_core.AccountManager(dex_address=self.dex_address)
+
+        self.waiting = [(f"staker {index}",) + new_wallet(ledger) for index in range(stakers)]  # not joined yet
+        self.active = []  # joined and idle
+        self.traders = [new_wallet(ledger) for _ in range(traders)]  # idle
+        self._lock = threading.Lock()
+
+        # Seed the pool so trades can be priced from the start
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            name, address, phrase = self.waiting.pop()
+            self.manager.onboard(name, address, 10 ** 12, phrase, self.dex_phrase)
+
+    def _take(self, actors):
+        # Check an idle actor out so no two operations use the same wallet at once
+        with self._lock:
+            if not actors:
+                return None
+            return actors.pop(self.random.randrange(len(actors)))
+
+    def _give_back(self, actors, actor):
+        with self._lock:
+            actors.append(actor)
+
+    def run_operation(self, operation):
+        """Run one operation and return True on success, False on failure, or None if no wallet was free for it."""
+        amount = self.random.randint(10 ** 6, 10 ** 8)
+        if operation == "add_account":
+            actor = self._take(self.waiting)
+            if actor is None:
+                return None
+            name, address, phrase = actor
+            ok = self.manager.onboard(name, address, amount * 100, phrase, self.dex_phrase)
+            self._give_back(self.active if ok else self.waiting, actor)
+            return ok
+        if operation in ("stake_additional", "withdraw_stake"):
+            actor = self._take(self.active)
+            if actor is None:
+                return None
+            name, _, phrase = actor
+            if operation == "stake_additional":
+                ok = self.manager.stake_additional(name, amount * 100, phrase, self.dex_phrase)
+                self._give_back(self.active, actor)
+            else:
+                ok = self.manager.withdraw_stake(name, phrase, self.dex_phrase)
+                # A staker who has left the pool does not come back
+            return ok
+        actor = self._take(self.traders)
+        if actor is None:
+            return None
+        address, phrase = actor
+        try:
+            if operation == "buy_algo":
+                return self.manager.buy_algo(amount, address, phrase, self.dex_phrase) is not None
+            return self.manager.buy_uctzar(amount // 10 ** 5, address, phrase, self.dex_phrase) is not None
+        finally:
+            self._give_back(self.traders, actor)
+
+    def run(self, rate, duration, mix, concurrency=32):
+        """Generate Poisson arrivals at rate operations per second for duration seconds and return the report.
+
+        At most concurrency operations run at once; later arrivals queue for a worker.
+        """
+        operations = [operation for operation in OPERATIONS if mix.get(operation)]
+        weights = [mix[operation] for operation in operations]
+        timer = PhaseTimer()
+        results = []  # (operation, outcome, latency, phase totals, error)
+        results_lock = threading.Lock()
+
+        def execute(operation, scheduled):
+            timer.reset()
+            queued = time.perf_counter() - scheduled
+            error = None
+            try:
+                outcome = self.run_operation(operation)
+            except Exception as e:
+                outcome, error = False, f"{type(e).__name__}: {e}"
+            latency = time.perf_counter() - scheduled
+            totals = timer.totals()
+            totals["queueing"] = totals.get("queueing", 0.0) + max(queued, 0.0)
+            with results_lock:
+                results.append((operation, outcome, latency, totals, error))
+
+        from algosdk import mnemonic, transaction
+        from metrics import InstrumentedWatcher
+
+        with contextlib.ExitStack() as stack:
+            sink = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(sink))
+            # The SDK's deprecation notice for sign() would otherwise be reported against the timing wrapper
+            stack.enter_context(warnings.catch_warnings())
+            warnings.simplefilter("ignore", DeprecationWarning)
+            stack.enter_context(patched(mnemonic, "to_private_key", lambda fn: timer.wrap("signing", fn)))
+            stack.enter_context(patched(transaction.Transaction, "sign", lambda fn: timer.wrap("signing", fn)))
+            stack.enter_context(patched(transaction.MultisigTransaction, "sign", lambda fn: timer.wrap("signing", fn)))
+            stack.enter_context(patched(self.ledger, "send_transaction", lambda fn: timer.wrap("submission", fn)))
+            stack.enter_context(patched(self.ledger, "send_transactions", lambda fn: timer.wrap("submission", fn)))
+            stack.enter_context(patched(InstrumentedWatcher, "wait", lambda fn: timer.wrap("confirmation", fn)))
+            stack.enter_context(patched(self.manager, "lock", lambda lock: TimedLock(lock, timer)))
+
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load"))
+            started = time.perf_counter()
+            next_arrival = started
+            while next_arrival < started + duration:
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(execute, self.random.choices(operations, weights)[0], next_arrival)
+                next_arrival += self.random.expovariate(rate)
+        elapsed = time.perf_counter() - started
+        return self.report(results, elapsed, rate, duration, mix, concurrency)
+
+    def report(self, results, elapsed, rate, duration, mix, concurrency):
+        done = [result for result in results if result[1]]
+        report = {
+            "config": {"rate": rate, "duration": duration, "mix": mix, "concurrency": concurrency, "block_time": self.ledger.block_time, "latency": self.ledger.latency},
+            "elapsed_seconds": elapsed,
+            "arrivals": len(results),
+            "completed": len(done),
+            "failed": sum(1 for result in results if result[1] is False),
+            "skipped": sum(1 for result in results if result[1] is None),
+            "ops_per_second": len(done) / elapsed if elapsed else 0.0,
+            "errors": dict(Counter(result[4] for result in results if result[4]).most_common(10)),
+            "operations": {},
+        }
+        for operation in [None] + OPERATIONS:
+            selected = [result for result in done if operation is None or result[0] == operation]
+            if not selected:
+                continue
+            latencies = sorted(result[2] for result in selected)
+            phases = {phase: 0.0 for phase in PHASES}
+            for _, _, latency, totals, _ in selected:
+                for phase, seconds in totals.items():
+                    phases[phase] += seconds
+                phases["other"] += latency - sum(totals.values())
+            total_time = sum(latencies)
+            report["operations"][operation or "all"] = {
+                "completed": len(selected),
+                "latency_seconds": {
+                    "p50": percentile(latencies, 0.50),
+                    "p99": percentile(latencies, 0.99),
+                    "p999": percentile(latencies, 0.999),
+                    "max": latencies[-1],
+                },
+                "phase_seconds_per_op": {phase: seconds / len(selected) for phase, seconds in phases.items()},
+                "phase_share": {phase: (seconds / total_time if total_time else 0.0) for phase, seconds in phases.items()},
+            }
+        return report
+
+
+def parse_mix(items):
+    mix = {}
+    for item in items:
+        operation, _, weight = item.partition("=")
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{operation}'. Choose from: {', '.join(OPERATIONS)}")
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive mixed Dex load against an in-process algod ledger and report throughput and tail latency.")
+    parser.add_argument("--rate", type=float, default=20.0, help="mean arrivals per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to generate arrivals for")
+    parser.add_argument("--mix", nargs="*", default=None, help="operation weights, e.g. buy_algo=3 add_account=1")
+    parser.add_argument("--concurrency", type=int, default=32, help="operations that may run at once")
+    parser.add_argument("--stakers", type=int, default=200, help="stakers available to join the pool")
+    parser.add_argument("--traders", type=int, default=50, help="trader wallets")
+    parser.add_argument("--block-time", type=float, default=0.0, help="seconds per round; 0 closes a block as soon as one is awaited")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated network round trip per algod call, in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the JSON report to this file instead of standard output")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix) if args.mix else dict(DEFAULT_MIX)
+    ledger = FakeAlgod(block_time=args.block_time, latency=args.latency, seed=args.seed)
+    algod_context.configure(algod_client=ledger, metadata_path=None)
+    generator = LoadGenerator(ledger, args.stakers, args.traders, args.seed)
+    report = generator.run(args.rate, args.duration, mix, args.concurrency)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+# Description - Low-overhead metrics and spans for the algod calls and signing steps of the Dex and stokvel
+# Counters and latency histograms are kept in memory per call site, where the call site is the innermost span
+# (e.g. algo_payment or asset_transfer). Spans time whole operations and link their legs: the payments and transfers
+# of one stake share the stake's trace id. Everything can be exported in the Prometheus text format, served over HTTP
+# for scraping, or dumped to a file periodically.
+
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of the rounds-waited buckets
+ROUND_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last count is for values above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Span:
+    def __init__(self, name, trace_id, span_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, max_spans=1000):
+        """Create an empty registry. The max_spans most recently finished spans are kept for dumps."""
+        self.enabled = True
+        self.counters = {}  # (name, labels) -> count
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.spans = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # Recording
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def call_site(self):
+        """Return the name of the innermost open span on this thread, or "background" outside any span."""
+        stack = getattr(self._local, "stack", None)
+        return stack[-1].name if stack else "background"
+
+    def current_span(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time an operation. Spans opened inside it become its children and share its trace id."""
+        if not self.enabled:
+            yield None
+            return
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        span_id = next(self._ids)
+        span = Span(name, parent.trace_id if parent else span_id, span_id, parent.span_id if parent else None, attributes)
+        stack.append(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            stack.pop()
+            outcome = "error" if span.error else "ok"
+            self.observe("dex_operation_seconds", span.duration, operation=name, outcome=outcome)
+            with self._lock:
+                self.spans.append(span)
+
+    def traced(self, name):
+        """Decorator that runs the function inside a span called name."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def timed(self, step, fn, *args, **kwargs):
+        """Call fn and record its latency as a signing step (e.g. to_private_key or sign) of the current call site."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.observe("dex_signing_seconds", time.perf_counter() - started, step=step, site=self.call_site())
+
+    # Exporting
+
+    def snapshot(self):
+        """Return every counter, histogram and recent span as plain data."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": dict(zip([str(bound) for bound in histogram.buckets] + ["+Inf"], histogram.counts)),
+                }
+                for (name, labels), histogram in self.histograms.items()
+            ]
+            spans = [span.to_dict() for span in self.spans]
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms, "spans": spans}
+
+    def prometheus_text(self):
+        """Render the counters and histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, format="prometheus"):
+        """Write the metrics to path, as Prometheus text or as JSON with the recent spans. The file is replaced atomically."""
+        text = self.prometheus_text() if format == "prometheus" else json.dumps(self.snapshot(), indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def start_periodic_dump(self, path, interval=10.0, format="prometheus"):
+        """Dump the metrics to path every interval seconds from a daemon thread. Returns an event that stops it when set."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.dump(path, format)
+            self.dump(path, format)
+
+        threading.Thread(target=run, name="metrics-dump", daemon=True).start()
+        return stop
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """Serve the Prometheus text on http://host:port/metrics from a daemon thread and return the server."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.spans.clear()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+class InstrumentedAlgod:
+    """Proxy around an algod client that counts and times every request per method and call site."""
+
+    def __init__(self, client, registry):
+        self.client = client
+        self.registry = registry
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+        registry = self.registry
+
+        def call(*args, **kwargs):
+            if not registry.enabled:
+                return attribute(*args, **kwargs)
+            site = registry.call_site()
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return attribute(*args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                registry.observe("dex_algod_request_seconds", time.perf_counter() - started, method=name, site=site)
+                registry.inc("dex_algod_requests_total", method=name, site=site, outcome=outcome)
+        return call
+
+
+class InstrumentedWatcher:
+    """Proxy around a ConfirmationWatcher that records how long, and for how many rounds, each call site waited.
+
+    Both wait() and watch() are measured; a watched transaction is recorded when its future completes, under the call
+    site that registered it.
+    """
+
+    def __init__(self, watcher, registry):
+        self.watcher = watcher
+        self.registry = registry
+
+    def __getattr__(self, name):
+        return getattr(self.watcher, name)
+
+    def wait(self, txid, wait_rounds=4, last_valid_round=None):
+        registry = self.registry
+        if not registry.enabled:
+            return self.watcher.wait(txid, wait_rounds, last_valid_round)
+        site = registry.call_site()
+        started = time.perf_counter()
+        future = self.watcher.watch(txid, wait_rounds, last_valid_round)
+        try:
+            return future.result()
+        finally:
+            self._record(future, site, started)
+
+    def watch(self, txid, wait_rounds=4, last_valid_round=None, callback=None):
+        registry = self.registry
+        if not registry.enabled:
+            return self.watcher.watch(txid, wait_rounds, last_valid_round, callback)
+        site = registry.call_site()
+        started = time.perf_counter()
+
+        def done(future):
+            self._record(future, site, started)
+            if callback is not None:
+                callback(future)
+
+        return self.watcher.watch(txid, wait_rounds, last_valid_round, done)
+
+    def _record(self, future, site, started):
+        # Called once the future is done, on the waiting thread for wait() and on the watcher's thread for watch()
+        registry = self.registry
+        if future.cancelled() or future.exception() is not None:
+            registry.inc("dex_confirmations_total", site=site, outcome="error")
+            return
+        result = future.result()
+        registry.observe("dex_confirmation_seconds", time.perf_counter() - started, site=site)
+        registry.inc("dex_confirmations_total", site=site, outcome="ok")
+        registered_round = getattr(future, "registered_round", None)
+        if registered_round is not None and result.get("confirmed-round"):
+            registry.observe("dex_confirmation_rounds", result["confirmed-round"] - registered_round, buckets=ROUND_BUCKETS, site=site)
+
+
+# The process-wide registry used by the Dex and stokvel modules
+registry = MetricsRegistry()
+span = registry.span
+traced = registry.traced
+timed = registry.timed
@@ -0,0 +1,265 @@
+# Description - Collect and merge the signatures of a stokvel payout without asking the signatories one after another
+# The payout transaction is exported once (export_transaction). Every signatory signs their own copy whenever they
+# are ready, e.g. with "python multisig_collector.py sign payout.txn", and returns it as a partial. The collector
+# checks each partial as it arrives: it must be for the same transaction and multisig, and every signature in it must
+# be valid. Valid signatures are merged in memory, and the payout is submitted as soon as the threshold is met. The
+# payout therefore waits for the fourth-fastest signatory instead of four prompts in a row. Partials that arrive
+# once submission has started are ignored. Submission runs outside the collector's lock, and if algod refuses the
+# payout the signatures are kept so submit() can retry it.
+# Usage - $ python multisig_collector.py sign payout.txn [--output partial.txn]
+
+import argparse
+import base64
+import glob
+import os
+import threading
+import time
+
+import algod_context
+import metrics
+
+
+class CollectorError(Exception):
+    pass
+
+
+def export_transaction(msig_txn):
+    """Return an unsigned or partly signed MultisigTransaction as base64 msgpack text, the format signatories exchange."""
+    from algosdk import encoding
+
+    return encoding.msgpack_encode(msig_txn)
+
+
+def import_transaction(text):
+    """Decode base64 msgpack text from export_transaction or sign_partial. Raises CollectorError if it is not a multisig transaction."""
+    from algosdk import encoding, transaction
+
+    try:
+        msig_txn = encoding.msgpack_decode(text.strip())
+    except Exception as e:
+        raise CollectorError(f"The text is not an encoded transaction: {e}") from None
+    if not isinstance(msig_txn, transaction.MultisigTransaction):
+        raise CollectorError("The text is not a multisig transaction.")
+    return msig_txn
+
+
+def sign_partial(exported, secret):
+    """Sign an exported multisig transaction with one secret phrase (or KeyHandle) and return the partial to send back.
+
+    Raises CollectorError if the key is not one of the signatories of the multisig.
+    """
+    from algosdk import encoding
+
+    msig_txn = import_transaction(exported)
+    key = algod_context.get_signer().handle(secret)
+    if key.address not in [encoding.encode_address(subsig.public_key) for subsig in msig_txn.multisig.subsigs]:
+        raise CollectorError(f"{key.address} is not one of the signatories of this multisig account.")
+    # Send back only this signatory's signature, even if the export already carried others
+    for subsig in msig_txn.multisig.subsigs:
+        subsig.signature = None
+    algod_context.get_signer().sign_multisig(msig_txn, [key])
+    return export_transaction(msig_txn)
+
+
+def _signing_message(txn):
+    from algosdk import constants, encoding
+
+    return constants.txid_prefix + base64.b64decode(encoding.msgpack_encode(txn))
+
+
+class SignatureCollector:
+    def __init__(self, msig_txn, wait_rounds=4):
+        """Collect signatures for msig_txn (an unsigned MultisigTransaction) and submit it once its threshold is met."""
+        self.msig_txn = msig_txn
+        self.txid = msig_txn.transaction.get_txid()
+        self.wait_rounds = wait_rounds
+        self.exported = export_transaction(msig_txn)
+        self._message = _signing_message(msig_txn.transaction)
+        self._signed = set()  # indexes of the subsigs that hold a valid signature
+        self._seen_files = {}  # path -> (size, mtime) when it was last read
+        self._future = None
+        self._submitting = False  # set while one caller is sending the payout to algod
+        self._submitted = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def threshold(self):
+        return self.msig_txn.multisig.threshold
+
+    def signatures(self):
+        with self._lock:
+            return len(self._signed)
+
+    def export_to(self, path):
+        """Write the exported transaction to path for the signatories and return the path."""
+        with open(path, "w") as f:
+            f.write(self.exported + "\n")
+        return path
+
+    def add(self, partial):
+        """Validate a partial from a signatory and merge its signatures. Returns a short status message.
+
+        The payout is submitted by the call that brings the signatures up to the threshold, or by a later call if an
+        earlier submission failed.
+        Raises CollectorError if the partial is for another transaction, carries an invalid signature or if algod
+        refuses the payout; in the last case the signatures are kept and the payout can be retried with submit().
+        """
+        from nacl.exceptions import BadSignatureError
+        from nacl.signing import VerifyKey
+
+        partial_txn = import_transaction(partial) if isinstance(partial, str) else partial
+        if partial_txn.transaction.get_txid() != self.txid:
+            metrics.registry.inc("dex_multisig_partials_total", outcome="rejected")
+            raise CollectorError("The partial is for a different transaction.")
+        if partial_txn.multisig.address() != self.msig_txn.multisig.address():
+            metrics.registry.inc("dex_multisig_partials_total", outcome="rejected")
+            raise CollectorError("The partial is for a different multisig account.")
+
+        # Check every signature before merging any, so a bad partial changes nothing
+        new_signatures = {}
+        for index, subsig in enumerate(partial_txn.multisig.subsigs):
+            if not subsig.signature:
+                continue
+            signature = base64.b64decode(subsig.signature) if isinstance(subsig.signature, str) else subsig.signature
+            try:
+                VerifyKey(subsig.public_key).verify(self._message, signature)
+            except (BadSignatureError, ValueError):
+                metrics.registry.inc("dex_multisig_partials_total", outcome="rejected")
+                raise CollectorError(f"The signature of signatory {index + 1} is not valid for this transaction.") from None
+            new_signatures[index] = signature
+
+        with self._lock:
+            if self._submitted.is_set() or self._submitting:
+                metrics.registry.inc("dex_multisig_partials_total", outcome="late")
+                return f"The payout was already submitted with {len(self._signed)} signatures; this one is not needed."
+            added = [index for index in new_signatures if index not in self._signed]
+            for index in added:
+                self.msig_txn.multisig.subsigs[index].signature = new_signatures[index]
+                self._signed.add(index)
+            metrics.registry.inc("dex_multisig_partials_total", outcome="accepted" if added else "duplicate")
+            if len(self._signed) < self.threshold:
+                return f"Signature accepted. Signatures received: {len(self._signed)}/{self.threshold}"
+            self._submitting = True
+        self._send()
+        return f"Threshold of {self.threshold} signatures reached. Payout submitted with txID: {self.txid}"
+
+    def submit(self):
+        """Submit the payout, e.g. again after algod refused it. Returns its txID; does nothing if it was already submitted.
+
+        Raises CollectorError if the threshold has not been met, another caller is submitting it or algod refuses it.
+        """
+        with self._lock:
+            if self._submitted.is_set():
+                return self.txid
+            if len(self._signed) < self.threshold:
+                raise CollectorError(f"Only {len(self._signed)} of the {self.threshold} signatures needed have been received.")
+            if self._submitting:
+                raise CollectorError("The payout is already being submitted.")
+            self._submitting = True
+        self._send()
+        return self.txid
+
+    def _send(self):
+        # Called without the lock by the caller that set _submitting, so other callers are not held up by algod. No
+        # signatures are merged while _submitting is set. If algod refuses the payout the signatures are kept for a retry.
+        from algosdk.error import AlgodHTTPError
+
+        try:
+            txid = algod_context.get_algod_client().send_transaction(self.msig_txn)
+            future = algod_context.get_confirmation_watcher().watch(txid, self.wait_rounds, self.msig_txn.transaction.last_valid_round)
+        except AlgodHTTPError as e:
+            with self._lock:
+                self._submitting = False
+            raise CollectorError(f"algod did not accept the payout: {e}") from e
+        except Exception as e:
+            with self._lock:
+                self._submitting = False
+            raise CollectorError(f"The payout could not be submitted: {e}") from e
+        print("Successfully submitted multisig payout transaction with txID: {}".format(txid))
+        with self._lock:
+            self._future = future
+            self._submitting = False
+            self._submitted.set()
+
+    def add_from_file(self, path):
+        """Add the partial in a file. Returns the status message."""
+        with open(path) as f:
+            return self.add(f.read())
+
+    def watch_directory(self, directory, pattern="*.partial", interval=0.5, timeout=None):
+        """Add every partial file that appears in directory until the payout is submitted. Returns True once it is.
+
+        Invalid partials are reported and skipped until the file changes. Returns False if timeout seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._submitted.is_set():
+            if self.signatures() >= self.threshold:
+                # An earlier submission was refused; try again with the signatures already collected
+                try:
+                    self.submit()
+                    break
+                except CollectorError as e:
+                    print(f"Error: {e}")
+            for path in sorted(glob.glob(os.path.join(directory, pattern))):
+                # A file that is still being written may be rejected; it is read again once it changes
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self._seen_files.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                self._seen_files[path] = (stat.st_size, stat.st_mtime_ns)
+                try:
+                    print(f"{os.path.basename(path)}: {self.add_from_file(path)}")
+                except (CollectorError, OSError) as e:
+                    print(f"Error: {os.path.basename(path)} was not accepted. {e}")
+                if self._submitted.is_set():
+                    break
+            if self._submitted.is_set():
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def submitted(self):
+        return self._submitted.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the submitted payout to be confirmed and return its transaction information.
+
+        Raises CollectorError if the threshold has not been reached within timeout seconds.
+        """
+        if not self._submitted.wait(timeout):
+            raise CollectorError(f"Only {self.signatures()} of the {self.threshold} signatures needed have been received.")
+        return self._future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sign an exported stokvel payout as one of its signatories.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sign_parser = subparsers.add_parser("sign", help="sign an exported payout transaction")
+    sign_parser.add_argument("transaction", help="file written by the stokvel when the payout was exported")
+    sign_parser.add_argument("--output", help="file to write the partial to (default: <transaction>.<address>.partial)")
+    args = parser.parse_args()
+
+    with open(args.transaction) as f:
+        exported = f.read()
+    msig_txn = import_transaction(exported)
+    txn = msig_txn.transaction
+    print(f"Payout of {txn.amt} MicroAlgos from {txn.sender} to {txn.receiver}, valid until round {txn.last_valid_round}.")
+    secret_phrase = input("Please provide your secret code to authorise this payout: ")
+    key = algod_context.get_signer().handle(secret_phrase)
+    try:
+        partial = sign_partial(exported, key)
+    except CollectorError as e:
+        print(f"Error: {e}")
+        return
+    output = args.output or f"{os.path.splitext(args.transaction)[0]}.{key.address[:8]}.partial"
+    with open(output, "w") as f:
+        f.write(partial + "\n")
+    print(f"Your signature has been written to {output}. Please return it to the stokvel.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Description - Shared cache of suggested transaction parameters for the Dex and stokvel scripts
+# Suggested parameters only change about once per block, so they are fetched once and reused by every
+# transaction builder until a configurable number of rounds or seconds has passed. Because reused parameters make a
+# repeated trade or contribution byte-for-byte the same transaction, every builder also attaches a new_lease().
+
+import copy
+import os
+import threading
+import time
+
+
+def new_lease():
+    """Return a random 32-byte lease that keeps the ID of a new transaction unique.
+
+    Two transactions built from the same cached parameters with the same sender, receiver, amount and note would
+    otherwise have the same ID, and algod would reject the second as already in the ledger. A lease only excludes
+    another transaction from the same sender with the same lease, which a random one never meets.
+    """
+    return os.urandom(32)
+
+
+class SuggestedParamsCache:
+    def __init__(self, algod_client, max_rounds=5, max_age_seconds=15.0, block_time=2.8):
+        """Create a cache around algod_client.
+
+        The cached parameters expire once max_rounds rounds are estimated to have passed since the fetch,
+        or once max_age_seconds seconds have passed, whichever comes first. block_time is the expected
+        number of seconds per round, used to estimate the current round between fetches.
+        """
+        self.algod_client = algod_client
+        self.max_rounds = max_rounds
+        self.max_age_seconds = max_age_seconds
+        self.block_time = block_time
+        self._params = None
+        self._fetched_at = None
+        self._fetched_round = None
+        self._observed_round = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return suggested parameters, fetching them from algod only when the cached value has expired."""
+        with self._lock:
+            if self._is_stale():
+                self._fetch()
+            # Hand out a copy so a builder that tweaks the fee does not change the shared value
+            return copy.copy(self._params)
+
+    def refresh(self):
+        """Fetch new parameters from algod regardless of the age of the cached value."""
+        with self._lock:
+            self._fetch()
+            return copy.copy(self._params)
+
+    def invalidate(self):
+        """Drop the cached parameters so the next get() fetches them again."""
+        with self._lock:
+            self._params = None
+
+    def observe_round(self, round_num):
+        """Record a round seen elsewhere (e.g. a confirmed round) so expiry can use it instead of an estimate."""
+        with self._lock:
+            if self._observed_round is None or round_num > self._observed_round:
+                self._observed_round = round_num
+
+    def age(self):
+        """Return (rounds, seconds) since the cached parameters were fetched, or (None, None) if nothing is cached."""
+        with self._lock:
+            if self._params is None:
+                return None, None
+            return self._age_rounds(), time.monotonic() - self._fetched_at
+
+    def _age_rounds(self):
+        # Estimate the rounds that have passed from the elapsed time, but trust a round we have actually seen if it is later
+        elapsed = time.monotonic() - self._fetched_at
+        estimated = int(elapsed / self.block_time) if self.block_time else 0
+        if self._observed_round is not None:
+            estimated = max(estimated, self._observed_round - self._fetched_round)
+        return estimated
+
+    def _is_stale(self):
+        if self._params is None:
+            return True
+        if time.monotonic() - self._fetched_at >= self.max_age_seconds:
+            return True
+        return self._age_rounds() >= self.max_rounds
+
+    def _fetch(self):
+        self._params = self.algod_client.suggested_params()
+        self._fetched_at = time.monotonic()
+        # "first" is the last round the node had seen when the parameters were issued
+        self._fetched_round = self._params.first
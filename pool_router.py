@@ -0,0 +1,232 @@
+# Description - Registry of Dex liquidity pools across many asset pairs, with best-path routing
+# Each registered pair has its own reserves (held in an amm_pool.PoolState), LP token, fee tier and pool wallet.
+# An in-memory adjacency index maps every asset to the pairs that trade it, and the router searches multi-hop
+# paths for the one that gives the most output within a per-request time budget. A route settles as a single
+# atomic group made of the same payment and asset transfer legs as algo_payment and asset_transfer.
+# A pair can carry its owner's lock and a fee sink: the Dex's own UCTZAR/Algo pool settles under the AccountManager's
+# lock and pays its fee in Algos to the stakers, like a direct buyAlgo or buyUCTZAR trade.
+
+import contextlib
+import time
+from dataclasses import dataclass, field
+
+from algosdk import transaction
+from algosdk.constants import tx_group_limit
+
+from amm_pool import PoolState, PoolError
+from params_cache import new_lease
+
+ALGO_ASSET_ID = 0  # Algos are not an asset on chain; 0 stands for them in the registry
+
+
+@dataclass
+class Pair:
+    asset_a: int  # held in the "algo" slot of the PoolState
+    asset_b: int  # held in the "uctzar" slot of the PoolState
+    state: PoolState
+    lp_token_id: int
+    fee_bps: int  # fee tier in basis points of the input amount, e.g. 100 for 1%
+    address: str  # wallet that holds the pair's reserves
+    lock: object = None  # held while a route through the pair is priced, settled and applied, e.g. the AccountManager's
+    fee_sink: object = None  # called with each fee, charged in asset_a, that is paid out instead of staying in the reserves
+
+    def reserves(self, asset_in):
+        """Return (reserve of asset_in, reserve of the other asset)."""
+        if asset_in == self.asset_a:
+            return self.state.algo_reserve, self.state.uctzar_reserve
+        return self.state.uctzar_reserve, self.state.algo_reserve
+
+    def other(self, asset):
+        return self.asset_b if asset == self.asset_a else self.asset_a
+
+    def amount_out(self, asset_in, amount_in):
+        """Exact-input constant-product quote, net of the fee."""
+        return self.quote(asset_in, amount_in)[0]
+
+    def quote(self, asset_in, amount_in):
+        """Return (amount out, fee paid to the fee sink) for an exact-input swap.
+
+        Without a fee sink the fee is taken from the input and stays with the pair, so the second value is 0. With one,
+        the fee is charged in asset_a: from the input when asset_a goes in, otherwise from the output.
+        """
+        reserve_in, reserve_out = self.reserves(asset_in)
+        if amount_in <= 0 or reserve_in == 0 or reserve_out == 0:
+            return 0, 0
+        if self.fee_sink is None:
+            amount_in_after_fee = amount_in * (10000 - self.fee_bps)
+            return reserve_out * amount_in_after_fee // (reserve_in * 10000 + amount_in_after_fee), 0
+        if asset_in == self.asset_a:
+            fee = amount_in * self.fee_bps // 10000
+            return reserve_out * (amount_in - fee) // (reserve_in + amount_in - fee), fee
+        gross_out = reserve_out * amount_in // (reserve_in + amount_in)
+        fee = gross_out * self.fee_bps // 10000
+        return gross_out - fee, fee
+
+    def apply_swap(self, asset_in, amount_in, amount_out, fee=0):
+        """Apply a settled swap through this pair to its reserves and pay its fee, from quote(), to the fee sink."""
+        if asset_in == self.asset_a:
+            self.state.apply_flows(amount_in - fee, 0, 0, amount_out)
+        else:
+            self.state.apply_flows(0, amount_out + fee, amount_in, 0)
+        if self.fee_sink is not None:
+            self.fee_sink(fee)
+
+
+@dataclass
+class Route:
+    assets: list  # assets along the path, from the input asset to the output asset
+    pairs: list  # pair used for each hop
+    amounts: list  # amount entering each hop, followed by the final output
+    complete: bool  # False if the time budget ran out before every path was tried
+    elapsed: float = 0.0
+    paths_tried: int = 0
+
+    @property
+    def amount_in(self):
+        return self.amounts[0]
+
+    @property
+    def amount_out(self):
+        return self.amounts[-1]
+
+
+@dataclass
+class PoolRegistry:
+    pairs: dict = field(default_factory=dict)  # (smaller asset id, larger asset id) -> Pair
+    adjacency: dict = field(default_factory=dict)  # asset id -> list of pairs that trade it
+    lock_order: dict = field(default_factory=dict)  # id of a pair lock -> smallest pool address of the pairs that share it
+
+    def register(self, asset_a, asset_b, address, lp_token_id, fee_bps=100, state=None, lock=None, fee_sink=None):
+        """Register a pair. state can be an existing PoolState, with asset_a in its Algo slot and asset_b in its UCTZAR slot.
+
+        lock and fee_sink are passed to the Pair, e.g. the AccountManager's lock and fee distribution for the Dex pool.
+        """
+        key = (min(asset_a, asset_b), max(asset_a, asset_b))
+        if asset_a == asset_b:
+            raise ValueError("A pool needs two different assets")
+        if key in self.pairs:
+            raise ValueError(f"A pool for assets {asset_a} and {asset_b} is already registered")
+        pair = Pair(int(asset_a), int(asset_b), state if state is not None else PoolState(), int(lp_token_id), int(fee_bps), address, lock, fee_sink)
+        self.pairs[key] = pair
+        self.adjacency.setdefault(pair.asset_a, []).append(pair)
+        self.adjacency.setdefault(pair.asset_b, []).append(pair)
+        if lock is not None:
+            self.lock_order[id(lock)] = min(address, self.lock_order.get(id(lock), address))
+        return pair
+
+    def get(self, asset_a, asset_b):
+        """Return the pair trading asset_a against asset_b, or None."""
+        return self.pairs.get((min(asset_a, asset_b), max(asset_a, asset_b)))
+
+    def best_route(self, asset_in, asset_out, amount_in, max_hops=3, time_budget=0.005):
+        """Find the path from asset_in to asset_out that pays out the most for amount_in.
+
+        Paths are searched depth first, trying the deepest pools first, for at most time_budget seconds. If the budget runs
+        out, the best route found so far is returned with complete=False. Raises PoolError if no route exists.
+        """
+        started = time.perf_counter()
+        deadline = started + time_budget
+        best = None
+        paths_tried = 0
+        # Each stack entry: (current asset, assets so far, pairs so far, amounts so far)
+        stack = [(asset_in, [asset_in], [], [int(amount_in)])]
+        complete = True
+        while stack:
+            if time.perf_counter() > deadline:
+                complete = False
+                break
+            asset, assets, pairs, amounts = stack.pop()
+            # Push shallower pools first so the deepest pool is expanded first
+            neighbours = sorted(self.adjacency.get(asset, []), key=lambda pair: pair.reserves(asset)[1])
+            for pair in neighbours:
+                next_asset = pair.other(asset)
+                if next_asset in assets:
+                    continue
+                out = pair.amount_out(asset, amounts[-1])
+                if out <= 0:
+                    continue
+                if next_asset == asset_out:
+                    paths_tried += 1
+                    if best is None or out > best.amounts[-1]:
+                        best = Route(assets + [next_asset], pairs + [pair], amounts + [out], True)
+                elif len(pairs) + 1 < max_hops:
+                    stack.append((next_asset, assets + [next_asset], pairs + [pair], amounts + [out]))
+
+        if best is None:
+            raise PoolError(f"No route from asset {asset_in} to asset {asset_out} within {max_hops} hops.")
+        best.complete = complete
+        best.elapsed = time.perf_counter() - started
+        best.paths_tried = paths_tried
+        return best
+
+    def settle_route(self, route, trader_address, trader_secret_phrase, pool_secret_phrases, params_cache, algod_client, confirmation_watcher, min_amount_out=None, opt_in_index=None, wait_rounds=4, signer=None):
+        """Settle a route as one atomic group and apply every hop to its pair's reserves once confirmed.
+
+        pool_secret_phrases maps each pool wallet address on the route to its secret phrase (or signer.KeyHandle).
+        signer is the signer.Signer that holds the keys; a new one is created if it is not given.
+        Raises PoolError if the route now pays out less than min_amount_out because a pool changed since it was quoted.
+        The locks of the pairs on the route are held throughout, and fees are paid to the pairs' fee sinks once confirmed.
+        """
+        with contextlib.ExitStack() as stack:
+            # Always take the locks in pool address order, so routes crossing the same pairs in opposite directions
+            # cannot each hold one lock while waiting for the other
+            locks = {id(pair.lock): pair.lock for pair in route.pairs if pair.lock is not None}
+            for key in sorted(locks, key=lambda key: self.lock_order[key]):
+                stack.enter_context(locks[key])
+
+            # Re-price the route on the current reserves before committing to it
+            amounts, fees = [route.amount_in], []
+            for asset, pair in zip(route.assets, route.pairs):
+                amount_out, fee = pair.quote(asset, amounts[-1])
+                amounts.append(amount_out)
+                fees.append(fee)
+            if min_amount_out is not None and amounts[-1] < min_amount_out:
+                raise PoolError(f"Slippage limit exceeded: the route now pays {amounts[-1]} but at least {min_amount_out} is required.")
+
+            sp = params_cache.get()
+            legs = []
+            final_asset = route.assets[-1]
+            if final_asset != ALGO_ASSET_ID and (opt_in_index is None or not opt_in_index.is_opted_in(trader_address, final_asset)):
+                legs.append(transaction.AssetOptInTxn(sender=trader_address, sp=sp, index=final_asset, lease=new_lease()))
+
+            # A fee paid to a fee sink is noted on the hop's asset_a leg, the way batch auction legs carry theirs,
+            # so a replay from the chain can tell it apart from the reserves
+            notes = ["Routed swap on the Dex"] * len(route.assets)
+            for hop, (asset, pair, fee) in enumerate(zip(route.assets, route.pairs, fees)):
+                if pair.fee_sink is not None:
+                    notes[hop if asset == pair.asset_a else hop + 1] = f"Routed swap on the Dex, fee {fee}"
+
+            # The trader pays the first pool; each pool pays the next one; the last pool pays the trader
+            senders = [trader_address] + [pair.address for pair in route.pairs]
+            receivers = [pair.address for pair in route.pairs] + [trader_address]
+            for hop, asset in enumerate(route.assets):
+                legs.append(self._leg(senders[hop], receivers[hop], asset, amounts[hop], sp, notes[hop]))
+            if len(legs) > tx_group_limit:
+                raise PoolError(f"The route needs {len(legs)} transactions, more than the {tx_group_limit} allowed in one group.")
+
+            transaction.assign_group_id(legs)
+            if signer is None:
+                from signer import Signer
+                signer = Signer()
+            keys = {trader_address: trader_secret_phrase}
+            for pair in route.pairs:
+                keys.setdefault(pair.address, pool_secret_phrases[pair.address])
+            signed = signer.sign_many(legs, keys)
+
+            txid = algod_client.send_transactions(signed)
+            print(f"Sent {len(route.pairs)}-hop swap group of {len(signed)} transactions with first txid: {txid}")
+            results = confirmation_watcher.wait(txid, wait_rounds)
+            print(f"Swap group confirmed in round: {results['confirmed-round']}")
+
+            for hop, (asset, pair) in enumerate(zip(route.assets, route.pairs)):
+                pair.apply_swap(asset, amounts[hop], amounts[hop + 1], fees[hop])
+            if opt_in_index is not None and final_asset != ALGO_ASSET_ID:
+                opt_in_index.mark_opted_in(trader_address, final_asset)
+            return results
+
+    @staticmethod
+    def _leg(sender, receiver, asset, amount, sp, note):
+        # Algos move with a payment, like algo_payment; any other asset with an asset transfer, like asset_transfer
+        if asset == ALGO_ASSET_ID:
+            return transaction.PaymentTxn(sender=sender, sp=sp, receiver=receiver, amt=int(amount), note=note, lease=new_lease())
+        return transaction.AssetTransferTxn(sender=sender, sp=sp, receiver=receiver, amt=int(amount), index=asset, note=note, lease=new_lease())
@@ -0,0 +1,103 @@
+# Description - Batch quote API over the constant-product pool for the Dex front end
+# Takes arrays of prospective buyAlgo / buyUCTZAR sizes and prices them all in one vectorised NumPy call, using the
+# same curve, rounding and fee rule (the Algo amount // fee divisor, i.e. 1%) as PoolState. The reserves snapshot and
+# the results for recently requested size arrays are cached, and the cache is only dropped when the pool reserves change.
+# NumPy is only needed for this module: pip3 install numpy
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional for the rest of the Dex
+    np = None
+
+# Products must stay below this bound to be computed in int64; otherwise Python integers are used
+INT64_SAFE = 2 ** 62
+
+
+@dataclass(frozen=True)
+class QuoteBatch:
+    # The arrays are read-only, since one cached batch is shared by every caller that asks for the same sizes
+    side: str  # "algo" for buyAlgo sizes (MicroAlgos out), "uctzar" for buyUCTZAR sizes (UCTZAR out)
+    amount_out: "np.ndarray"  # requested sizes
+    amount_in: "np.ndarray"  # amount the buyer pays into the pool, -1 where the size cannot be filled
+    fee: "np.ndarray"  # MicroAlgos charged on top, 0 where the size cannot be filled
+    price_impact: "np.ndarray"  # fraction worse than the spot price, NaN where the size cannot be filled
+    valid: "np.ndarray"  # False for sizes that are not positive or exceed the reserves
+    pool_version: int
+
+
+class QuoteService:
+    def __init__(self, pool, cache_size=1024):
+        """Create a quote service over pool (an amm_pool.PoolState). cache_size is the number of size arrays kept per pool version."""
+        if np is None:
+            raise ImportError("The batch quote service requires NumPy. Install it with: pip3 install numpy")
+        self.pool = pool
+        self.cache_size = cache_size
+        self._curve = None  # (pool version, Algo reserve, UCTZAR reserve)
+        self._results = OrderedDict()  # (side, sizes) -> QuoteBatch, for the cached pool version
+        self.hits = 0
+        self.misses = 0
+
+    def quote_buy_algo(self, algo_amounts):
+        """Price buying each of algo_amounts MicroAlgos with UCTZAR."""
+        return self._quote("algo", algo_amounts)
+
+    def quote_buy_uctzar(self, uctzar_amounts):
+        """Price buying each of uctzar_amounts UCTZAR with Algos."""
+        return self._quote("uctzar", uctzar_amounts)
+
+    def invalidate(self):
+        """Drop the cached curve and results, e.g. after the pool was replaced."""
+        self._curve = None
+        self._results.clear()
+
+    def _current_curve(self):
+        # The cached curve stays valid until the pool's version changes, i.e. until its reserves change
+        if self._curve is None or self._curve[0] != self.pool.version:
+            self._curve = (self.pool.version, self.pool.algo_reserve, self.pool.uctzar_reserve)
+            self._results.clear()
+        return self._curve
+
+    def _quote(self, side, amounts):
+        version, algo_reserve, uctzar_reserve = self._current_curve()
+        # A copy, so the caller's array is not frozen along with the cached result
+        sizes = np.array(amounts, dtype=np.int64, ndmin=1)
+        key = (side, sizes.tobytes())
+        cached = self._results.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return cached
+        self.misses += 1
+
+        if side == "algo":
+            reserve_in, reserve_out = uctzar_reserve, algo_reserve
+        else:
+            reserve_in, reserve_out = algo_reserve, uctzar_reserve
+
+        valid = (sizes > 0) & (sizes < reserve_out) & (reserve_in > 0)
+        out = np.where(valid, sizes, 0)
+
+        # amount in = ceil(reserve in * out / (reserve out - out)), the same rounding as PoolState
+        numerator = out.astype(object) if reserve_in and int(out.max(initial=0)) * reserve_in >= INT64_SAFE else out
+        numerator = numerator * reserve_in
+        denominator = np.where(valid, reserve_out - out, 1)
+        amount_in = (-(-numerator // denominator)).astype(np.int64)
+        amount_in = np.where(valid, amount_in, -1)
+
+        algo_amount = out if side == "algo" else np.where(valid, amount_in, 0)
+        fee = algo_amount // self.pool.fee_divisor
+
+        # Measured on the unrounded amount in, as PoolState does
+        price_impact = np.where(valid, out / denominator, np.nan)
+
+        # The cached arrays are handed to every caller that asks for the same sizes, so they are made read-only
+        for array in (sizes, amount_in, fee, price_impact, valid):
+            array.setflags(write=False)
+        result = QuoteBatch(side, sizes, amount_in, fee, price_impact, valid, version)
+        self._results[key] = result
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+        return result
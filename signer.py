@@ -0,0 +1,191 @@
+# Description - Signer service: derive each key once, hold it behind an opaque handle and sign in batches
+# Deriving a private key from the 25 words of a secret phrase used to happen again for every leg of a stake, a
+# withdrawal or a swap. The signer derives a key on first use and caches it for a bounded time (ttl seconds, at
+# most max_keys keys). Callers get a KeyHandle, which carries the address and expiry but not the key; the key itself
+# stays in the signer. The cache is keyed by a digest of the phrase, so the phrase is not kept either.
+# sign_many() signs a list of transactions; batches of at least pool_threshold transactions are spread across a
+# process pool, which is started once and then reused.
+# Every function that takes a secret phrase (algo_payment, asset_transfer, atomic_swap, ...) also accepts a KeyHandle.
+
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class SignerError(Exception):
+    pass
+
+
+class KeyHandle:
+    """Opaque reference to a key held by a Signer. It can be passed wherever a secret phrase is expected."""
+
+    __slots__ = ("handle_id", "address", "expires_at", "_signer")
+
+    def __init__(self, handle_id, address, expires_at, signer):
+        self.handle_id = handle_id
+        self.address = address
+        self.expires_at = expires_at
+        self._signer = signer
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def __repr__(self):
+        return f"KeyHandle({self.address}, expires in {max(0.0, self.expires_at - time.monotonic()):.0f}s)"
+
+
+def _sign_chunk(items):
+    # Runs in a worker process: sign each (transaction, private key) pair
+    return [txn.sign(private_key) for txn, private_key in items]
+
+
+class Signer:
+    def __init__(self, ttl=900.0, max_keys=256, pool_threshold=512, processes=None):
+        """Create a signer.
+
+        ttl is how many seconds a derived key stays usable, and max_keys how many keys are held at once (least
+        recently used first out). Batches of pool_threshold transactions or more are signed by a pool of processes
+        worker processes (the CPU count by default); processes=0 always signs in this process.
+        """
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.pool_threshold = pool_threshold
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self._handles = OrderedDict()  # phrase digest -> KeyHandle, least recently used first
+        self._keys = {}  # handle id -> private key
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # Keys
+
+    def handle(self, secret):
+        """Return a KeyHandle for a secret phrase, deriving the key only if it is not cached. A live KeyHandle is returned as it is.
+
+        Raises SignerError for an expired or forgotten KeyHandle; the phrase has to be given again to renew it.
+        """
+        if isinstance(secret, KeyHandle):
+            if secret._signer is not self:
+                raise SignerError("This key handle belongs to another signer.")
+            with self._lock:
+                if secret.expired() or secret.handle_id not in self._keys:
+                    self._drop(secret)
+                    raise SignerError(f"The key handle for {secret.address} has expired. Please provide the secret phrase again.")
+            return secret
+
+        digest = hashlib.sha256(secret.encode()).digest()
+        with self._lock:
+            handle = self._handles.get(digest)
+            if handle is not None and not handle.expired():
+                self._handles.move_to_end(digest)
+                metrics.registry.inc("dex_signer_keys_total", outcome="hit")
+                return handle
+            if handle is not None:
+                self._drop(handle)
+
+        # Derive outside the lock; two threads deriving the same key at once is harmless
+        from algosdk import account, mnemonic
+
+        private_key = metrics.timed("to_private_key", mnemonic.to_private_key, secret)
+        metrics.registry.inc("dex_signer_keys_total", outcome="miss")
+        with self._lock:
+            handle = KeyHandle(next(self._ids), account.address_from_private_key(private_key), time.monotonic() + self.ttl, self)
+            self._keys[handle.handle_id] = private_key
+            previous = self._handles.pop(digest, None)
+            if previous is not None:
+                self._drop(previous)
+            self._handles[digest] = handle
+            while len(self._handles) > self.max_keys:
+                _, oldest = self._handles.popitem(last=False)
+                self._keys.pop(oldest.handle_id, None)
+        return handle
+
+    def _drop(self, handle):
+        # Called with the lock held
+        self._keys.pop(handle.handle_id, None)
+        for digest, cached in list(self._handles.items()):
+            if cached is handle:
+                del self._handles[digest]
+
+    def _private_key(self, secret):
+        handle = self.handle(secret)
+        with self._lock:
+            private_key = self._keys.get(handle.handle_id)
+        if private_key is None:
+            raise SignerError(f"The key handle for {handle.address} has expired. Please provide the secret phrase again.")
+        return private_key
+
+    def forget(self, handle):
+        """Drop a key before its handle expires."""
+        with self._lock:
+            self._drop(handle)
+
+    def clear(self):
+        """Drop every key, e.g. at the end of a session."""
+        with self._lock:
+            self._handles.clear()
+            self._keys.clear()
+
+    # Signing
+
+    def sign(self, secret, txn):
+        """Sign one transaction with the key of a secret phrase or KeyHandle and return the signed transaction."""
+        return metrics.timed("sign", txn.sign, self._private_key(secret))
+
+    def sign_many(self, txns, secrets):
+        """Sign a list of transactions and return the signed transactions in the same order.
+
+        secrets maps each sender address to its secret phrase or KeyHandle; a single phrase or handle signs every transaction.
+        Each key is derived at most once. Batches of pool_threshold transactions or more are signed in the process pool.
+        """
+        if isinstance(secrets, dict):
+            keys = {address: self._private_key(secret) for address, secret in secrets.items()}
+            try:
+                items = [(txn, keys[txn.sender]) for txn in txns]
+            except KeyError as e:
+                raise SignerError(f"No key was given for the sender {e.args[0]}.") from None
+        else:
+            private_key = self._private_key(secrets)
+            items = [(txn, private_key) for txn in txns]
+
+        if len(items) < self.pool_threshold or self.processes < 2:
+            return [metrics.timed("sign", txn.sign, private_key) for txn, private_key in items]
+        return metrics.timed("sign_batch", self._sign_in_pool, items)
+
+    def _sign_in_pool(self, items):
+        executor = self._pool()
+        size = -(-len(items) // self.processes)
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+        signed = []
+        for chunk_signed in executor.map(_sign_chunk, chunks):
+            signed.extend(chunk_signed)
+        return signed
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # Spawned rather than forked: the parent runs watcher and commit threads that a fork would copy mid-flight
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def sign_multisig(self, msig_txn, secrets):
+        """Add the signature of each secret phrase or KeyHandle in secrets to a MultisigTransaction and return it."""
+        for secret in secrets:
+            metrics.timed("sign", msig_txn.sign, self._private_key(secret))
+        return msig_txn
+
+    def close(self):
+        """Stop the process pool and drop every key."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        self.clear()
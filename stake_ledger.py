@@ -0,0 +1,355 @@
+# Description - Compact, column-oriented ledger of liquidity providers for the Dex staking pool
+# Every staker used to be a dict with six string keys. The ledger instead keeps one typed array per field:
+# integer columns for the Algo and UCTZAR contributions, join dates as day numbers, a bitmap for the status
+# and interned strings for names and addresses. StakeRecord and AccountsView give the same dict/list
+# interface that get_all_accounts() used to return, without materialising a dict per staker.
+#
+# Transaction fees accrue lazily. Each active staker owns pool units, and the ledger keeps the total Algo owed to
+# active stakers (fees included) and the total units. A fee only increases the Algo total, which is O(1) per trade.
+# A staker's "Contributed Algo" is units * total Algo // total units; it is written back to the Algo column (the
+# staker's checkpoint) only when the staker stakes, withdraws or is queried. Because a balance depends only on the
+# units and the two totals, settling lazily gives exactly the same MicroAlgos as settling everybody after every
+# trade, and rounding dust stays in the pool for the remaining stakers instead of being dropped.
+# Units are minted UNITS_PER_MICROALGO to the MicroAlgo, rounded up in the depositor's favour, so a balance stays
+# within a MicroAlgo of an exact proportional split of every fee. A balance never reads below the MicroAlgos the
+# staker deposited.
+
+import sys
+from array import array
+from collections.abc import MutableMapping, Sequence
+from datetime import date, datetime
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Pool units minted per MicroAlgo when the pool is empty; finer units keep the rounding of later deposits small
+UNITS_PER_MICROALGO = 1000
+
+FIELDS = ("Account name", "Account address", "Contributed Algo", "Contributed UCTZAR", "DEX tokens", "Join date", "Status")
+
+
+def to_day_number(join_date):
+    """Convert a "%Y-%m-%d" string or a date to a day number (days since 0001-01-01)."""
+    if isinstance(join_date, str):
+        join_date = datetime.strptime(join_date, DATE_FORMAT).date()
+    if isinstance(join_date, datetime):
+        join_date = join_date.date()
+    return join_date.toordinal()
+
+
+def from_day_number(day_number):
+    """Convert a day number back to the "%Y-%m-%d" string used in account records."""
+    return date.fromordinal(day_number).strftime(DATE_FORMAT)
+
+
+class StakeLedger:
+    def __init__(self):
+        self.names = []  # interned account names
+        self.addresses = []  # interned wallet addresses
+        self.algo = array("q")  # contributed MicroAlgos, as of the last settlement
+        self.units = array("q")  # pool units owned by each active staker
+        self.uctzar = array("q")  # contributed UCTZAR
+        self.deposited_algo = array("q")  # MicroAlgos staked, without fee income
+        self.dex_tokens = array("q")  # DEX tokens (pool shares) held for the stake
+        self.join_day = array("l")  # join date as a day number
+        self.status = bytearray()  # bit set = "Active", bit clear = "Left"
+        self.active_count = 0
+        self.total_algo = 0  # MicroAlgos owed to active stakers, including fees that have not been settled yet
+        self.total_units = 0
+        self._row_by_name = {}
+        self._row_by_address = {}
+        # Rows changed since the last call to take_dirty(), or None while nobody is persisting the ledger
+        self.dirty = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, name, address, contributed_algo, contributed_uctzar, join_date):
+        """Add a new active staker and return its row number. Raises ValueError if the name or address is taken."""
+        if name in self._row_by_name:
+            raise ValueError(f"An account with the name '{name}' already exists.")
+        if address in self._row_by_address:
+            raise ValueError(f"The wallet address {address} is already linked to account '{self.names[self._row_by_address[address]]}'.")
+
+        row = len(self.names)
+        name = sys.intern(name)
+        address = sys.intern(address)
+        self.names.append(name)
+        self.addresses.append(address)
+        self.algo.append(0)
+        self.units.append(0)
+        self.uctzar.append(int(contributed_uctzar))
+        self.deposited_algo.append(int(contributed_algo))
+        self.dex_tokens.append(0)
+        self.join_day.append(to_day_number(join_date))
+        if row % 8 == 0:
+            self.status.append(0)
+        self._row_by_name[name] = row
+        self._row_by_address[address] = row
+        self.set_active(row, True)
+        self.deposit(row, contributed_algo)
+        self.touch(row)
+        return row
+
+    def row_by_name(self, name):
+        """Return the row of the account with the given name, or None."""
+        return self._row_by_name.get(name)
+
+    def row_by_address(self, address):
+        """Return the row of the account linked to the given wallet address, or None."""
+        return self._row_by_address.get(address)
+
+    def is_active(self, row):
+        return bool(self.status[row >> 3] & (1 << (row & 7)))
+
+    def set_active(self, row, active):
+        if self.is_active(row) == active:
+            return
+        self.touch(row)
+        if active:
+            self.status[row >> 3] |= 1 << (row & 7)
+            self.active_count += 1
+        else:
+            self.status[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+            self.active_count -= 1
+
+    def set_status(self, row, active):
+        """Change a staker's status, moving its Algo into or out of the fee-earning pool."""
+        if self.is_active(row) == active:
+            return
+        if active:
+            self.set_active(row, True)
+            amount, self.algo[row] = self.algo[row], 0
+            self.deposit(row, amount)
+        else:
+            self._leave_pool(row)
+            self.set_active(row, False)
+
+    def close(self, row):
+        """Take a staker out of the pool once its stake and fees have been paid out, and clear its position."""
+        self.set_status(row, False)
+        self.touch(row)
+        self.algo[row] = 0
+        self.uctzar[row] = 0
+        self.deposited_algo[row] = 0
+        self.dex_tokens[row] = 0
+
+    def deposit(self, row, amount):
+        """Add amount MicroAlgos to a staker's contribution. Active stakers receive pool units at the current index."""
+        amount = int(amount)
+        self.touch(row)
+        if not self.is_active(row):
+            self.algo[row] += amount
+            return
+        if self.total_units == 0:
+            minted = amount * UNITS_PER_MICROALGO
+        else:
+            # Round up, in the depositor's favour; the other stakers give up less than one unit's worth between them
+            minted = -(-amount * self.total_units // self.total_algo)
+        self.units[row] += minted
+        self.total_units += minted
+        self.total_algo += amount
+        self.settle(row)
+
+    def set_algo(self, row, amount):
+        """Set a staker's contribution to exactly amount MicroAlgos."""
+        self.touch(row)
+        if not self.is_active(row):
+            self.algo[row] = int(amount)
+            return
+        self._leave_pool(row)
+        self.deposit(row, amount)
+
+    def fee_income(self, row):
+        """Return the fees a staker has earned so far: its accrued balance minus the MicroAlgos it staked."""
+        return max(0, self.balance(row) - self.deposited_algo[row])
+
+    def accrue_fee(self, fee):
+        """Credit a fee to every active staker in proportion to its contribution in O(1). Returns False if nobody is staking."""
+        if self.total_units == 0 or self.total_algo == 0:
+            return False
+        self.total_algo += int(fee)
+        return True
+
+    def balance(self, row):
+        """Return a staker's contribution including every fee accrued so far, without settling it.
+
+        Fees only ever add to a stake, so the balance is never less than the MicroAlgos deposited, even when the
+        rounding of other stakers' deposits has taken a fraction of a MicroAlgo from its units.
+        """
+        if not self.is_active(row) or self.total_units == 0:
+            return self.algo[row]
+        return max(self.units[row] * self.total_algo // self.total_units, self.deposited_algo[row])
+
+    def settle(self, row):
+        """Write a staker's accrued balance to its checkpoint in the Algo column and return it."""
+        self.algo[row] = self.balance(row)
+        return self.algo[row]
+
+    def settle_all(self):
+        """Settle every active staker, e.g. before an export. Returns the rounding dust that stays in the pool."""
+        settled = sum(self.settle(row) for row in self.active_rows())
+        return self.total_algo - settled
+
+    def _leave_pool(self, row):
+        # Settle first so the staker keeps every fee accrued up to now, then take its share out of the totals
+        amount = self.settle(row)
+        self.touch(row)
+        self.total_algo -= amount
+        self.total_units -= self.units[row]
+        self.units[row] = 0
+        if self.total_units == 0:
+            # Rounding dust left behind by the last staker has nobody to be owed to
+            self.total_algo = 0
+
+    def active_rows(self):
+        """Yield the row number of every active staker, skipping eight inactive rows at a time."""
+        for byte_index, bits in enumerate(self.status):
+            if not bits:
+                continue
+            base = byte_index << 3
+            for bit in range(8):
+                if bits & (1 << bit):
+                    yield base + bit
+
+    def touch(self, row):
+        """Mark a row as changed, so the next write to the state store includes it."""
+        if self.dirty is not None:
+            self.dirty.add(row)
+
+    def take_dirty(self):
+        """Return the rows changed since the last call, in row order, and start a new set."""
+        if not self.dirty:
+            return []
+        rows, self.dirty = sorted(self.dirty), set()
+        return rows
+
+    def row_image(self, row):
+        """Return a row as a plain list of its columns, for the state store.
+
+        A settled Algo checkpoint is not needed: an active staker's balance follows from its units and the totals.
+        """
+        return [self.names[row], self.addresses[row], self.algo[row], self.units[row], self.uctzar[row],
+                self.deposited_algo[row], self.dex_tokens[row], self.join_day[row], int(self.is_active(row))]
+
+    def load_row(self, image):
+        """Write a row image from row_image() back into the columns, adding the row if its name is new.
+
+        The pool totals are not changed; restore them with the rest of the saved state.
+        """
+        name, address, algo, units, uctzar, deposited_algo, dex_tokens, join_day, active = image
+        row = self._row_by_name.get(name)
+        if row is None:
+            row = len(self.names)
+            name = sys.intern(name)
+            address = sys.intern(address)
+            self.names.append(name)
+            self.addresses.append(address)
+            for column in (self.algo, self.units, self.uctzar, self.deposited_algo, self.dex_tokens, self.join_day):
+                column.append(0)
+            if row % 8 == 0:
+                self.status.append(0)
+            self._row_by_name[name] = row
+            self._row_by_address[address] = row
+        self.algo[row] = algo
+        self.units[row] = units
+        self.uctzar[row] = uctzar
+        self.deposited_algo[row] = deposited_algo
+        self.dex_tokens[row] = dex_tokens
+        self.join_day[row] = join_day
+        self.set_active(row, bool(active))
+        return row
+
+    def record(self, row):
+        """Return a dict-like view of one row."""
+        return StakeRecord(self, row)
+
+    def view(self):
+        """Return a list-like view of all rows, compatible with the old get_all_accounts() list of dicts."""
+        return AccountsView(self)
+
+
+class StakeRecord(MutableMapping):
+    """Dict-like view of one ledger row, with the same keys as the old account dicts. Writes go to the ledger columns."""
+
+    __slots__ = ("ledger", "row")
+
+    def __init__(self, ledger, row):
+        self.ledger = ledger
+        self.row = row
+
+    def __getitem__(self, key):
+        ledger, row = self.ledger, self.row
+        if key == "Account name":
+            return ledger.names[row]
+        if key == "Account address":
+            return ledger.addresses[row]
+        if key == "Contributed Algo":
+            # Reading a contribution settles the fees accrued since the last checkpoint
+            return ledger.settle(row)
+        if key == "Contributed UCTZAR":
+            return ledger.uctzar[row]
+        if key == "DEX tokens":
+            return ledger.dex_tokens[row]
+        if key == "Join date":
+            return from_day_number(ledger.join_day[row])
+        if key == "Status":
+            return "Active" if ledger.is_active(row) else "Left"
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        ledger, row = self.ledger, self.row
+        ledger.touch(row)
+        if key == "Contributed Algo":
+            ledger.set_algo(row, value)
+        elif key == "Contributed UCTZAR":
+            ledger.uctzar[row] = int(value)
+        elif key == "DEX tokens":
+            ledger.dex_tokens[row] = int(value)
+        elif key == "Join date":
+            ledger.join_day[row] = to_day_number(value)
+        elif key == "Status":
+            ledger.set_status(row, value == "Active")
+        elif key in FIELDS:
+            # Names and addresses are index keys, so changing them in place would corrupt the lookups
+            raise KeyError(f"'{key}' cannot be changed once the account has been created")
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise KeyError(f"'{key}' cannot be removed from a ledger record")
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, StakeRecord):
+            return self.ledger is other.ledger and self.row == other.row
+        return dict(self) == other
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class AccountsView(Sequence):
+    """List-like view of every ledger row as a StakeRecord."""
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.ledger.record(row) for row in range(len(self.ledger))[index]]
+        if index < 0:
+            index += len(self.ledger)
+        if not 0 <= index < len(self.ledger):
+            raise IndexError("account index out of range")
+        return self.ledger.record(index)
+
+    def __len__(self):
+        return len(self.ledger)
+
+    def __repr__(self):
+        return repr([dict(record) for record in self])
@@ -0,0 +1,272 @@
+# Description - Durable state store for the Dex stakers and the stokvels, built on a write-ahead log and snapshots
+# Every change is appended to a write-ahead log before the caller is told it succeeded. A commit thread writes
+# the records of all concurrent callers with one write and one fsync (group commit), so the cost of a flush is
+# shared. Every snapshot_every records the owner writes a compacted snapshot of its whole state. Log segments
+# that are fully covered by the snapshot are then deleted. On restart the latest snapshot is loaded and only
+# the records after it are replayed. Nothing is rebuilt from the chain.
+#
+# Layout of the store directory:
+#   snapshot-<seq>.json   the full state as of record <seq>
+#   wal-<seq>.log         log records from <seq> on, one "<crc32> <json>" line per record
+# A torn last line, e.g. after a crash in the middle of a write, fails its checksum and is cut off when the store is opened.
+
+import glob
+import json
+import os
+import threading
+import time
+import zlib
+
+import metrics
+
+SNAPSHOT_PREFIX = "snapshot-"
+WAL_PREFIX = "wal-"
+
+
+class StateStoreError(Exception):
+    pass
+
+
+def _seq_of(path, prefix):
+    return int(os.path.basename(path)[len(prefix):].split(".")[0])
+
+
+def _fsync_directory(directory):
+    # Make renames and new files in the directory durable (not supported on Windows)
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StateStore:
+    def __init__(self, directory, snapshot_every=1000, commit_delay=0.002, sync=True):
+        """Open the store in directory, creating it if needed, and read back what it holds.
+
+        snapshot_every is the number of records after which snapshot_due() asks the owner for a snapshot.
+        commit_delay is how long the commit thread waits for more records before it writes a group.
+        With sync=False the log is flushed but not fsynced, which is faster but not crash safe.
+        """
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.commit_delay = commit_delay
+        self.sync = sync
+        os.makedirs(directory, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._pending = []  # encoded records waiting for the commit thread
+        self._seq = 0  # last record appended
+        self._durable = 0  # last record written (and fsynced)
+        self._error = None
+        self._closed = False
+        self._io_lock = threading.Lock()  # held while writing to or rotating the log file
+        self._snapshot_lock = threading.Lock()
+
+        self.snapshot_seq, self._snapshot_state = self._read_snapshot()
+        self._tail = self._read_log()
+        if self._tail:
+            self._seq = self._durable = self._tail[-1]["seq"]
+        else:
+            self._seq = self._durable = self.snapshot_seq
+        self._records_since_snapshot = len(self._tail)
+
+        # New records always go to a new segment, so a torn segment is never appended to
+        self._file = open(self._segment_path(self._seq + 1), "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._commit_loop, name="state-store-commit", daemon=True)
+        self._thread.start()
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"{WAL_PREFIX}{first_seq:012d}.log")
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, f"{WAL_PREFIX}*.log")), key=lambda path: _seq_of(path, WAL_PREFIX))
+
+    def _snapshots(self):
+        return sorted(glob.glob(os.path.join(self.directory, f"{SNAPSHOT_PREFIX}*.json")), key=lambda path: _seq_of(path, SNAPSHOT_PREFIX))
+
+    # Recovery
+
+    def _read_snapshot(self):
+        # The newest snapshot wins; a snapshot is only renamed into place once it is complete
+        snapshots = self._snapshots()
+        if not snapshots:
+            return 0, None
+        with open(snapshots[-1], encoding="utf-8") as f:
+            snapshot = json.load(f)
+        return snapshot["seq"], snapshot["state"]
+
+    def _read_log(self):
+        # Read every record after the snapshot. A bad line can only be the torn tail of the last write, so the
+        # segment is cut off there and any later segments (which cannot exist after a clean write) are ignored.
+        records = []
+        segments = self._segments()
+        for index, path in enumerate(segments):
+            good_bytes = 0
+            torn = False
+            with open(path, "rb") as f:
+                for line in f:
+                    record = self._decode(line)
+                    if record is None:
+                        torn = True
+                        break
+                    good_bytes += len(line)
+                    if record["seq"] > self.snapshot_seq:
+                        records.append(record)
+            if torn:
+                print(f"Warning: the state log {path} ends in an incomplete record, which has been discarded.")
+                with open(path, "r+b") as f:
+                    f.truncate(good_bytes)
+                for later in segments[index + 1:]:
+                    os.remove(later)
+                break
+        return records
+
+    @staticmethod
+    def _encode(record):
+        text = json.dumps(record, separators=(",", ":"))
+        return f"{zlib.crc32(text.encode()):08x} {text}\n"
+
+    @staticmethod
+    def _decode(line):
+        if not line.endswith(b"\n"):
+            return None
+        checksum, _, text = line.rstrip(b"\n").partition(b" ")
+        try:
+            if int(checksum, 16) != zlib.crc32(text):
+                return None
+            return json.loads(text)
+        except ValueError:
+            return None
+
+    def load(self):
+        """Return (snapshot state or None, list of records after it) read when the store was opened. Only the first call gets them."""
+        state, tail = self._snapshot_state, self._tail
+        self._snapshot_state, self._tail = None, []
+        return state, tail
+
+    # Writing
+
+    def append(self, record):
+        """Queue a record (a JSON-serialisable dict) for the log and return its sequence number without waiting.
+
+        Records are written in the order they are appended. Call wait() with the number before reporting success.
+        """
+        with self._cond:
+            if self._error is not None:
+                raise StateStoreError(f"The state store can no longer write: {self._error}")
+            if self._closed:
+                raise StateStoreError("The state store is closed.")
+            self._seq += 1
+            self._pending.append(self._encode(dict(record, seq=self._seq)))
+            self._records_since_snapshot += 1
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq):
+        """Block until record seq is durable. Raises StateStoreError if writing the log failed."""
+        with self._cond:
+            while self._durable < seq:
+                if self._error is not None:
+                    raise StateStoreError(f"The state store could not write record {seq}: {self._error}")
+                self._cond.wait()
+
+    def commit(self, record):
+        """Append a record and wait until it is durable. Returns its sequence number."""
+        seq = self.append(record)
+        self.wait(seq)
+        return seq
+
+    def last_seq(self):
+        with self._cond:
+            return self._seq
+
+    def _commit_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            # Give concurrent callers a moment to join this group
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self._cond:
+                group, self._pending = self._pending, []
+                last = self._seq
+            started = time.perf_counter()
+            try:
+                with self._io_lock:
+                    self._file.write("".join(group))
+                    self._file.flush()
+                    if self.sync:
+                        os.fsync(self._file.fileno())
+                    # Updated before the file can be rotated, so a new segment is always named after its first record
+                    with self._cond:
+                        self._durable = last
+                        self._cond.notify_all()
+            except OSError as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            metrics.registry.observe("dex_state_commit_seconds", time.perf_counter() - started)
+            metrics.registry.inc("dex_state_records_total", len(group))
+            metrics.registry.inc("dex_state_commits_total")
+
+    # Snapshots
+
+    def snapshot_due(self):
+        """Return True when enough records have been logged since the last snapshot."""
+        return self._records_since_snapshot >= self.snapshot_every
+
+    def write_snapshot(self, state, seq):
+        """Write state, which must include every record up to seq, as the new snapshot and drop the log it covers.
+
+        The owner takes the state under its own lock and may write it after releasing the lock. If another snapshot is
+        being written, this one is skipped and False is returned.
+        """
+        if not self._snapshot_lock.acquire(blocking=False):
+            return False
+        try:
+            if seq <= self.snapshot_seq:
+                return False
+            path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{seq:012d}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"seq": seq, "state": state}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_directory(self.directory)
+            with self._cond:
+                self._records_since_snapshot = self._seq - seq
+            self.snapshot_seq = seq
+
+            # Start a new segment, then delete the segments and snapshots that the new snapshot makes redundant.
+            # A segment can go once the next segment starts at or before seq + 1.
+            with self._io_lock:
+                self._file.close()
+                with self._cond:
+                    next_seq = self._durable + 1
+                self._file = open(self._segment_path(next_seq), "a", encoding="utf-8")
+            segments = self._segments()
+            for path_, following in zip(segments, segments[1:]):
+                if _seq_of(following, WAL_PREFIX) <= seq + 1:
+                    os.remove(path_)
+            for old in self._snapshots()[:-1]:
+                os.remove(old)
+            return True
+        finally:
+            self._snapshot_lock.release()
+
+    def close(self):
+        """Write every queued record and stop the commit thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._io_lock:
+            self._file.close()
@@ -0,0 +1,474 @@
+# Description - Headless core of the Algo stokvel: members, the 4-of-5 multisig wallet, contributions and payouts
+# Importing this module has no side effects: no prompts, no network calls and no SDK import. The algod client and
+# its helpers are created on first use by algod_context, and every secret phrase is passed in as an argument.
+# A signer.KeyHandle can be passed instead of a secret phrase; keys are derived once per session by the shared signer.
+# stokvel_algorand.py is the interactive front end built on top of this module.
+
+import json
+import random
+import calendar
+from base64 import b64decode
+from dataclasses import dataclass
+from datetime import datetime
+
+import algod_context
+import metrics
+
+# Every stokvel has this many members, and this many of them must sign a payout from the multisig wallet
+STOKVEL_SIZE = 5
+PAYOUT_THRESHOLD = 4
+
+
+class Account:
+    def __init__(self, name, address, contribution_amount, contribution_date, payout_date):
+        self.account_data = {
+            "Account name": name,
+            "Account address": address,
+            "Contribution amount": int(contribution_amount),
+            "Opt in": "Yes",  # Default opt-in status to "Yes"
+            "Contribution date": contribution_date,
+            "Payout date": payout_date
+
+        }
+
+    def get_account_data(self):
+        return self.account_data
+
+    def set_opt_out(self, name, accounts_list):
+        """Set the opt-in status to 'No' for the account with the given name."""
+        for account in accounts_list:
+            if account.account_data["Account name"] == name:
+                account.account_data["Opt in"] = "No"
+                print(f"Account '{name}' has been opted out.")
+                return
+        print(f"Account '{name}' not found.")
+
+
+class AccountManager:
+    def __init__(self):
+        self.accounts = []
+
+    def add_account(self, name, address, contribution_amount, contribution_date, payout_date):
+        account = Account(name, address, contribution_amount, contribution_date, payout_date)
+        self.accounts.append(account.get_account_data())
+
+    def get_all_accounts(self):
+        return self.accounts
+
+
+@dataclass
+class MemberContribution:
+    name: str
+    address: str
+    amount: int
+    txid: str = ""
+    status: str = "Waiting"  # Signed, Confirmed, or Missing / Invalid / Rejected / Failed
+    error: str = ""
+    confirmed_round: int = 0
+    result: dict = None  # pending transaction information once confirmed
+
+
+def _signature_valid(signed_txn):
+    # A pre-signed contribution must carry a valid signature of its sender, or of the account the sender is rekeyed to
+    from algosdk import constants, encoding
+    from nacl.exceptions import BadSignatureError
+    from nacl.signing import VerifyKey
+
+    signature = signed_txn.signature
+    if not signature:
+        return False
+    if isinstance(signature, str):
+        signature = b64decode(signature)
+    message = constants.txid_prefix + b64decode(encoding.msgpack_encode(signed_txn.transaction))
+    try:
+        VerifyKey(encoding.decode_address(signed_txn.authorizing_address or signed_txn.transaction.sender)).verify(message, signature)
+    except (BadSignatureError, ValueError):
+        return False
+    return True
+
+
+def print_contribution_status(statuses):
+    """Print one line per member of a contribution round from contribution_round."""
+    print("Contribution round status:")
+    for status in statuses:
+        line = f"  {status.name:<15} {status.address} {status.amount:>12} MicroAlgos  {status.status}"
+        if status.confirmed_round:
+            line += f" in round {status.confirmed_round}"
+        if status.error:
+            line += f" ({status.error})"
+        print(line)
+
+
+class StokvelAccountManager:
+    def __init__(self, accounts_list, store=None):
+        """Create the stokvel. With a state_store.StateStore, the membership and every later change are saved to it."""
+        self.accounts_list = accounts_list
+        self.multisig_address = None
+        self.payout_tracker = set()  # Set to track who has received payouts
+        self.history = []  # contributions and payouts made so far, oldest first
+        self.store = store
+        if store is not None:
+            # A new stokvel replaces whatever the store held, history included
+            self.store.commit(self.state_image())
+
+    @classmethod
+    def load(cls, store):
+        """Return the stokvel saved in store, or None if the store is empty."""
+        state, records = store.load()
+        if state is None and not records:
+            return None
+        manager = cls([])
+        if state is not None:
+            manager.load_state(state)
+        for record in records:
+            manager.load_state(record)
+            if record.get("event") is not None:
+                manager.history.append(record["event"])
+        manager.store = store
+        print(f"Restored the stokvel of {len(manager.accounts_list)} members and {len(manager.history)} contributions and payouts from the state store.")
+        return manager
+
+    def state_image(self):
+        """Return the members, the multisig wallet, the payout tracker and the history as plain data, as saved in a snapshot."""
+        return {"accounts": self.accounts_list, "multisig_address": self.multisig_address, "payout_tracker": sorted(self.payout_tracker), "history": self.history}
+
+    def load_state(self, image):
+        """Load a state_image(), e.g. from a snapshot or a replay checkpoint."""
+        self.accounts_list = [dict(account) for account in image["accounts"]]
+        self.multisig_address = image["multisig_address"]
+        self.payout_tracker = set(image["payout_tracker"])
+        if "history" in image:
+            self.history = list(image["history"])
+
+    def _save(self, event=None):
+        # The members and tracker are small, so every record holds all of them; only the history is logged as a delta
+        if event is not None:
+            self.history.append(event)
+        if self.store is None:
+            return
+        seq = self.store.commit({"accounts": self.accounts_list, "multisig_address": self.multisig_address, "payout_tracker": sorted(self.payout_tracker), "event": event})
+        if self.store.snapshot_due():
+            self.store.write_snapshot(self.state_image(), seq)
+
+    def signatory_addresses(self):
+        return [account["Account address"] for account in self.accounts_list]
+
+    def multisig(self):
+        """Return the 4-of-5 multisig of the members' addresses."""
+        from algosdk import transaction
+
+        return transaction.Multisig(version=1, threshold=PAYOUT_THRESHOLD, addresses=self.signatory_addresses())
+
+    def create_multisig_account(self):
+        """Create the multisig wallet that houses the stokvel's funds and return its address, or None with too few members."""
+        # Ensure that the accounts_list contains at least 5 accounts
+        if len(self.accounts_list) < STOKVEL_SIZE:
+            print("Error: There must 5 accounts to create a multisig account.")
+            return None
+
+        self.multisig_address = self.multisig().address()
+        self._save()
+        print("A multi-signatory account has been created to house your funds")
+        print("Multisig Address: ", self.multisig_address)
+        return self.multisig_address
+
+    def _ready(self, process):
+        # Every member must still be opted in and the multisig wallet must exist
+        if any(account["Opt in"] == "No" for account in self.accounts_list):
+            print(f"Error: At least one account has opted out (Opt in status is 'No'). {process} process halted.")
+            return False
+        if not self.multisig_address:
+            print("Error: No multisig account created. Please create the multisig account first.")
+            return False
+        return True
+
+    def prepare_contributions(self):
+        """Build this round's contributions as one atomic group and return the unsigned transactions, in member order.
+
+        A member can sign their own transaction ahead of time and pass the signed transaction to contribution_round
+        together with this group. Returns None if a member has opted out or the multisig wallet does not exist yet.
+        """
+        from algosdk import transaction
+        from params_cache import new_lease
+
+        if not self._ready("Contribution"):
+            return None
+
+        # Get suggested transaction parameters from the shared cache
+        params = algod_context.get_params_cache().get()
+
+        # One payment per member, with the multisig address as the receiver, bound together by a group id
+        group = [
+            transaction.PaymentTxn(
+                sender=account["Account address"],
+                sp=params,
+                receiver=self.multisig_address,
+                amt=account["Contribution amount"],
+                note=b"Stokvel contribution",
+                lease=new_lease(),
+            )
+            for account in self.accounts_list
+        ]
+        transaction.assign_group_id(group)
+        return group
+
+    @metrics.traced("contribution")
+    def contribution_round(self, member_contributions, group=None):
+        """Pay every member's contribution into the multisig wallet as one atomic group and return the status of each member.
+
+        member_contributions maps each member's wallet address to the secret phrase that signs their contribution, or
+        to their contribution already signed from group, the transactions returned by prepare_contributions (a new group
+        is built if it is not given). The group is only submitted once every member's contribution is signed, so
+        either every member pays, all in one block, or nobody does.
+        Returns a list of MemberContribution in member order, or None if a member has opted out or the multisig wallet
+        does not exist yet.
+        """
+        from algosdk import transaction
+
+        if group is None:
+            group = self.prepare_contributions()
+        elif not self._ready("Contribution"):
+            group = None
+        if group is None:
+            return None
+        if [txn.sender for txn in group] != [account["Account address"] for account in self.accounts_list]:
+            print("Error: The contribution group does not match the members of the stokvel. Please prepare the contributions again.")
+            return None
+
+        signer = algod_context.get_signer()
+        statuses = [MemberContribution(account["Account name"], account["Account address"], account["Contribution amount"], txid=txn.get_txid()) for account, txn in zip(self.accounts_list, group)]
+        signed_group = [None] * len(group)
+        keys = {}
+        for index, status in enumerate(statuses):
+            given = member_contributions.get(status.address)
+            if given is None:
+                status.status, status.error = "Missing", "no secret phrase or signed contribution was given"
+            elif isinstance(given, transaction.SignedTransaction):
+                # Pre-signed: it must be exactly this member's transaction in this group, with a valid signature
+                if given.transaction.get_txid() != status.txid:
+                    status.status, status.error = "Invalid", "the signed contribution is not this member's transaction in this round"
+                elif not _signature_valid(given):
+                    status.status, status.error = "Invalid", "the signature of the contribution is not valid"
+                else:
+                    signed_group[index] = given
+                    status.status = "Signed"
+            else:
+                try:
+                    key = signer.handle(given)
+                except Exception as e:
+                    status.status, status.error = "Invalid", f"the secret phrase could not be used: {e}"
+                    continue
+                if key.address != status.address:
+                    status.status, status.error = "Invalid", "the secret phrase is not for this member's wallet"
+                else:
+                    keys[index] = key
+
+        # Sign the remaining contributions in one batch; each member's key is derived at most once per session
+        if keys:
+            indexes = list(keys)
+            signed = signer.sign_many([group[index] for index in indexes], {statuses[index].address: keys[index] for index in indexes})
+            for index, signed_txn in zip(indexes, signed):
+                signed_group[index] = signed_txn
+                statuses[index].status = "Signed"
+
+        if any(status.status != "Signed" for status in statuses):
+            print_contribution_status(statuses)
+            print("Error: Not every member's contribution is signed, so no contribution has been submitted.")
+            return statuses
+
+        # Submit the whole round once; the group is confirmed in a single block or rejected as a whole
+        try:
+            txid = algod_context.get_algod_client().send_transactions(signed_group)
+        except Exception as e:
+            for status in statuses:
+                status.status, status.error = "Rejected", str(e)
+            print_contribution_status(statuses)
+            print("Error: The contribution round was rejected, so no member has paid.")
+            return statuses
+        print(f"Sent the contribution round of {len(signed_group)} transactions with first txid: {txid}")
+
+        confirmation_watcher = algod_context.get_confirmation_watcher()
+        futures = [confirmation_watcher.watch(status.txid, 4, group[0].last_valid_round) for status in statuses]
+        for status, future in zip(statuses, futures):
+            try:
+                status.result = future.result()
+            except Exception as e:
+                status.status, status.error = "Failed", str(e)
+                continue
+            status.status, status.confirmed_round = "Confirmed", status.result.get("confirmed-round", 0)
+        print_contribution_status(statuses)
+        if any(status.status != "Confirmed" for status in statuses):
+            print("Error: The contribution round could not be confirmed.")
+            return statuses
+
+        print(f"Contribution round confirmed in round: {statuses[0].confirmed_round}")
+        print(f"Decoded note: {b64decode(statuses[0].result['txn']['txn']['note'])}")
+        self._save({
+            "type": "contribution",
+            "date": datetime.today().date().isoformat(),
+            "round": max(status.confirmed_round for status in statuses),
+            "txids": [status.txid for status in statuses],
+            "amount": sum(status.amount for status in statuses),
+        })
+        print("All members of the stokvel have successfully contributed to the stokvel. Now one of the members will receive the contribution")
+        return statuses
+
+    def contribution(self, member_secret_phrases, group=None):
+        """Pay every member's contribution into the multisig wallet and return the confirmed transaction information.
+
+        member_secret_phrases maps each member's wallet address to the secret phrase that authorises their contribution,
+        or to their pre-signed contribution (see contribution_round). Every contribution is confirmed in the same block.
+        Returns None without paying anything if a member has opted out, the multisig wallet does not exist yet or a
+        contribution is missing or invalid.
+        """
+        statuses = self.contribution_round(member_secret_phrases, group)
+        if statuses is None or any(status.status != "Confirmed" for status in statuses):
+            return None
+        return [status.result for status in statuses]
+
+    def payout_amount(self):
+        """Return this month's payout: 60% of the total contributions of all members."""
+        total_contribution = sum(account['Contribution amount'] for account in self.accounts_list)
+        return int(total_contribution * 0.60)
+
+    def choose_payout_account(self):
+        """Randomly choose a member who has not received a payout yet; once everybody has, a new cycle starts."""
+        # Ensure we have accounts left that haven't received a payout this round
+        eligible_accounts = [acc for acc in self.accounts_list if acc["Account address"] not in self.payout_tracker]
+
+        # If all wallets have received a payout, reset the tracker
+        if not eligible_accounts:
+            self.payout_tracker.clear()
+            eligible_accounts = self.accounts_list
+
+        return random.choice(eligible_accounts)
+
+    def prepare_payout(self, chosen_account=None):
+        """Build this month's payout and return a multisig_collector.SignatureCollector for its signatures.
+
+        The collector's exported transaction goes to the signatories, and their partials are passed to collector.add()
+        in whatever order they come back. The payout is submitted as soon as 4 valid signatures are in; pass the
+        collector to complete_payout() to wait for it and record it.
+        chosen_account is the member to pay, e.g. from choose_payout_account; one is chosen if it is not given.
+        Returns None if a member has opted out or the multisig wallet does not exist yet.
+        """
+        from algosdk import transaction
+        from multisig_collector import SignatureCollector
+        from params_cache import new_lease
+
+        if not self._ready("Payout"):
+            return None
+
+        payout_amount = self.payout_amount()
+        if chosen_account is None:
+            chosen_account = self.choose_payout_account()
+
+        # Fetch the suggested parameters from the shared cache
+        params = algod_context.get_params_cache().get()
+
+        # Create the payment transaction to be signed by the multisig
+        unsigned_txn = transaction.PaymentTxn(
+            sender=self.multisig_address,
+            sp=params,
+            receiver=chosen_account["Account address"],
+            amt=payout_amount,
+            note=b"Stokvel payout",
+            lease=new_lease(),
+        )
+        return SignatureCollector(transaction.MultisigTransaction(unsigned_txn, self.multisig()))
+
+    def complete_payout(self, collector, timeout=None):
+        """Wait until the payout of a collector from prepare_payout is confirmed, record it and return the transaction information.
+
+        Raises multisig_collector.CollectorError if the signatures are not all in within timeout seconds.
+        """
+        txn_result = collector.result(timeout)
+        receiver_wallet_address = collector.msig_txn.transaction.receiver
+        payout_amount = collector.msig_txn.transaction.amt
+        self.payout_tracker.add(receiver_wallet_address)  # Track that this wallet has received a payout
+        self._save({
+            "type": "payout",
+            "date": datetime.today().date().isoformat(),
+            "round": txn_result.get("confirmed-round"),
+            "txid": collector.txid,
+            "receiver": receiver_wallet_address,
+            "amount": payout_amount,
+        })
+
+        # Print transaction information and decoded note
+        print(f"Payout transaction information: {json.dumps(txn_result, indent=4)}")
+        print(f"Decoded note: {b64decode(txn_result['txn']['txn']['note'])}")
+
+        print(f"Success! A payout of {payout_amount} was made to {receiver_wallet_address},")
+        print(f"The accounts that have received payouts so far are {self.payout_tracker} ")
+        return txn_result
+
+    @metrics.traced("make_payout")
+    def make_payout(self, signatory_secret_phrases, chosen_account=None):
+        """Pay this month's payout from the multisig wallet and return the confirmed transaction information.
+
+        signatory_secret_phrases are the secret phrases of at least 4 of the 5 members; each signs its own partial,
+        and the payout is submitted as soon as 4 valid signatures have been collected.
+        chosen_account is the member to pay, e.g. from choose_payout_account; one is chosen if it is not given.
+        Returns None without paying anything if a member has opted out, the multisig wallet does not exist yet,
+        fewer than 4 valid signatures were given or algod refused the payout.
+        """
+        from multisig_collector import CollectorError, sign_partial
+
+        if len(signatory_secret_phrases) < PAYOUT_THRESHOLD:
+            print(f"Error: {PAYOUT_THRESHOLD} signatories are needed to authorize a payout, but only {len(signatory_secret_phrases)} were given.")
+            return None
+        collector = self.prepare_payout(chosen_account)
+        if collector is None:
+            return None
+
+        for secret_phrase in signatory_secret_phrases:
+            try:
+                collector.add(sign_partial(collector.exported, secret_phrase))
+            except CollectorError as e:
+                print(f"Error: {e}")
+            if collector.submitted():
+                break
+        if not collector.submitted():
+            if collector.signatures() >= PAYOUT_THRESHOLD:
+                print("Error: The payout was signed but could not be submitted. Nothing was paid.")
+            else:
+                print(f"Error: {PAYOUT_THRESHOLD} valid signatures are needed to authorize a payout, but only {collector.signatures()} were given.")
+            return None
+        return self.complete_payout(collector)
+
+    def opt_out(self, opt_out_name):
+        """Mark the member with the given name (case insensitive) as opted out. Returns False if there is no such member."""
+        for account in self.accounts_list:
+            if account["Account name"].lower() == opt_out_name.lower():
+                account["Opt in"] = "No"
+                self._save()
+                print(f"{account['Account name']} has been marked as opted out. Stokvel payments will now stop. ")
+                return True
+
+        print("Error: No account found with that name.")
+        return False
+
+def increment_months(current_date, months_to_add):
+    # Add the specified number of months to the current date
+    new_month = current_date.month + months_to_add
+    year_increment = (new_month - 1) // 12
+    new_month = (new_month - 1) % 12 + 1  # Ensure month is between 1 and 12
+
+    # Adjust the year
+    new_year = current_date.year + year_increment
+
+    # Get the last day of the new month to avoid date overflow
+    last_day_of_new_month = calendar.monthrange(new_year, new_month)[1]
+
+    # Return the new date, maintaining the same day if possible, or the last day of the new month
+    new_day = min(current_date.day, last_day_of_new_month)
+    return current_date.replace(year=new_year, month=new_month, day=new_day)
+
+def construct_date(day):
+    # Get the current month and year
+    current_month = datetime.now().month
+    current_year = datetime.now().year
+
+    # Create a date using the provided day, current month, and current year
+    return datetime(current_year, current_month, day)
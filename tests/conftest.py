@@ -0,0 +1,70 @@
+# Description - Shared fixtures for the behaviour tests
+# Every test runs against a fresh in-process FakeAlgod ledger, so no testnet access is needed.
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import algod_context
+import dex_core
+from fake_algod import FakeAlgod
+
+ALGO_FUNDING = 10 ** 13  # MicroAlgos given to every test wallet
+UCTZAR_FUNDING = 10 ** 12
+SEED_STAKE = 10 ** 12  # MicroAlgos staked by the first staker, so trades can be priced
+
+
+@pytest.fixture
+def ledger():
+    """A fresh FakeAlgod that every helper in algod_context talks to."""
+    ledger = FakeAlgod(seed=1)
+    algod_context.configure(algod_client=ledger, metadata_path=None)
+    yield ledger
+    algod_context.configure()
+
+
+@pytest.fixture
+def new_wallet(ledger):
+    """Return a function that creates a funded wallet and returns (address, secret phrase)."""
+    from algosdk import account, mnemonic
+
+    def create(holds_uctzar=True):
+        private_key, address = account.generate_account()
+        ledger.fund(address, ALGO_FUNDING)
+        if holds_uctzar:
+            ledger.opt_in(address, dex_core.UCTZAR_ASSET_ID)
+            ledger.holdings[address][dex_core.UCTZAR_ASSET_ID] = UCTZAR_FUNDING
+        return address, mnemonic.from_private_key(private_key)
+
+    return create
+
+
+def make_dex(ledger, new_wallet, store=None):
+    # The Dex wallet creates both assets and a first staker seeds the pool
+    dex_address, dex_phrase = new_wallet(holds_uctzar=False)
+    ledger.create_asset(dex_address, 10 ** 15, "UCTZAR", "UCTZAR", asset_id=dex_core.UCTZAR_ASSET_ID)
+    ledger.create_asset(dex_address, 10 ** 15, "DEX token", "DEX", asset_id=dex_core.DEX_TOKEN_ASSET_ID)
+    manager = dex_core.AccountManager(dex_address=dex_address, store=store)
+    staker_address, staker_phrase = new_wallet()
+    assert manager.onboard("seed staker", staker_address, SEED_STAKE, staker_phrase, dex_phrase)
+    return SimpleNamespace(manager=manager, address=dex_address, phrase=dex_phrase, staker_address=staker_address, staker_phrase=staker_phrase)
+
+
+@pytest.fixture
+def dex(ledger, new_wallet):
+    """A Dex wallet holding both assets, with an AccountManager whose pool was seeded by one staker."""
+    return make_dex(ledger, new_wallet)
+
+
+def settle(registry, route, trader, dex):
+    # Settle a route from the pool registry for trader, an (address, secret phrase) pair
+    address, phrase = trader
+    return registry.settle_route(
+        route, address, phrase, {dex.address: dex.phrase},
+        algod_context.get_params_cache(), algod_context.get_algod_client(), algod_context.get_confirmation_watcher(),
+        opt_in_index=algod_context.get_opt_in_index(), signer=algod_context.get_signer(),
+    )
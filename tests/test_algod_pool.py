@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from algosdk import account, transaction
+from algosdk.error import AlgodHTTPError
+
+from algod_pool import AlgodClientPool
+
+
+class StandInNode(BaseHTTPRequestHandler):
+    # A stand-in algod: replies from the server's routes, {(method, path): (status, body)}, or drops the connection
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply()
+
+    def _reply(self):
+        self.server.requests.append((self.command, self.path, self.client_address[1]))
+        reply = self.server.routes.get((self.command, self.path.split("?")[0]))
+        if reply is None:
+            # Received, but the node fails before answering
+            self.close_connection = True
+            return
+        status, body = reply
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def start_node():
+    servers = []
+
+    def start(routes, idle_timeout=None):
+        # With idle_timeout, the node closes a keep-alive connection that has been idle for that many seconds
+        handler = StandInNode if idle_timeout is None else type("IdleTimeoutNode", (StandInNode,), {"timeout": idle_timeout})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.routes = routes
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def address(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+STATUS = {"last-round": 7, "time-since-last-round": 0, "catchup-time": 0}
+
+
+def test_fails_over_to_the_next_node(start_node):
+    down = start_node({("GET", "/v2/status"): (503, {"message": "overloaded"})})
+    up = start_node({("GET", "/v2/status"): (200, STATUS)})
+    client = AlgodClientPool("", [address(down), address(up)])
+    client.endpoints[1].latency = 1.0  # the failing node looks faster, so it is tried first
+
+    assert client.status()["last-round"] == 7
+    assert len(down.requests) == 1 and len(up.requests) == 1
+    stats = client.endpoint_stats()
+    assert stats[0]["failures"] == 1 and not stats[0]["healthy"]
+
+
+def test_reuses_keep_alive_connections(start_node):
+    node = start_node({("GET", "/v2/status"): (200, STATUS)})
+    client = AlgodClientPool("", [address(node)])
+    for _ in range(3):
+        client.status()
+    client.close()
+
+    assert len(node.requests) == 3
+    assert len({port for _, _, port in node.requests}) == 1
+
+
+def test_connection_closed_by_the_node_is_replaced_without_marking_it_failed(start_node):
+    node = start_node({("GET", "/v2/status"): (200, STATUS)}, idle_timeout=0.2)
+    client = AlgodClientPool("", [address(node)])
+    assert client.status()["last-round"] == 7
+    time.sleep(0.6)
+
+    assert client.status()["last-round"] == 7
+    assert len({port for _, _, port in node.requests}) == 2
+    stats = client.endpoint_stats()
+    assert stats[0]["failures"] == 0 and stats[0]["healthy"]
+    client.close()
+
+
+def signed_payment():
+    private_key, sender = account.generate_account()
+    sp = transaction.SuggestedParams(fee=1000, first=1, last=1000, gh="SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=", flat_fee=True)
+    return transaction.PaymentTxn(sender=sender, sp=sp, receiver=sender, amt=0).sign(private_key)
+
+
+def test_retried_submission_already_in_ledger_counts_as_sent(start_node):
+    stx = signed_payment()
+    # The first node takes the transaction and fails before answering; the second already has it
+    dropped = start_node({})
+    has_it = start_node({("POST", "/v2/transactions"): (400, {"message": f"transaction already in ledger: {stx.get_txid()}"})})
+    client = AlgodClientPool("", [address(dropped), address(has_it)])
+    client.endpoints[1].latency = 1.0
+
+    assert client.send_transaction(stx) == stx.get_txid()
+    assert len(dropped.requests) == 1 and len(has_it.requests) == 1
+
+
+def test_first_submission_already_in_ledger_is_still_an_error(start_node):
+    stx = signed_payment()
+    node = start_node({("POST", "/v2/transactions"): (400, {"message": f"transaction already in ledger: {stx.get_txid()}"})})
+    client = AlgodClientPool("", [address(node)])
+
+    with pytest.raises(AlgodHTTPError, match="already in ledger"):
+        client.send_transaction(stx)
+
+
+def test_retried_submission_rejected_for_another_transaction_is_an_error(start_node):
+    stx = signed_payment()
+    dropped = start_node({})
+    other = start_node({("POST", "/v2/transactions"): (400, {"message": "transaction already in ledger: SOMEONEELSE"})})
+    client = AlgodClientPool("", [address(dropped), address(other)])
+    client.endpoints[1].latency = 1.0
+
+    with pytest.raises(AlgodHTTPError, match="already in ledger"):
+        client.send_transaction(stx)
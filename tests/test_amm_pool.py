@@ -0,0 +1,38 @@
+import pytest
+
+import dex_core
+from amm_pool import PoolState
+
+
+@pytest.fixture
+def shallow_pool():
+    # 2000 Algos against 4000 UCTZAR base units, the initial ratio
+    return PoolState(algo_reserve=2 * 10 ** 9, uctzar_reserve=4000, dex_token_supply=2 * 10 ** 9)
+
+
+def test_rounding_does_not_count_as_price_impact(shallow_pool):
+    # 10 Algos is 0.5% of the reserve; rounding the 20.1 UCTZAR owed up to 21 must not make it a 5% trade
+    quote = shallow_pool.quote_buy_algo(10 ** 7)
+    assert quote.amount_in == 21
+    assert quote.price_impact == pytest.approx(0.005, rel=0.01)
+    assert dex_core.AccountManager()._check_price_impact(quote) is quote
+
+
+def test_large_trades_are_still_refused(shallow_pool):
+    quote = shallow_pool.quote_buy_algo(2 * 10 ** 8)
+    assert quote.price_impact > dex_core.MAX_PRICE_IMPACT
+    assert dex_core.AccountManager()._check_price_impact(quote) is None
+
+
+def test_batch_quotes_match_single_quotes(shallow_pool):
+    pytest.importorskip("numpy")
+    from quote_service import QuoteService
+
+    service = QuoteService(shallow_pool)
+    sizes = [1, 10 ** 6, 10 ** 7, 10 ** 8]
+    batch = service.quote_buy_algo(sizes)
+    for index, size in enumerate(sizes):
+        quote = shallow_pool.quote_buy_algo(size)
+        assert batch.amount_in[index] == quote.amount_in
+        assert batch.fee[index] == quote.fee
+        assert batch.price_impact[index] == pytest.approx(quote.price_impact)
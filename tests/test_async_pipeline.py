@@ -0,0 +1,55 @@
+import asyncio
+import threading
+from base64 import b64decode
+
+from algosdk import encoding
+
+import algod_context
+from conftest import ALGO_FUNDING
+from async_pipeline import AsyncAlgodPipeline
+
+MAX_IN_FLIGHT = 3
+
+
+def test_window_bounds_transactions_in_flight_and_results_keep_submission_order(ledger, new_wallet):
+    multisig_address, _ = new_wallet(holds_uctzar=False)
+    contributions = [(*new_wallet(holds_uctzar=False), 10 ** 6 + index) for index in range(10)]
+    pipeline = AsyncAlgodPipeline(ledger, algod_context.get_params_cache(), algod_context.get_confirmation_watcher(), max_in_flight=MAX_IN_FLIGHT, signer=algod_context.get_signer())
+
+    lock = threading.Lock()
+    in_flight = [0, 0]  # now, most at once
+    signing_threads = set()
+    send_transaction, watch, sign = ledger.send_transaction, pipeline.confirmation_watcher.watch, pipeline.signer.sign
+
+    def counted_send(txn):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        return send_transaction(txn)
+
+    def counted_watch(txid, wait_rounds=4, last_valid_round=None):
+        future = watch(txid, wait_rounds, last_valid_round)
+        future.add_done_callback(confirmed)
+        return future
+
+    def confirmed(future):
+        with lock:
+            in_flight[0] -= 1
+
+    def recorded_sign(secret, txn):
+        signing_threads.add(threading.current_thread().name)
+        return sign(secret, txn)
+
+    ledger.send_transaction = counted_send
+    pipeline.confirmation_watcher = type("Watcher", (), {"watch": staticmethod(counted_watch)})()
+    pipeline.signer = type("Signer", (), {"sign": staticmethod(recorded_sign)})()
+    try:
+        results = asyncio.run(pipeline.contribute_all([(address, phrase, amount) for address, phrase, amount in contributions], multisig_address))
+    finally:
+        pipeline.close()
+
+    assert [encoding.encode_address(b64decode(result["txn"]["txn"]["snd"])) for result in results] == [address for address, _, _ in contributions]
+    assert [result["txn"]["txn"]["amt"] for result in results] == [amount for _, _, amount in contributions]
+    assert 1 < in_flight[1] <= MAX_IN_FLIGHT
+    assert signing_threads and all(name.startswith("algod-io") for name in signing_threads)
+    assert ledger.balance(multisig_address) == ALGO_FUNDING + sum(amount for _, _, amount in contributions)
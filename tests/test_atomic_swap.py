@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from algosdk.error import AlgodHTTPError
+
+import dex_core
+
+
+def test_buy_algo_settles_every_leg_in_one_round(dex, ledger, new_wallet):
+    buyer_address, buyer_phrase = new_wallet()
+    round_before = ledger.round
+    quote = dex.manager.buy_algo(10 ** 9, buyer_address, buyer_phrase, dex.phrase)
+
+    assert quote is not None
+    rounds = [block_round for block_round in ledger.blocks if block_round > round_before]
+    assert len(rounds) == 1
+    assert len(ledger.blocks[rounds[0]]) == 3  # UCTZAR leg, Algo leg and fee leg
+
+
+def test_failed_swap_changes_nothing(dex, ledger, new_wallet):
+    # The buyer holds no UCTZAR, so the UCTZAR leg fails and the Algo and fee legs must not settle either
+    buyer_address, buyer_phrase = new_wallet()
+    ledger.holdings[buyer_address][dex_core.UCTZAR_ASSET_ID] = 0
+    balances = dict(ledger.balances)
+    holdings = {address: dict(held) for address, held in ledger.holdings.items()}
+    reserves = (dex.manager.pool.algo_reserve, dex.manager.pool.uctzar_reserve)
+
+    with pytest.raises(AlgodHTTPError):
+        dex.manager.buy_algo(10 ** 9, buyer_address, buyer_phrase, dex.phrase)
+
+    assert ledger.balances == balances
+    assert ledger.holdings == holdings
+    assert (dex.manager.pool.algo_reserve, dex.manager.pool.uctzar_reserve) == reserves
+
+
+def test_trades_sign_and_settle_concurrently(dex, ledger, new_wallet, monkeypatch):
+    # Both trades must reach algo at the same time, which is only possible if neither holds the manager's lock there
+    pool = dex.manager.pool
+    reserves = (pool.algo_reserve, pool.uctzar_reserve)
+    failing, paying = new_wallet(), new_wallet()
+    ledger.holdings[failing[0]][dex_core.UCTZAR_ASSET_ID] = 0
+    both_sending = threading.Barrier(2, timeout=5)
+    send_transactions = ledger.send_transactions
+
+    def send_together(signed_group, **kwargs):
+        both_sending.wait()
+        return send_transactions(signed_group, **kwargs)
+
+    monkeypatch.setattr(ledger, "send_transactions", send_together)
+    results = {}
+
+    def trade(name, wallet):
+        try:
+            results[name] = dex.manager.buy_algo(10 ** 9, *wallet, dex.phrase)
+        except AlgodHTTPError as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=trade, args=args) for args in (("failing", failing), ("paying", paying))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert isinstance(results["failing"], AlgodHTTPError)
+    quote = results["paying"]
+    # The failed trade's reservation is reverted and only the settled trade moves the reserves
+    assert (pool.algo_reserve, pool.uctzar_reserve) == (reserves[0] - quote.amount_out, reserves[1] + quote.amount_in)
+    assert dex.manager.ledger.fee_income(dex.manager.get_account("seed staker").row) == quote.fee
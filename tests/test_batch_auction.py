@@ -0,0 +1,61 @@
+import dex_core
+from batch_auction import SwapOrder
+
+
+def test_batch_settles_every_order_in_one_round_and_pays_fees_to_stakers(dex, ledger, new_wallet):
+    auction = dex_core.build_batch_auction(dex.manager, window_seconds=0)
+    pool = dex.manager.pool
+    k_before = pool.algo_reserve * pool.uctzar_reserve
+    buyers = [new_wallet() for _ in range(10)]
+    for index, (address, phrase) in enumerate(buyers):
+        side, amount = ("algo", 10 ** 9) if index % 2 else ("uctzar", 10 ** 3)
+        auction.submit(SwapOrder(address, phrase, side, amount))
+    round_before = ledger.round
+
+    result = auction.run_batch(dex.phrase)
+
+    # Ten orders need 20 transactions: two groups, submitted together and settled in the same round
+    assert [order.status for order in result.orders] == ["Settled"] * 10
+    assert result.groups == 2 and result.transactions == 20
+    assert not auction._queue
+    confirmed_round = result.orders[0].confirmed_round
+    assert confirmed_round > round_before and {order.confirmed_round for order in result.orders} == {confirmed_round}
+    assert len(ledger.blocks[confirmed_round]) == 20
+    assert pool.algo_reserve * pool.uctzar_reserve >= k_before
+    assert dex.manager.ledger.fee_income(dex.manager.get_account("seed staker").row) >= result.total_fee - 1 > 0
+
+
+def test_failed_group_leaves_the_other_groups_settled(dex, ledger, new_wallet):
+    auction = dex_core.build_batch_auction(dex.manager, window_seconds=0)
+    pool = dex.manager.pool
+    buyers = [new_wallet() for _ in range(10)]
+    ledger.holdings[buyers[9][0]][dex_core.UCTZAR_ASSET_ID] = 0  # in the second group, and cannot pay for its Algos
+    for address, phrase in buyers:
+        auction.submit(SwapOrder(address, phrase, "algo", 10 ** 9))
+    reserves = (pool.algo_reserve, pool.uctzar_reserve)
+
+    result = auction.run_batch(dex.phrase)
+
+    assert [order.status for order in result.orders] == ["Settled"] * 8 + ["Failed"] * 2
+    settled = result.orders[:8]
+    assert pool.algo_reserve == reserves[0] - sum(order.amount for order in settled)
+    assert pool.uctzar_reserve == reserves[1] + sum(order.amount_in for order in settled)
+    assert result.total_fee == sum(order.fee for order in settled)
+
+
+def test_failed_batch_leaves_pool_and_balances_unchanged(dex, ledger, new_wallet):
+    auction = dex_core.build_batch_auction(dex.manager, window_seconds=0)
+    pool = dex.manager.pool
+    buyers = [new_wallet() for _ in range(3)]
+    ledger.holdings[buyers[1][0]][dex_core.UCTZAR_ASSET_ID] = 0  # cannot pay for its Algos
+    for address, phrase in buyers:
+        auction.submit(SwapOrder(address, phrase, "algo", 10 ** 9))
+    reserves = (pool.algo_reserve, pool.uctzar_reserve, pool.version)
+    balances = dict(ledger.balances)
+
+    result = auction.run_batch(dex.phrase)
+
+    assert [order.status for order in result.orders] == ["Failed"] * 3
+    assert (pool.algo_reserve, pool.uctzar_reserve, pool.version) == reserves
+    assert ledger.balances == balances
+    assert result.total_fee == 0
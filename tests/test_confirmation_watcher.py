@@ -0,0 +1,40 @@
+from algosdk import account, transaction
+
+from confirmation_watcher import ConfirmationWatcher
+from fake_algod import FakeAlgod
+
+
+def send_payment(ledger):
+    private_key, address = account.generate_account()
+    ledger.fund(address, 10 ** 9)
+    txn = transaction.PaymentTxn(sender=address, sp=ledger.suggested_params(), receiver=address, amt=0)
+    return ledger.send_transaction(txn.sign(private_key))
+
+
+def test_txid_registered_after_its_block_was_processed_resolves_at_once():
+    # Blocks are a minute apart, so a txid that is missed would only be found when it expires
+    ledger = FakeAlgod(block_time=60)
+    watcher = ConfirmationWatcher(ledger)
+    txid = send_payment(ledger)
+    with ledger._lock:
+        ledger._close_block()
+    watcher._process_round(ledger.round)
+
+    future = watcher.watch(txid)
+    assert future.result(timeout=5)["confirmed-round"] == ledger.round
+
+
+def test_watch_asks_for_the_round_without_holding_the_lock():
+    ledger = FakeAlgod()
+    watcher = ConfirmationWatcher(ledger)
+    status = ledger.status
+    held = []
+
+    def checked_status():
+        held.append(watcher._lock.locked())
+        return status()
+
+    ledger.status = checked_status
+    txid = send_payment(ledger)
+    assert watcher.wait(txid)["confirmed-round"] == ledger.round
+    assert held == [False]
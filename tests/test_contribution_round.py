@@ -0,0 +1,79 @@
+from base64 import b64decode, b64encode
+
+from algosdk import mnemonic
+
+import stokvel_core
+
+CONTRIBUTION = 10 ** 6
+
+
+def new_stokvel(new_wallet):
+    members = [new_wallet(holds_uctzar=False) for _ in range(stokvel_core.STOKVEL_SIZE)]
+    registry = stokvel_core.AccountManager()
+    for index, (address, _) in enumerate(members):
+        registry.add_account(f"member {index}", address, CONTRIBUTION, "1", "2")
+    stokvel = stokvel_core.StokvelAccountManager(registry.get_all_accounts())
+    stokvel.create_multisig_account()
+    return stokvel, members
+
+
+def presigned(txn, phrase):
+    return txn.sign(mnemonic.to_private_key(phrase))
+
+
+def test_round_with_a_missing_key_and_a_tampered_signature_submits_nothing(ledger, new_wallet):
+    stokvel, members = new_stokvel(new_wallet)
+    group = stokvel.prepare_contributions()
+    assert [txn.sender for txn in group] == [address for address, _ in members]
+    assert len({txn.group for txn in group}) == 1 and group[0].group is not None
+    assert all(txn.receiver == stokvel.multisig_address and txn.amt == CONTRIBUTION for txn in group)
+
+    tampered = presigned(group[2], members[2][1])
+    signature = b64decode(tampered.signature)
+    tampered.signature = b64encode(bytes([signature[0] ^ 1]) + signature[1:]).decode()
+    given = {
+        members[0][0]: members[0][1],
+        members[1][0]: presigned(group[1], members[1][1]),
+        # members[3] gives nothing
+        members[2][0]: tampered,
+        members[4][0]: members[4][1],
+    }
+    balances = [ledger.balance(address) for address, _ in members]
+
+    statuses = stokvel.contribution_round(given, group)
+
+    assert [status.address for status in statuses] == [address for address, _ in members]
+    assert [status.txid for status in statuses] == [txn.get_txid() for txn in group]
+    assert [status.status for status in statuses] == ["Signed", "Signed", "Invalid", "Missing", "Signed"]
+    assert "signature" in statuses[2].error and statuses[3].error
+    assert all(not status.confirmed_round for status in statuses)
+    assert [ledger.balance(address) for address, _ in members] == balances
+    assert ledger.balance(stokvel.multisig_address) == 0
+    assert stokvel.history == []
+
+
+def test_round_of_phrases_and_presigned_contributions_is_confirmed_in_one_block(ledger, new_wallet):
+    stokvel, members = new_stokvel(new_wallet)
+    group = stokvel.prepare_contributions()
+    given = dict(members)
+    given[members[1][0]] = presigned(group[1], members[1][1])
+
+    statuses = stokvel.contribution_round(given, group)
+
+    assert [status.status for status in statuses] == ["Confirmed"] * stokvel_core.STOKVEL_SIZE
+    assert len({status.confirmed_round for status in statuses}) == 1
+    assert ledger.balance(stokvel.multisig_address) == CONTRIBUTION * stokvel_core.STOKVEL_SIZE
+    assert stokvel.history[-1]["txids"] == [txn.get_txid() for txn in group]
+
+
+def test_presigned_transaction_from_another_round_is_invalid(ledger, new_wallet):
+    stokvel, members = new_stokvel(new_wallet)
+    stale = stokvel.prepare_contributions()
+    group = stokvel.prepare_contributions()
+    given = dict(members)
+    given[members[0][0]] = presigned(stale[0], members[0][1])
+
+    statuses = stokvel.contribution_round(given, group)
+
+    assert statuses[0].status == "Invalid" and "this round" in statuses[0].error
+    assert ledger.balance(stokvel.multisig_address) == 0
@@ -0,0 +1,34 @@
+import dex_core
+import event_replay
+from batch_auction import SwapOrder
+from conftest import settle
+from pool_router import ALGO_ASSET_ID
+
+
+def test_replay_rebuilds_the_live_dex_state(dex, ledger, new_wallet, tmp_path):
+    manager = dex.manager
+    names = {dex.staker_address: "seed staker"}
+    for index in range(2):
+        address, phrase = new_wallet()
+        names[address] = f"staker {index}"
+        assert manager.onboard(f"staker {index}", address, 10 ** 11 * (index + 1), phrase, dex.phrase)
+        if index == 0:
+            leaving_phrase = phrase
+    trader = new_wallet()
+    assert manager.buy_algo(10 ** 9, *trader, dex.phrase) is not None
+    assert manager.buy_uctzar(10 ** 4, *trader, dex.phrase) is not None
+
+    auction = dex_core.build_batch_auction(manager, window_seconds=0)
+    for side, amount in (("algo", 10 ** 9), ("uctzar", 10 ** 3)):
+        auction.submit(SwapOrder(*new_wallet(), side, amount))
+    assert auction.run_batch(dex.phrase).total_fee > 0
+    registry = dex_core.build_pool_registry(manager)
+    settle(registry, registry.best_route(ALGO_ASSET_ID, dex_core.UCTZAR_ASSET_ID, 10 ** 9), new_wallet(), dex)
+    assert manager.withdraw_stake("staker 0", leaving_phrase, dex.phrase)
+
+    export = str(tmp_path / "transactions.jsonl")
+    ledger.export_transactions(export)
+    engine = event_replay.ReplayEngine(dex.address, names=names, checkpoint_path=str(tmp_path / "checkpoint.json"), chunk_size=4)
+    engine.replay(export)
+
+    assert engine.manager.state_image() == manager.state_image()
@@ -0,0 +1,39 @@
+import threading
+
+from algosdk import account, transaction
+
+from fake_algod import FakeAlgod
+
+
+def payments(ledger, count):
+    private_key, address = account.generate_account()
+    ledger.fund(address, 10 ** 9)
+    sp = ledger.suggested_params()
+    txns = [transaction.PaymentTxn(sender=address, sp=sp, receiver=address, amt=index) for index in range(count)]
+    return private_key, txns
+
+
+def test_blocks_never_split_an_atomic_group():
+    ledger = FakeAlgod(max_block_txns=4)
+    private_key, txns = payments(ledger, 5)
+    singles = [ledger.send_transaction(txn.sign(private_key)) for txn in txns[:2]]
+    group = txns[2:]
+    transaction.assign_group_id(group)
+    ledger.send_transactions([txn.sign(private_key) for txn in group])
+
+    ledger.status_after_block(ledger.round)
+    ledger.status_after_block(ledger.round)
+    blocks = [ledger.blocks[block_round] for block_round in sorted(ledger.blocks)]
+
+    # Two payments and a group of three do not fit in a block of four, so the whole group waits for the next block
+    assert blocks == [singles, [txn.get_txid() for txn in group]]
+
+
+def test_calls_are_counted_exactly_under_concurrency():
+    ledger = FakeAlgod()
+    threads = [threading.Thread(target=lambda: [ledger.status() for _ in range(500)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ledger.calls["status"] == 4000
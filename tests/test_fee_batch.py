@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from fee_batch import INT64_SAFE, distribute_fees, largest_remainder_shares
+from stake_ledger import StakeLedger
+
+
+def test_shares_add_up_to_the_fee_and_differ_from_the_baseline_by_the_remainder_only():
+    rng = random.Random(7)
+    for _ in range(200):
+        contributions = [rng.choice([0, rng.randrange(1, 10 ** 9)]) for _ in range(rng.randrange(1, 40))]
+        if not any(contributions):
+            contributions[0] = 1
+        fee = rng.randrange(0, 10 ** 6)
+        total = sum(contributions)
+
+        shares = largest_remainder_shares(contributions, fee).tolist()
+
+        assert sum(shares) == fee
+        baseline = [int(fee * contribution / total) for contribution in contributions]
+        extra = [share - base for share, base in zip(shares, baseline)]
+        # Every row keeps its baseline share and at most one MicroAlgo of the remainder is added to it
+        assert set(extra) <= {0, 1}
+        assert sum(extra) == fee - sum(baseline)
+        assert all(share == 0 for share, contribution in zip(shares, contributions) if contribution == 0)
+
+
+def test_ties_go_to_the_earliest_row():
+    assert largest_remainder_shares([1, 1, 1], 2).tolist() == [1, 1, 0]
+    assert largest_remainder_shares([0, 5, 0, 5, 5], 4).tolist() == [0, 2, 0, 1, 1]
+    # The same input always gives the same split
+    weights = [3, 6, 3, 6, 0, 3]
+    assert len({tuple(largest_remainder_shares(weights, 10).tolist()) for _ in range(5)}) == 1
+
+
+def test_zero_stake_rows_and_nobody_staking_get_nothing():
+    assert largest_remainder_shares([0, 7, 0], 5).tolist() == [0, 5, 0]
+    assert largest_remainder_shares([0, 0], 5).tolist() == [0, 0]
+    assert largest_remainder_shares([], 5).tolist() == []
+
+
+def test_large_products_are_split_exactly():
+    weights = [INT64_SAFE // 3, INT64_SAFE // 5, 1]
+    fee = 10 ** 6 + 1
+    shares = largest_remainder_shares(weights, fee).tolist()
+    assert sum(shares) == fee
+    assert set(share - fee * weight // sum(weights) for share, weight in zip(shares, weights)) <= {0, 1}
+
+
+def test_distribute_fees_pays_exactly_the_fees_to_active_stakers():
+    ledger = StakeLedger()
+    for name, amount in (("a", 3 * 10 ** 6), ("b", 4 * 10 ** 6 + 1), ("c", 5 * 10 ** 6), ("d", 7)):
+        ledger.append(name, name, amount, 0, "2024-01-01")
+    ledger.set_status(ledger.row_by_name("c"), False)
+    before = {name: ledger.balance(ledger.row_by_name(name)) for name in "abcd"}
+
+    summary = distribute_fees(ledger, [1000, 2001, 3])
+
+    after = {name: ledger.balance(ledger.row_by_name(name)) for name in "abcd"}
+    assert summary["fees"] == 3004 and summary["accounts"] == 3
+    assert sum(after.values()) - sum(before.values()) == 3004
+    assert after["c"] == before["c"]
+    assert all(after[name] >= before[name] for name in "abd")
+    assert ledger.settle_all() == 0
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+import algod_context
+import metrics
+import stokvel_core
+from multisig_collector import sign_partial
+
+
+@pytest.fixture
+def registry(ledger):
+    metrics.registry.reset()
+    yield metrics.registry
+    metrics.registry.reset()
+
+
+def confirmations(registry, site, outcome="ok", expected=None, timeout=5):
+    # A watched future is recorded by its done callback, which may run just after the waiting thread has its result
+    deadline = time.monotonic() + timeout
+    while True:
+        count = registry.counters.get(("dex_confirmations_total", (("outcome", outcome), ("site", site))), 0)
+        if count == expected or time.monotonic() > deadline:
+            return count
+        time.sleep(0.01)
+
+
+def histogram(registry, name, site):
+    return registry.histograms.get((name, (("site", site),)))
+
+
+def test_watched_confirmations_are_recorded_under_their_call_site(registry, new_wallet):
+    members = [new_wallet(holds_uctzar=False) for _ in range(stokvel_core.STOKVEL_SIZE)]
+    accounts = stokvel_core.AccountManager()
+    for index, (address, _) in enumerate(members):
+        accounts.add_account(f"member {index}", address, 10 ** 6, "1", "2")
+    stokvel = stokvel_core.StokvelAccountManager(accounts.get_all_accounts())
+    stokvel.create_multisig_account()
+
+    assert stokvel.contribution(dict(members)) is not None
+    assert confirmations(registry, "contribution", expected=stokvel_core.STOKVEL_SIZE) == stokvel_core.STOKVEL_SIZE
+    assert histogram(registry, "dex_confirmation_seconds", "contribution").count == stokvel_core.STOKVEL_SIZE
+    assert histogram(registry, "dex_confirmation_rounds", "contribution").count == stokvel_core.STOKVEL_SIZE
+
+    # The payout is submitted and watched by the signature collector inside the payout's span
+    collector = stokvel.prepare_payout()
+    with metrics.span("make_payout"):
+        for _, phrase in members[:stokvel_core.PAYOUT_THRESHOLD]:
+            collector.add(sign_partial(collector.exported, phrase))
+    assert stokvel.complete_payout(collector)["confirmed-round"] > 0
+    assert confirmations(registry, "make_payout", expected=1) == 1
+
+
+def test_failed_watch_is_recorded_and_the_callback_still_runs(registry):
+    watcher = algod_context.get_confirmation_watcher()
+    assert isinstance(watcher, metrics.InstrumentedWatcher)
+    called = []
+
+    with metrics.span("lost transaction"):
+        future = watcher.watch("A" * 52, wait_rounds=1, callback=called.append)
+    with pytest.raises(Exception):
+        future.result(timeout=10)
+
+    assert confirmations(registry, "lost transaction", outcome="error", expected=1) == 1
+    assert called == [future]
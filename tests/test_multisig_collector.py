@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+from algosdk.error import AlgodHTTPError
+
+import stokvel_core
+from multisig_collector import CollectorError, sign_partial
+
+
+@pytest.fixture
+def stokvel(ledger, new_wallet):
+    members = [new_wallet(holds_uctzar=False) for _ in range(stokvel_core.STOKVEL_SIZE)]
+    registry = stokvel_core.AccountManager()
+    for index, (address, _) in enumerate(members):
+        registry.add_account(f"member {index}", address, 10 ** 6, "1", "2")
+    stokvel = stokvel_core.StokvelAccountManager(registry.get_all_accounts())
+    stokvel.create_multisig_account()
+    assert stokvel.contribution(dict(members)) is not None
+    return stokvel, [phrase for _, phrase in members]
+
+
+def test_refused_payout_keeps_its_signatures_for_a_retry(stokvel, ledger, monkeypatch):
+    stokvel, phrases = stokvel
+    collector = stokvel.prepare_payout()
+    send_transaction = ledger.send_transaction
+
+    def refuse(txn):
+        monkeypatch.setattr(ledger, "send_transaction", send_transaction)
+        raise AlgodHTTPError("node is overloaded")
+
+    monkeypatch.setattr(ledger, "send_transaction", refuse)
+    for phrase in phrases[:stokvel_core.PAYOUT_THRESHOLD - 1]:
+        collector.add(sign_partial(collector.exported, phrase))
+    with pytest.raises(CollectorError, match="overloaded"):
+        collector.add(sign_partial(collector.exported, phrases[stokvel_core.PAYOUT_THRESHOLD - 1]))
+
+    assert not collector.submitted()
+    assert collector.signatures() == stokvel_core.PAYOUT_THRESHOLD
+    assert collector.submit() == collector.txid
+    assert stokvel.complete_payout(collector)["confirmed-round"] > 0
+
+
+def test_partials_are_answered_while_the_payout_is_submitted(stokvel, ledger, monkeypatch):
+    stokvel, phrases = stokvel
+    collector = stokvel.prepare_payout()
+    late = sign_partial(collector.exported, phrases[-1])
+    send_transaction = ledger.send_transaction
+    replies = []
+
+    def send_while_another_signatory_replies(txn):
+        # The collector's lock must be free while algod is called, or this reply would wait for the submission
+        signatory = threading.Thread(target=lambda: replies.append(collector.add(late)))
+        signatory.start()
+        signatory.join(timeout=5)
+        return send_transaction(txn)
+
+    monkeypatch.setattr(ledger, "send_transaction", send_while_another_signatory_replies)
+    for phrase in phrases[:stokvel_core.PAYOUT_THRESHOLD]:
+        collector.add(sign_partial(collector.exported, phrase))
+
+    assert len(replies) == 1 and "not needed" in replies[0]
+    assert collector.signatures() == stokvel_core.PAYOUT_THRESHOLD
+    assert stokvel.complete_payout(collector)["confirmed-round"] > 0
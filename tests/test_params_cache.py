@@ -0,0 +1,27 @@
+import dex_core
+import stokvel_core
+from conftest import ALGO_FUNDING
+
+
+def test_back_to_back_contribution_rounds_both_settle(ledger, new_wallet):
+    # Both rounds are built from the same cached parameters, so only their leases tell them apart
+    members = [new_wallet(holds_uctzar=False) for _ in range(stokvel_core.STOKVEL_SIZE)]
+    registry = stokvel_core.AccountManager()
+    for index, (address, _) in enumerate(members):
+        registry.add_account(f"member {index}", address, 10 ** 6, "1", "2")
+    stokvel = stokvel_core.StokvelAccountManager(registry.get_all_accounts())
+    stokvel.create_multisig_account()
+
+    stokvel.contribution(dict(members))
+    stokvel.contribution(dict(members))
+    assert ledger.balance(stokvel.multisig_address) == 2 * stokvel_core.STOKVEL_SIZE * 10 ** 6
+
+
+def test_identical_payments_have_different_txids(ledger, new_wallet):
+    payer_address, payer_phrase = new_wallet(holds_uctzar=False)
+    receiver_address, _ = new_wallet(holds_uctzar=False)
+    first = dex_core.algo_payment(payer_address, payer_phrase, receiver_address, 10 ** 6, "Repeated payment")
+    second = dex_core.algo_payment(payer_address, payer_phrase, receiver_address, 10 ** 6, "Repeated payment")
+    assert first["txn"] != second["txn"]
+    assert ledger.balance(receiver_address) == ALGO_FUNDING + 2 * 10 ** 6
+
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+import algod_context
+import dex_core
+from amm_pool import PoolState
+from conftest import make_dex, settle
+from pool_router import ALGO_ASSET_ID, PoolRegistry
+from state_store import StateStore
+
+
+@pytest.mark.parametrize("asset_in, amount_in", [(ALGO_ASSET_ID, 10 ** 9), (dex_core.UCTZAR_ASSET_ID, 2000)])
+def test_dex_pool_hop_pays_its_fee_to_the_stakers(dex, new_wallet, asset_in, amount_in):
+    manager = dex.manager
+    registry = dex_core.build_pool_registry(manager)
+    asset_out = dex_core.UCTZAR_ASSET_ID if asset_in == ALGO_ASSET_ID else ALGO_ASSET_ID
+    route = registry.best_route(asset_in, asset_out, amount_in)
+    pair = route.pairs[0]
+    amount_out, fee = pair.quote(asset_in, amount_in)
+    algo_before = manager.pool.algo_reserve
+
+    settle(registry, route, new_wallet(), dex)
+
+    assert fee > 0
+    seed_row = manager.get_account("seed staker").row
+    assert fee - 1 <= manager.ledger.fee_income(seed_row) <= fee
+    if asset_in == ALGO_ASSET_ID:
+        assert manager.pool.algo_reserve == algo_before + amount_in - fee
+    else:
+        assert manager.pool.algo_reserve == algo_before - amount_out - fee
+
+
+def test_dex_pool_hop_is_logged_to_the_state_store(ledger, new_wallet, tmp_path):
+    dex = make_dex(ledger, new_wallet, store=StateStore(str(tmp_path)))
+    registry = dex_core.build_pool_registry(dex.manager)
+    route = registry.best_route(ALGO_ASSET_ID, dex_core.UCTZAR_ASSET_ID, 10 ** 9)
+
+    settle(registry, route, new_wallet(), dex)
+    live = dex.manager.state_image()
+    dex.manager.store.close()
+
+    restored = dex_core.AccountManager(dex_address=dex.address, store=StateStore(str(tmp_path)))
+    assert restored.state_image() == live
+
+
+def test_route_waits_for_the_manager_lock(dex, new_wallet):
+    registry = dex_core.build_pool_registry(dex.manager)
+    route = registry.best_route(ALGO_ASSET_ID, dex_core.UCTZAR_ASSET_ID, 10 ** 9)
+    trader = new_wallet()
+    done = threading.Event()
+    with dex.manager.lock:
+        worker = threading.Thread(target=lambda: (settle(registry, route, trader, dex), done.set()))
+        worker.start()
+        assert not done.wait(0.2)
+    worker.join(10)
+    assert done.is_set()
+
+
+class SlowLock:
+    # Holds on to the lock for a moment after taking it, so two routes interleave their lock taking
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+        time.sleep(0.1)
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def test_opposite_routes_through_the_same_pairs_do_not_deadlock(dex, ledger, new_wallet):
+    # Algo -> UCTZAR -> DEX token and back, through two pairs with their own locks
+    wallets = {}
+    for name in ("algo/uctzar", "uctzar/dex", "trader a", "trader b"):
+        address, phrase = new_wallet()
+        ledger.opt_in(address, dex_core.DEX_TOKEN_ASSET_ID)
+        ledger.holdings[address][dex_core.DEX_TOKEN_ASSET_ID] = 10 ** 12
+        wallets[name] = (address, phrase)
+    registry = PoolRegistry()
+    for name, asset_a, asset_b in (("algo/uctzar", ALGO_ASSET_ID, dex_core.UCTZAR_ASSET_ID), ("uctzar/dex", dex_core.UCTZAR_ASSET_ID, dex_core.DEX_TOKEN_ASSET_ID)):
+        registry.register(asset_a, asset_b, wallets[name][0], lp_token_id=0, state=PoolState(10 ** 9, 10 ** 9), lock=SlowLock())
+    pool_phrases = dict(wallets[name] for name in ("algo/uctzar", "uctzar/dex"))
+    routes = {
+        "trader a": registry.best_route(ALGO_ASSET_ID, dex_core.DEX_TOKEN_ASSET_ID, 10 ** 6),
+        "trader b": registry.best_route(dex_core.DEX_TOKEN_ASSET_ID, ALGO_ASSET_ID, 10 ** 6),
+    }
+    assert [len(route.pairs) for route in routes.values()] == [2, 2]
+    results, errors = {}, []
+
+    def trade(name):
+        try:
+            results[name] = registry.settle_route(
+                routes[name], *wallets[name], pool_phrases, algod_context.get_params_cache(), algod_context.get_algod_client(),
+                algod_context.get_confirmation_watcher(), signer=algod_context.get_signer(),
+            )
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=trade, args=(name,), daemon=True) for name in routes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert errors == []
+    assert all(result["confirmed-round"] > 0 for result in results.values())
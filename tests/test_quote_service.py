@@ -0,0 +1,22 @@
+import pytest
+
+from amm_pool import PoolState
+from quote_service import QuoteService
+
+np = pytest.importorskip("numpy")
+
+
+def test_cached_batches_cannot_be_changed_by_a_caller():
+    service = QuoteService(PoolState(algo_reserve=10 ** 12, uctzar_reserve=2 * 10 ** 6, dex_token_supply=10 ** 12))
+    sizes = np.array([10 ** 6, 10 ** 8])
+    first = service.quote_buy_algo(sizes)
+    with pytest.raises(ValueError):
+        first.amount_in[0] = 0
+    with pytest.raises(ValueError):
+        first.price_impact[:] = 0.0
+
+    # The caller's own array stays writable, and a repeated request still gets the original prices
+    sizes[0] = 1
+    second = service.quote_buy_algo([10 ** 6, 10 ** 8])
+    assert second is first
+    assert second.amount_out[0] == 10 ** 6
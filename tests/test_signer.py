@@ -0,0 +1,95 @@
+import base64
+import time
+
+import pytest
+from algosdk import account, constants, encoding, mnemonic, transaction
+from nacl.signing import VerifyKey
+
+from signer import KeyHandle, Signer, SignerError
+
+SP = transaction.SuggestedParams(fee=1000, first=1, last=1000, gh="SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=", flat_fee=True)
+
+
+def new_account():
+    private_key, address = account.generate_account()
+    return private_key, address, mnemonic.from_private_key(private_key)
+
+
+def payments(sender, count):
+    return [transaction.PaymentTxn(sender=sender, sp=SP, receiver=sender, amt=index) for index in range(count)]
+
+
+def encoded(signed_txns):
+    return [encoding.msgpack_encode(stx) for stx in signed_txns]
+
+
+def test_handle_is_cached_and_expires():
+    _, address, phrase = new_account()
+    signer = Signer(ttl=0.05)
+    handle = signer.handle(phrase)
+    assert isinstance(handle, KeyHandle) and handle.address == address
+    assert signer.handle(phrase) is handle
+    assert signer.handle(handle) is handle
+
+    time.sleep(0.1)
+    with pytest.raises(SignerError, match="expired"):
+        signer.handle(handle)
+    with pytest.raises(SignerError, match="expired"):
+        signer.sign(handle, payments(address, 1)[0])
+    renewed = signer.handle(phrase)
+    assert renewed is not handle and renewed.address == address
+
+
+def test_least_recently_used_key_is_evicted():
+    accounts = [new_account() for _ in range(3)]
+    signer = Signer(max_keys=2)
+    first, second = (signer.handle(phrase) for _, _, phrase in accounts[:2])
+    signer.handle(accounts[0][2])  # the first key is used again, so the second is now the oldest
+    signer.handle(accounts[2][2])
+
+    assert signer.handle(first) is first
+    with pytest.raises(SignerError):
+        signer.handle(second)
+
+
+@pytest.mark.parametrize("pool_threshold, processes", [(512, 0), (2, 2)])
+def test_sign_many_matches_signing_each_transaction(pool_threshold, processes):
+    (key_a, address_a, phrase_a), (key_b, address_b, phrase_b) = new_account(), new_account()
+    txns = payments(address_a, 3) + payments(address_b, 3)
+    signer = Signer(pool_threshold=pool_threshold, processes=processes)
+    try:
+        signed = signer.sign_many(txns, {address_a: phrase_a, address_b: signer.handle(phrase_b)})
+    finally:
+        signer.close()
+
+    expected = [txn.sign(key_a if txn.sender == address_a else key_b) for txn in txns]
+    assert encoded(signed) == encoded(expected)
+
+
+def test_missing_or_unknown_key_raises():
+    _, address, phrase = new_account()
+    _, other_address, _ = new_account()
+    signer = Signer()
+    with pytest.raises(SignerError, match=other_address):
+        signer.sign_many(payments(address, 1) + payments(other_address, 1), {address: phrase})
+    with pytest.raises(SignerError, match="another signer"):
+        signer.sign(Signer().handle(phrase), payments(address, 1)[0])
+    handle = signer.handle(phrase)
+    signer.forget(handle)
+    with pytest.raises(SignerError):
+        signer.sign(handle, payments(address, 1)[0])
+
+
+def test_sign_multisig_signatures_verify():
+    accounts = [new_account() for _ in range(3)]
+    msig = transaction.Multisig(1, 2, [address for _, address, _ in accounts])
+    msig_txn = transaction.MultisigTransaction(payments(msig.address(), 1)[0], msig)
+
+    Signer().sign_multisig(msig_txn, [accounts[0][2], accounts[2][2]])
+
+    message = constants.txid_prefix + base64.b64decode(encoding.msgpack_encode(msig_txn.transaction))
+    signed = [subsig for subsig in msig_txn.multisig.subsigs if subsig.signature]
+    assert len(signed) == 2
+    for subsig in signed:
+        VerifyKey(subsig.public_key).verify(message, subsig.signature)
+    assert msig_txn.multisig.subsigs[1].signature is None
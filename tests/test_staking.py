@@ -0,0 +1,80 @@
+from fractions import Fraction
+
+import dex_core
+from stake_ledger import StakeLedger
+
+
+def test_second_withdrawal_pays_nothing(dex, ledger, new_wallet):
+    staker_address, staker_phrase = new_wallet()
+    manager = dex.manager
+    assert manager.onboard("staker", staker_address, 10 ** 11, staker_phrase, dex.phrase)
+    buyer_address, buyer_phrase = new_wallet()
+    assert manager.buy_algo(10 ** 9, buyer_address, buyer_phrase, dex.phrase) is not None
+
+    assert manager.withdraw_algo("staker", staker_phrase, dex.phrase)
+    dex_algo = ledger.balance(dex.address)
+    dex_uctzar = ledger.balance(dex.address, dex_core.UCTZAR_ASSET_ID)
+
+    assert not manager.withdraw_algo("staker", staker_phrase, dex.phrase)
+    assert ledger.balance(dex.address) == dex_algo
+    assert ledger.balance(dex.address, dex_core.UCTZAR_ASSET_ID) == dex_uctzar
+    account = manager.get_account("staker")
+    assert account["Status"] == "Left"
+    assert account["Contributed Algo"] == 0
+    assert account["DEX tokens"] == 0
+
+
+def test_withdrawals_pay_out_every_fee(dex, new_wallet):
+    # Fees charged on trades end up with the stakers, apart from at most one MicroAlgo of rounding per staker
+    staker_address, staker_phrase = new_wallet()
+    manager = dex.manager
+    assert manager.onboard("staker", staker_address, 3 * 10 ** 11, staker_phrase, dex.phrase)
+    buyer_address, buyer_phrase = new_wallet()
+    fees = 0
+    for _ in range(3):
+        fees += manager.buy_algo(10 ** 9, buyer_address, buyer_phrase, dex.phrase).fee
+        fees += manager.buy_uctzar(10 ** 4, buyer_address, buyer_phrase, dex.phrase).fee
+
+    earned = 0
+    for name, phrase in (("seed staker", dex.staker_phrase), ("staker", staker_phrase)):
+        row = manager.get_account(name).row
+        earned += manager.ledger.fee_income(row)
+        assert manager.withdraw_stake(name, phrase, dex.phrase)
+
+    assert fees - 2 <= earned <= fees
+    assert manager.ledger.total_algo == 0
+    assert manager.pool.dex_token_supply == 0
+
+
+def test_lazy_balances_follow_an_exact_split_of_every_fee():
+    # Baseline: every fee split among the active stakers in exact proportion to their balances at the time
+    ledger = StakeLedger()
+    exact = {}
+    steps = [
+        ("deposit", "a", 3 * 10 ** 6), ("deposit", "b", 4 * 10 ** 6), ("fee", 10 ** 5), ("deposit", "c", 7 * 10 ** 6 + 1),
+        ("fee", 333333), ("deposit", "a", 123457), ("fee", 7), ("deposit", "b", 999999), ("fee", 1), ("fee", 250001),
+    ]
+    for step in steps:
+        if step[0] == "fee":
+            total = sum(exact.values())
+            for name in exact:
+                exact[name] += step[1] * exact[name] / total
+            assert ledger.accrue_fee(step[1])
+        else:
+            _, name, amount = step
+            row = ledger.row_by_name(name)
+            if row is None:
+                ledger.append(name, name, amount, 0, "2024-01-01")
+            else:
+                ledger.deposit(row, amount)
+                ledger.deposited_algo[row] += amount
+            exact[name] = exact.get(name, Fraction(0)) + amount
+
+        for name, value in exact.items():
+            row = ledger.row_by_name(name)
+            assert ledger.balance(row) >= ledger.deposited_algo[row]
+            assert abs(ledger.balance(row) - value) < 2
+    # Settling lazily gives the same balances as settling everybody straight away
+    balances = [ledger.balance(row) for row in range(len(ledger))]
+    ledger.settle_all()
+    assert list(ledger.algo) == balances
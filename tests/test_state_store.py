@@ -0,0 +1,37 @@
+import glob
+import os
+
+import dex_core
+from conftest import make_dex
+from state_store import StateStore
+
+
+def test_restart_after_a_torn_write_restores_the_last_committed_state(ledger, new_wallet, tmp_path):
+    directory = str(tmp_path)
+    dex = make_dex(ledger, new_wallet, store=StateStore(directory, snapshot_every=3))
+    manager = dex.manager
+    staker_address, staker_phrase = new_wallet()
+    assert manager.onboard("staker", staker_address, 10 ** 11, staker_phrase, dex.phrase)
+    trader = new_wallet()
+    for _ in range(3):
+        assert manager.buy_algo(10 ** 9, *trader, dex.phrase) is not None
+        assert manager.buy_uctzar(10 ** 4, *trader, dex.phrase) is not None
+    live = manager.state_image()
+    manager.store.close()
+
+    # A crash in the middle of the next write leaves half a record at the end of the log
+    segment = sorted(glob.glob(os.path.join(directory, "wal-*.log")))[-1]
+    with open(segment, "a", encoding="utf-8") as f:
+        f.write('0badc0de {"seq": 99, "stakers": [')
+
+    restored = dex_core.AccountManager(dex_address=dex.address, store=StateStore(directory, snapshot_every=3))
+    assert restored.state_image() == live
+    assert glob.glob(os.path.join(directory, "snapshot-*.json"))
+
+    # The restored manager keeps logging, and a second restart sees its changes
+    assert restored.withdraw_stake("staker", staker_phrase, dex.phrase)
+    after_withdrawal = restored.state_image()
+    restored.store.close()
+    again = dex_core.AccountManager(dex_address=dex.address, store=StateStore(directory, snapshot_every=3))
+    assert again.state_image() == after_withdrawal
+    again.store.close()